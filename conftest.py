@@ -1,2 +1,7 @@
+import sys
+
 # This file lists files which should be ignored by pytest
 collect_ignore = ["setup.py", "sopel.py", "sopel/modules/ipython.py", "sopel/modules/movie.py"]
+if sys.version_info < (3, 5):
+    # These use async def
+    collect_ignore += ["sopel/backends/asyncio_backend.py", "test/test_coroutines.py"]
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Measure checking senders against large nick and host blocklists.
+
+Usage: ./blocks.py [raw.log] [entries]
+
+Each line of the recorded log has its sender's nick and host checked against
+blocklists of generated entries (300 of each by default), as ``dispatch`` does
+when blocks are configured. The old checks, which loop over the settings and
+call ``re.match`` for each entry, are timed for comparison.
+"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import re
+import sys
+
+import common
+from sopel.bot import _Blocklist
+from sopel.tools import Identifier
+from sopel.trigger import PreTrigger
+
+
+def old_host_blocked(bad_masks, host):
+    for bad_mask in bad_masks:
+        bad_mask = bad_mask.strip()
+        if not bad_mask:
+            continue
+        if (re.match(bad_mask + '$', host, re.IGNORECASE) or
+                bad_mask == host):
+            return True
+    return False
+
+
+def old_nick_blocked(bad_nicks, nick):
+    for bad_nick in bad_nicks:
+        bad_nick = bad_nick.strip()
+        if not bad_nick:
+            continue
+        if (re.match(bad_nick + '$', nick, re.IGNORECASE) or
+                Identifier(bad_nick) == nick):
+            return True
+    return False
+
+
+def main():
+    lines = common.read_log(*sys.argv[1:2])
+    entries = int(sys.argv[2]) if len(sys.argv) > 2 else 300
+    pretriggers = [PreTrigger('Sopel', line) for line in lines]
+    senders = [(p.nick, p.host) for p in pretriggers]
+    nick_blocks = ['spam{}.*'.format(i) for i in range(entries // 2)] + [
+        'troll{}'.format(i) for i in range(entries - entries // 2)]
+    host_blocks = [r'.*\.abuse{}\.example\.net'.format(i)
+                   for i in range(entries)]
+    count = len(senders)
+
+    def old():
+        for nick, host in senders:
+            old_nick_blocked(nick_blocks, nick)
+            old_host_blocked(host_blocks, host)
+
+    nicks = _Blocklist(nick_blocks,
+                       normalize=lambda nick: Identifier(nick).lower())
+    hosts = _Blocklist(host_blocks)
+
+    def new():
+        for nick, host in senders:
+            nicks.matches(nick)
+            hosts.matches(host)
+
+    def new_uncached():
+        for nick, host in senders:
+            nicks._results.clear()
+            hosts._results.clear()
+            nicks.matches(nick)
+            hosts.matches(host)
+
+    for nick, host in senders:
+        assert nicks.matches(nick) == old_nick_blocked(nick_blocks, nick)
+        assert hosts.matches(host) == old_host_blocked(host_blocks, host)
+
+    common.report('blocks, re.match loop (old)', count,
+                  common.best_of(old, repeat=3))
+    common.report('blocks, combined regexp', count,
+                  common.best_of(new_uncached))
+    common.report('blocks, combined regexp + memo', count,
+                  common.best_of(new))
+    common.finish()
+
+
+if __name__ == '__main__':
+    main()
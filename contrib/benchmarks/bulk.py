@@ -0,0 +1,68 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Measure the bulk reads of SopelDB against looping over single reads.
+
+Usage: ./bulk.py [nicks]
+
+A database is filled with a timezone for each of 100,000 nicks by default.
+Looking up the timezones of 5,000 of them with ``get_nick_value`` in a loop,
+as modules did, is compared with one ``get_many`` call, both with the cache
+emptied first. Then every timezone is read with ``iter_nick_values``, and the
+peak memory this takes is compared with fetching all of the rows at once.
+"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import sys
+import tracemalloc
+
+import common
+from sopel.db import SopelDB
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    db = SopelDB(common.make_config())
+    with db.transaction():
+        for i in range(count):
+            db.set_nick_value('Nick{}'.format(i), 'timezone',
+                              'Etc/GMT+{}'.format(i % 12))
+    step = max(1, count // 5000)
+    nicks = ['Nick{}'.format(i) for i in range(0, count, step)]
+
+    def loop():
+        db.clear_cache()
+        for nick in nicks:
+            db.get_nick_value(nick, 'timezone')
+
+    def many():
+        db.clear_cache()
+        db.get_many(nicks, 'timezone')
+
+    common.report('get_nick_value loop', len(nicks), common.best_of(loop),
+                  unit='nicks')
+    common.report('get_many', len(nicks), common.best_of(many), unit='nicks')
+
+    def fetch_all():
+        return db.execute(
+            'SELECT canonical, value FROM nicknames JOIN nick_values '
+            'ON nicknames.nick_id = nick_values.nick_id WHERE key = ?',
+            ['timezone']).fetchall()
+
+    def iterate():
+        for _ in db.iter_nick_values('timezone'):
+            pass
+
+    for name, func in (('fetchall', fetch_all),
+                       ('iter_nick_values', iterate)):
+        common.report(name, count, common.best_of(func, repeat=3),
+                      unit='rows')
+        tracemalloc.start()
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print('  peak memory: {:.1f} MiB'.format(peak / 2 ** 20))
+    common.finish()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Measure the memory used to track the users and channels the bot is in.
+
+Usage: ./channels.py [channels] [users] [users per channel]
+
+Joining 300 channels of 2,000 users each, drawn from 50,000 users, is
+simulated by default, the way coretasks fills in the state from NAMES and
+WHO. ``LegacyUser`` and ``LegacyChannel`` are ``User`` and ``Channel`` as
+they were before they had ``__slots__``, with ``bot.privileges`` as the
+separate dict of dicts it used to be kept in.
+"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import random
+import sys
+import time
+import tracemalloc
+
+import common
+from sopel import module
+from sopel.tools import Identifier
+from sopel.tools.target import Channel, PrivilegesView, User
+
+PRIVILEGES = [0] * 90 + [module.VOICE] * 8 + [module.OP] * 2
+
+
+class LegacyUser(object):
+    def __init__(self, nick, user, host):
+        self.nick = nick
+        self.user = user
+        self.host = host
+        self.channels = {}
+        self.account = None
+        self.away = None
+
+
+class LegacyChannel(object):
+    def __init__(self, name):
+        self.name = name
+        self.users = {}
+        self.privileges = {}
+        self.topic = ''
+
+    def add_user(self, user):
+        self.users[user.nick] = user
+        self.privileges[user.nick] = 0
+        user.channels[self.name] = self
+
+
+def legacy(names):
+    users = {}
+    channels = {}
+    privileges = {}
+    for channel, members in names:
+        privileges[channel] = {}
+        channels[channel] = LegacyChannel(channel)
+        for nick, priv in members:
+            privileges[channel][nick] = priv
+        for nick, priv in members:
+            user = users.get(nick)
+            if user is None:
+                user = users[nick] = LegacyUser(nick, 'user', 'example.com')
+            channels[channel].add_user(user)
+    return users, channels, privileges
+
+
+def compact(names):
+    users = {}
+    channels = {}
+    privileges = PrivilegesView(channels)
+    for channel, members in names:
+        channels[channel] = Channel(channel)
+        for nick, priv in members:
+            channels[channel].privileges[nick] = priv
+        for nick, priv in members:
+            user = users.get(nick)
+            if user is None:
+                user = users[nick] = User(nick, 'user', 'example.com')
+            channels[channel].add_user(user)
+    return users, channels, privileges
+
+
+def main():
+    channel_count = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    user_count = int(sys.argv[2]) if len(sys.argv) > 2 else 50000
+    per_channel = int(sys.argv[3]) if len(sys.argv) > 3 else 2000
+    rng = random.Random(0)
+    nicks = [Identifier('User{}'.format(i)) for i in range(user_count)]
+    names = [(Identifier('#channel{}'.format(i)),
+              [(nick, rng.choice(PRIVILEGES))
+               for nick in rng.sample(nicks, per_channel)])
+             for i in range(channel_count)]
+    count = channel_count * per_channel
+
+    for name, func in (('legacy', legacy), ('slots, one privileges map',
+                                            compact)):
+        start = time.time()
+        func(names)
+        common.report(name, count, time.time() - start, unit='memberships')
+        tracemalloc.start()
+        state = func(names)
+        size = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        del state
+        print('  memory: {:.1f} MiB'.format(size / 2 ** 20))
+    common.finish()
+
+
+if __name__ == '__main__':
+    main()
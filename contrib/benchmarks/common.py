@@ -0,0 +1,97 @@
+# coding=utf-8
+"""Helpers shared by the benchmark scripts in this directory.
+
+The benchmarks are plain scripts, rather than tests, so that they can be run
+against a checkout without installing it. Each one prints the best of several
+timed runs.
+"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                os.pardir, os.pardir))
+
+import sopel.bot  # NOQA
+import sopel.config  # NOQA
+
+SAMPLE_LOG = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                          'sample.log')
+
+
+def make_config(**settings):
+    """Return a Config for a throwaway bot, in a fresh temporary directory."""
+    homedir = tempfile.mkdtemp(prefix='sopel-bench-')
+    filename = os.path.join(homedir, 'bench.cfg')
+    core = {
+        'nick': 'Sopel',
+        'owner': 'Embolalia',
+        'host': '127.0.0.1',
+        'homedir': homedir,
+        'logdir': os.path.join(homedir, 'logs'),
+    }
+    core.update(settings)
+    with io.open(filename, 'w', encoding='utf-8') as f:
+        f.write('[core]\n')
+        for key, value in sorted(core.items()):
+            f.write('{} = {}\n'.format(key, value))
+    return sopel.config.Config(filename)
+
+
+def make_bot(config=None, quiet=True):
+    """Return a Sopel with all of the bundled modules loaded."""
+    config = config or make_config()
+    stderr = sys.stderr
+    if quiet:
+        sys.stderr = open(os.devnull, 'w')
+    try:
+        return sopel.bot.Sopel(config)
+    finally:
+        sys.stderr = stderr
+
+
+def read_log(path=SAMPLE_LOG):
+    """Return the received lines of a raw log.
+
+    ``path`` may either be a ``raw.log`` as written with ``core.log_raw``
+    enabled, in which case only incoming lines are used, or a file with one
+    IRC line per line.
+    """
+    lines = []
+    with io.open(path, encoding='utf-8', errors='replace') as f:
+        for line in f:
+            line = line.rstrip('\r\n')
+            if line.startswith('>>'):
+                continue
+            if line.startswith('<<'):
+                line = line.split('\t', 1)[-1]
+            if line:
+                lines.append(line)
+    return lines
+
+
+def best_of(func, repeat=5):
+    """Call ``func`` ``repeat`` times, and return the shortest duration."""
+    best = None
+    for _ in range(repeat):
+        start = time.time()
+        func()
+        duration = time.time() - start
+        if best is None or duration < best:
+            best = duration
+    return best
+
+
+def report(name, count, seconds, unit='lines'):
+    print('{:<40} {:>10.0f} {}/s  ({:.2f}ms for {})'.format(
+        name, count / seconds, unit, seconds * 1000, count))
+
+
+def finish():
+    """Exit, without waiting on the bot's (non-daemon) scheduler thread."""
+    sys.stdout.flush()
+    os._exit(0)
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Replay a recorded IRC log through Sopel.dispatch.
+
+Usage: ./dispatch.py [raw.log]
+
+All of the bundled modules are loaded, but the callables themselves are not
+run, so that only the cost of finding the callables which match each line (and
+building their triggers) is measured. For comparison, the same log is also
+replayed with a linear scan over every registered rule, which is how dispatch
+used to work.
+"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import sys
+
+import common
+from sopel.trigger import PreTrigger
+
+
+class LinearIndex(object):
+    """Stand-in for the dispatch index which tries every rule in turn."""
+    def __init__(self, callables):
+        self.callables = callables
+
+    def candidates(self, event, text):
+        candidates = []
+        for priority in ('high', 'medium', 'low'):
+            for regexp, funcs in self.callables[priority].items():
+                candidates.append(
+                    (regexp, [func for func in funcs if event in func.event]))
+        return candidates
+
+
+def main():
+    lines = common.read_log(*sys.argv[1:2])
+    bot = common.make_bot(common.make_config(
+        admins='alice,mallory!*@*', nick_blocks='spam.*,troll'))
+    calls = []
+    bot.call = lambda func, sopel, trigger: calls.append(func)
+    for func_list in bot._callables.values():
+        for funcs in func_list.values():
+            for func in funcs:
+                func.thread = False
+    pretriggers = [PreTrigger(bot.nick, line) for line in lines]
+
+    def replay():
+        for pretrigger in pretriggers:
+            # Don't let one run reuse the previous run's per-line data
+            pretrigger._trigger_data = None
+            bot.dispatch(pretrigger)
+
+    bot._dispatch_index = None
+    common.report('dispatch (indexed)', len(lines), common.best_of(replay))
+    indexed_calls = len(calls)
+    del calls[:]
+
+    bot._dispatch_index = LinearIndex(bot._callables)
+    common.report('dispatch (linear scan)', len(lines),
+                  common.best_of(replay))
+    assert len(calls) == indexed_calls, 'Index and scan disagree'
+    common.finish()
+
+
+if __name__ == '__main__':
+    main()
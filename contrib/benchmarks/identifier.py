@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Measure the construction, hashing and comparison of Identifiers.
+
+Usage: ./identifier.py [raw.log]
+
+The nicks and channels in the recorded log are used, in the order they appear
+in it, so that the cache sees a realistic mix of repeated and new names.
+``LegacyIdentifier`` is ``Identifier`` as it was before it was interned.
+"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import sys
+
+import common
+from sopel.tools import Identifier
+from sopel.trigger import parse_line
+
+if sys.version_info.major >= 3:
+    unicode = str
+
+
+class LegacyIdentifier(unicode):
+    def __new__(cls, identifier):
+        s = unicode.__new__(cls, identifier)
+        s._lowered = LegacyIdentifier._lower(identifier)
+        return s
+
+    def lower(self):
+        return self._lowered
+
+    @staticmethod
+    def _lower(identifier):
+        if isinstance(identifier, LegacyIdentifier):
+            return identifier._lowered
+        low = identifier.lower().replace('{', '[').replace('}', ']')
+        low = low.replace('|', '\\').replace('^', '~')
+        return low
+
+    def __hash__(self):
+        return self._lowered.__hash__()
+
+    def __eq__(self, other):
+        if isinstance(other, unicode):
+            other = LegacyIdentifier._lower(other)
+        return unicode.__eq__(self._lowered, other)
+
+    def __ne__(self, other):
+        return not (self == other)
+
+
+def names_from(lines):
+    names = []
+    for line in lines:
+        parsed = parse_line(line)
+        if parsed.hostmask:
+            names.append(parsed.hostmask.split('!', 1)[0])
+        if parsed.params:
+            names.append(parsed.params[0])
+    return names
+
+
+def main():
+    names = names_from(common.read_log(*sys.argv[1:2])) * 20
+    count = len(names)
+    results = {}
+
+    for label, cls in (('old', LegacyIdentifier), ('new', Identifier)):
+        def construct():
+            for name in names:
+                cls(name)
+
+        identifiers = [cls(name) for name in names]
+        lowered = [name.lower() for name in names]
+
+        def hashing():
+            for identifier in identifiers:
+                hash(identifier)
+
+        def compare():
+            for identifier, other in zip(identifiers, lowered):
+                identifier == other
+
+        def lookup():
+            table = {}
+            for identifier in identifiers:
+                table[identifier] = table.get(identifier, 0) + 1
+
+        results[label] = [
+            ('construction', common.best_of(construct)),
+            ('hashing', common.best_of(hashing)),
+            ('comparison with str', common.best_of(compare)),
+            ('dict counting', common.best_of(lookup)),
+        ]
+
+    for label in ('old', 'new'):
+        for name, seconds in results[label]:
+            common.report('Identifier {} ({})'.format(name, label), count,
+                          seconds, unit='ops')
+    common.finish()
+
+
+if __name__ == '__main__':
+    main()
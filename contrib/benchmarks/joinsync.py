@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Measure how long it takes to take in the users of the channels joined.
+
+Usage: ./joinsync.py [channels] [users per channel]
+
+The replies to joining 300 channels of 500 users each (by default), which are
+a JOIN, a NAMES reply and a WHO reply for each channel, are dispatched to the
+bot's core callables. This is compared with the handlers as they were before
+NAMES and WHO replies were collected and applied in one pass, which are
+swapped in for the current ones. Callables are run in the dispatching thread
+either way; the old WHO handlers used to be threaded, so they were also
+subject to the worker queue's overflow policy.
+"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import re
+import sys
+
+import common
+import sopel.module
+from sopel import coretasks, loader
+from sopel.tools import Identifier, events, iteritems
+from sopel.tools.target import Channel, User
+from sopel.trigger import PreTrigger
+
+
+@sopel.module.rule('(.*)')
+@sopel.module.event(events.RPL_NAMREPLY)
+@sopel.module.priority('high')
+def handle_names(bot, trigger):
+    names = trigger.split()
+    channels = re.search(r'(#\S*)', trigger.raw)
+    if not channels:
+        return
+    channel = Identifier(channels.group(1))
+    if channel not in bot.channels:
+        return
+    privileges = bot.channels[channel].privileges
+    mapping = {'+': sopel.module.VOICE,
+               '%': sopel.module.HALFOP,
+               '@': sopel.module.OP,
+               '&': sopel.module.ADMIN,
+               '~': sopel.module.OWNER}
+    for name in names:
+        priv = 0
+        for prefix, value in iteritems(mapping):
+            if prefix in name:
+                priv = priv | value
+        nick = Identifier(name.lstrip(''.join(mapping.keys())))
+        privileges[nick] = priv
+
+
+def _record_who(bot, channel, user, host, nick, account=None, away=None):
+    nick = Identifier(nick)
+    channel = Identifier(channel)
+    if nick not in bot.users:
+        bot.users[nick] = User(nick, user, host)
+    user = bot.users[nick]
+    if account == '0':
+        user.account = None
+    else:
+        user.account = account
+    user.away = away
+    if channel not in bot.channels:
+        bot.channels[channel] = Channel(channel)
+    bot.channels[channel].add_user(user)
+
+
+@sopel.module.event(events.RPL_WHOREPLY)
+@sopel.module.rule('.*')
+@sopel.module.priority('high')
+def recv_who(bot, trigger):
+    channel, user, host, _, nick, = trigger.args[1:6]
+    _record_who(bot, channel, user, host, nick)
+
+
+@sopel.module.event(events.RPL_ENDOFWHO)
+@sopel.module.rule('.*')
+@sopel.module.priority('high')
+def end_who(bot, trigger):
+    pass
+
+
+def make_lines(channel_count, per_channel):
+    lines = []
+    for i in range(channel_count):
+        channel = '#channel{}'.format(i)
+        nicks = ['User{}'.format((i * 37 + j) % 50000)
+                 for j in range(per_channel)]
+        lines.append(':Sopel!sopel@example.com JOIN {}'.format(channel))
+        for start in range(0, per_channel, 40):
+            names = ' '.join(('@' if j % 50 == 0 else '') + nick
+                             for j, nick in enumerate(nicks[start:start + 40]))
+            lines.append(':irc.example.net 353 Sopel = {} :{}'.format(
+                channel, names))
+        lines.append(':irc.example.net 366 Sopel {} :End of /NAMES list.'
+                     .format(channel))
+        for nick in nicks:
+            lines.append(':irc.example.net 352 Sopel {} {} example.com '
+                         'irc.example.net {} H :0 {}'.format(
+                             channel, nick.lower(), nick, nick))
+        lines.append(':irc.example.net 315 Sopel {} :End of /WHO list.'
+                     .format(channel))
+    return lines
+
+
+def use_legacy(bot):
+    legacy = {}
+    for func in (handle_names, recv_who, end_who):
+        loader.clean_callable(func, bot.config)
+        func.thread = False
+        legacy[func.__name__] = func
+    for callables in bot._callables.values():
+        for funcs in callables.values():
+            funcs[:] = [legacy.get(func.__name__, func) for func in funcs
+                        if func is not coretasks.end_names]
+    bot._dispatch_index = None
+
+
+def main():
+    channel_count = int(sys.argv[1]) if len(sys.argv) > 1 else 300
+    per_channel = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    bot = common.make_bot()
+    bot.write = lambda args, text=None: None
+    lines = make_lines(channel_count, per_channel)
+    pretriggers = [PreTrigger(bot.nick, line) for line in lines]
+
+    def replay():
+        bot.channels.clear()
+        bot.users.clear()
+        bot.memory['channel_sync'] = coretasks._ChannelSync()
+        for pretrigger in pretriggers:
+            pretrigger._trigger_data = None
+            bot.dispatch(pretrigger)
+        assert len(bot.channels) == channel_count
+
+    common.report('join sync (collected)', len(lines),
+                  common.best_of(replay, repeat=3))
+    use_legacy(bot)
+    common.report('join sync (line by line)', len(lines),
+                  common.best_of(replay, repeat=3))
+    common.finish()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Measure the schema migrations on a large database, and what they buy.
+
+Usage: ./migrate.py [nicks] [keys per nick]
+
+A database is filled the way Sopel used to create it (``STRING`` columns, no
+schema version) with ``nicks * keys`` nick values, 2,000,000 by default. It's
+then opened with ``SopelDB``, which migrates it, and the time taken is
+reported. A query across every nick for one key is timed before and after,
+and, if msgpack is installed, the encodings are compared on the values used.
+"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import json
+import os
+import sqlite3
+import sys
+import time
+
+import common
+from sopel.db import SopelDB, _deserialize
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+SAMPLE_VALUES = [
+    1546300800.123, '#sopel', 'Europe/Paris', True, 'Hello, world!',
+    ['foo', 'bar'], {'lat': 48.85, 'lon': 2.35}, 42,
+]
+
+
+def build_legacy(filename, nicks, keys):
+    conn = sqlite3.connect(filename)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('CREATE TABLE nick_ids '
+                 '(nick_id INTEGER PRIMARY KEY AUTOINCREMENT)')
+    conn.execute('CREATE TABLE nicknames (nick_id INTEGER REFERENCES '
+                 'nick_ids, slug STRING PRIMARY KEY, canonical string)')
+    conn.execute('CREATE TABLE nick_values (nick_id INTEGER REFERENCES '
+                 'nick_ids(nick_id), key STRING, value STRING, '
+                 'PRIMARY KEY (nick_id, key))')
+    conn.execute('CREATE TABLE channel_values (channel STRING, key STRING, '
+                 'value STRING, PRIMARY KEY (channel, key))')
+    conn.executemany('INSERT INTO nick_ids VALUES (?)',
+                     ((i,) for i in range(1, nicks + 1)))
+    conn.executemany('INSERT INTO nicknames VALUES (?, ?, ?)',
+                     ((i, 'nick{}'.format(i), 'Nick{}'.format(i))
+                      for i in range(1, nicks + 1)))
+    values = [json.dumps(value) for value in SAMPLE_VALUES]
+    conn.executemany(
+        'INSERT INTO nick_values VALUES (?, ?, ?)',
+        ((i, 'key{}'.format(k), values[(i + k) % len(values)])
+         for i in range(1, nicks + 1) for k in range(keys)))
+    conn.commit()
+    conn.close()
+
+
+def scan(filename):
+    conn = sqlite3.connect(filename)
+    start = time.time()
+    for k in range(5):
+        conn.execute('SELECT COUNT(*) FROM nick_values WHERE key = ?',
+                     ['key{}'.format(k)]).fetchone()
+    seconds = time.time() - start
+    conn.close()
+    return seconds
+
+
+def compare_encodings():
+    count = len(SAMPLE_VALUES) * 10000
+    values = SAMPLE_VALUES * 10000
+    as_json = [json.dumps(value, ensure_ascii=False) for value in values]
+    as_msgpack = [sqlite3.Binary(msgpack.packb(value, use_bin_type=True))
+                  for value in values]
+    print('Encoded size: json {} bytes, msgpack {} bytes'.format(
+        sum(len(value.encode('utf-8')) for value in as_json),
+        sum(len(value) for value in as_msgpack)))
+
+    def decode(encoded):
+        def run():
+            for value in encoded:
+                _deserialize(value)
+        return run
+    common.report('decode, json', count, common.best_of(decode(as_json)),
+                  unit='values')
+    common.report('decode, msgpack', count,
+                  common.best_of(decode(as_msgpack)), unit='values')
+
+
+def main():
+    nicks = int(sys.argv[1]) if len(sys.argv) > 1 else 200000
+    keys = int(sys.argv[2]) if len(sys.argv) > 2 else 10
+    count = nicks * keys
+    config = common.make_config()
+    filename = os.path.join(os.path.dirname(config.filename), 'bench.db')
+    build_legacy(filename, nicks, keys)
+
+    common.report('key scan, before', 5, scan(filename), unit='queries')
+    start = time.time()
+    db = SopelDB(config)
+    seconds = time.time() - start
+    db.close()
+    common.report('migration', count, seconds, unit='rows')
+    common.report('key scan, after', 5, scan(filename), unit='queries')
+    if msgpack is not None:
+        compare_encodings()
+    common.finish()
+
+
+if __name__ == '__main__':
+    main()
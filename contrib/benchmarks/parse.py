@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Check and measure the line parser against the one it replaced.
+
+Usage: ./parse.py [raw.log] [fuzzed lines]
+
+Every recorded line is parsed by both ``PreTrigger`` and ``LegacyPreTrigger``
+(a copy of ``PreTrigger`` as it was before ``parse_line``), and any difference
+is reported. The recorded lines are then mutated at random, adding message
+tags, escapes, CTCP and stray spaces, and the two parsers are compared again
+on those. Where the old parser was wrong (it didn't unescape tag values, and
+took each extra space for an empty parameter) the comparison allows for it.
+"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import datetime
+import random
+import re
+import sys
+
+import common
+from sopel.irc import parse_line
+from sopel.tools import Identifier
+from sopel.trigger import PreTrigger, unescape_tag_value
+
+
+class LegacyPreTrigger(object):
+    component_regex = re.compile(r'([^!]*)!?([^@]*)@?(.*)')
+    intent_regex = re.compile('\x01(\\S+) ?(.*)\x01')
+
+    def __init__(self, own_nick, line):
+        line = line.strip('\r')
+        self.line = line
+
+        self.tags = {}
+        if line.startswith('@'):
+            tagstring, line = line.split(' ', 1)
+            for tag in tagstring[1:].split(';'):
+                tag = tag.split('=', 1)
+                if len(tag) > 1:
+                    self.tags[tag[0]] = tag[1]
+                else:
+                    self.tags[tag[0]] = None
+
+        self.time = datetime.datetime.utcnow()
+        if 'time' in self.tags:
+            try:
+                self.time = datetime.datetime.strptime(self.tags['time'], '%Y-%m-%dT%H:%M:%S.%fZ')
+            except ValueError:
+                pass
+
+        if line.startswith(':'):
+            self.hostmask, line = line[1:].split(' ', 1)
+        else:
+            self.hostmask = None
+
+        if ' :' in line:
+            argstr, text = line.split(' :', 1)
+            self.args = argstr.split(' ')
+            self.args.append(text)
+        else:
+            self.args = line.split(' ')
+            self.text = self.args[-1]
+
+        self.event = self.args[0]
+        self.args = self.args[1:]
+        components = LegacyPreTrigger.component_regex.match(self.hostmask or '').groups()
+        self.nick, self.user, self.host = components
+        self.nick = Identifier(self.nick)
+
+        if self.args and self.event != 'QUIT':
+            target = Identifier(self.args[0])
+        else:
+            target = None
+
+        if target and target.lower() == own_nick.lower():
+            target = self.nick
+        self.sender = target
+
+        if self.event == 'PRIVMSG' or self.event == 'NOTICE':
+            intent_match = LegacyPreTrigger.intent_regex.match(self.args[-1])
+            if intent_match:
+                intent, message = intent_match.groups()
+                self.tags['intent'] = intent
+                self.args[-1] = message or ''
+
+        if self.event == 'JOIN' and len(self.args) == 3:
+            self.tags['account'] = self.args[1]
+
+
+FIELDS = ('hostmask', 'event', 'args', 'nick', 'user', 'host', 'sender',
+          'tags')
+
+
+def expected(line):
+    """What the new parser should make of ``line``, going by the old one."""
+    head, sep, tail = line.partition(' :')
+    if '  ' in head or head.endswith(' '):
+        # Legacy took every extra space for an empty parameter
+        line = ' '.join(part for part in head.split(' ') if part) + sep + tail
+    legacy = LegacyPreTrigger('Sopel', line)
+    values = dict((field, getattr(legacy, field)) for field in FIELDS)
+    values['tags'] = dict(
+        (key, unescape_tag_value(value) if value is not None else None)
+        for key, value in values['tags'].items() if key)
+    return values
+
+
+def compare(lines):
+    mismatches = 0
+    for line in lines:
+        try:
+            want = expected(line)
+        except (ValueError, IndexError):
+            # The old parser crashed on this; the new one mustn't
+            PreTrigger('Sopel', line).tags
+            continue
+        got = PreTrigger('Sopel', line)
+        for field in FIELDS:
+            if getattr(got, field) != want[field]:
+                mismatches += 1
+                print('Mismatch in {}: {!r}\n  old: {!r}\n  new: {!r}'.format(
+                    field, line, want[field], getattr(got, field)))
+                break
+    return mismatches
+
+
+def fuzz(lines, count, seed=0):
+    rand = random.Random(seed)
+    pieces = ['\\s', '\\:', '\\\\', '\\n', '\\', 'x', ';', '=', 'é']
+    fuzzed = []
+    for _ in range(count):
+        line = rand.choice(lines)
+        choice = rand.random()
+        if choice < 0.4:
+            tags = ';'.join(
+                'k{}={}'.format(i, ''.join(rand.choice(pieces)
+                                           for _ in range(rand.randint(0, 5))))
+                for i in range(rand.randint(1, 4)))
+            line = '@{};time=2018-11-01T00:00:0{}.{}Z {}'.format(
+                tags, rand.randint(0, 9), rand.randint(0, 999), line)
+        elif choice < 0.6:
+            head, sep, tail = line.partition(' :')
+            line = head.replace(' ', '  ') + sep + tail
+        elif choice < 0.8 and ' :' in line:
+            head, _, tail = line.partition(' :')
+            line = '{} :\x01{} {}\x01'.format(head, 'ACTION', tail)
+        else:
+            cut = rand.randint(1, len(line))
+            line = line[:cut]
+        fuzzed.append(line)
+    return fuzzed
+
+
+def main():
+    lines = common.read_log(*sys.argv[1:2])
+    fuzz_count = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    mismatches = compare(lines)
+    print('{} recorded lines, {} mismatches'.format(len(lines), mismatches))
+    fuzzed = fuzz(lines, fuzz_count)
+    fuzz_mismatches = compare(fuzzed)
+    print('{} fuzzed lines, {} mismatches'.format(fuzz_count, fuzz_mismatches))
+
+    count = len(lines)
+    tagged = ['@time=2018-11-01T00:00:00.000Z;account=alice ' + line
+              for line in lines]
+
+    def old():
+        for line in lines:
+            LegacyPreTrigger('Sopel', line)
+
+    def new():
+        for line in lines:
+            PreTrigger('Sopel', line)
+
+    def bare():
+        for line in lines:
+            parse_line(line)
+
+    def old_tagged():
+        for line in tagged:
+            LegacyPreTrigger('Sopel', line)
+
+    def new_tagged():
+        for line in tagged:
+            PreTrigger('Sopel', line)
+
+    common.report('PreTrigger (old)', count, common.best_of(old))
+    common.report('PreTrigger', count, common.best_of(new))
+    common.report('parse_line', count, common.best_of(bare))
+    common.report('PreTrigger with tags (old)', count,
+                  common.best_of(old_tagged))
+    common.report('PreTrigger with tags', count, common.best_of(new_tagged))
+    if mismatches or fuzz_mismatches:
+        sys.exit(1)
+    common.finish()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Measure each step of the receive path: framing, decoding and parsing.
+
+Usage: ./receive.py [raw.log]
+
+The recorded log is followed by a NAMES burst for a channel of 5000 users, and
+the whole thing is fed in 4KiB chunks, as it would come off the socket. The
+framing is measured both with the old asynchat approach (decode each chunk,
+then build up the line with ``+=``) and with ``LineBuffer``.
+"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import asynchat
+import sys
+
+import common
+from sopel.backends import AbstractBackend, LineBuffer
+from sopel.trigger import PreTrigger
+
+CHUNK_SIZE = 4096
+
+
+class OldReceiver(asynchat.async_chat):
+    """The receiving half of the asynchat backend, as it used to be."""
+    def __init__(self, chunks):
+        asynchat.async_chat.__init__(self)
+        self.set_terminator(b'\n')
+        self.buffer = ''
+        self.chunks = iter(chunks)
+        self.lines = []
+
+    def recv(self, buffer_size):
+        return next(self.chunks)
+
+    def collect_incoming_data(self, data):
+        # We can't trust clients to pass valid unicode.
+        try:
+            data = str(data, encoding='utf-8')
+        except UnicodeDecodeError:
+            # not unicode, let's try cp1252
+            try:
+                data = str(data, encoding='cp1252')
+            except UnicodeDecodeError:
+                # Okay, let's try ISO8859-1
+                try:
+                    data = str(data, encoding='iso8859-1')
+                except UnicodeDecodeError:
+                    # Discard line if encoding is unknown
+                    return
+        self.buffer += data
+
+    def found_terminator(self):
+        line = self.buffer
+        if line.endswith('\r'):
+            line = line[:-1]
+        self.buffer = ''
+        self.lines.append(line)
+
+
+class StubBot(object):
+    def __init__(self, config):
+        self.config = config
+
+
+def names_burst(users=5000):
+    lines = []
+    nicks = ['user{}'.format(i) for i in range(users)]
+    for i in range(0, users, 50):
+        lines.append(':irc.example.net 353 Sopel = #big :' +
+                     ' '.join(nicks[i:i + 50]))
+    lines.append(':irc.example.net 366 Sopel #big :End of /NAMES list.')
+    return lines
+
+
+def main():
+    lines = common.read_log(*sys.argv[1:2]) + names_burst()
+    data = ''.join(line + '\r\n' for line in lines).encode('utf-8')
+    chunks = [data[i:i + CHUNK_SIZE] for i in range(0, len(data), CHUNK_SIZE)]
+    backend = AbstractBackend(StubBot(common.make_config()))
+    count = len(lines)
+
+    def old_framing():
+        receiver = OldReceiver(chunks)
+        for _ in chunks:
+            receiver.handle_read()
+        assert len(receiver.lines) == count
+
+    def new_framing():
+        buffer = LineBuffer(backend.decode)
+        framed = 0
+        for chunk in chunks:
+            framed += len(buffer.feed(chunk))
+        assert framed == count
+
+    encoded = [line.encode('utf-8') for line in lines]
+    latin1 = [line.encode('utf-8') + b' \xe9' for line in lines]
+
+    def decode_utf8():
+        for line in encoded:
+            backend.decode(line)
+
+    def decode_fallback():
+        for line in latin1:
+            backend.decode(line)
+
+    def parse():
+        for line in lines:
+            PreTrigger('Sopel', line)
+
+    common.report('framing + decoding, asynchat (old)', count,
+                  common.best_of(old_framing))
+    common.report('framing + decoding, LineBuffer', count,
+                  common.best_of(new_framing))
+    common.report('decoding, UTF-8', count, common.best_of(decode_utf8))
+    common.report('decoding, cp1252 fallback', count,
+                  common.best_of(decode_fallback))
+    common.report('parsing, PreTrigger', count, common.best_of(parse))
+    common.finish()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Measure how the job scheduler copes with many jobs.
+
+Usage: ./scheduler.py [jobs]
+
+10000 jobs (by default) with intervals spread over a second are added to a
+scheduler, which runs them in its own thread for a few seconds. Each job
+records how late it was called. This is compared with the scheduler as it
+was before it kept its jobs in a heap, which deep-copied the queue's head
+each time it looked at it. The jobs are called in the scheduler's thread
+either way. Last, a job due in 10ms is added to a scheduler waiting on one
+due in an hour, to time how long it takes to be noticed.
+"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import sys
+import threading
+import time
+
+import common
+from sopel.tools.jobs import (
+    Job, JobScheduler, PriorityQueue, is_coroutine_function, released)
+
+
+class LegacyJobScheduler(threading.Thread):
+    min_reaction_time = 30.0
+
+    def __init__(self, bot):
+        threading.Thread.__init__(self)
+        self.bot = bot
+        self._jobs = PriorityQueue()
+        self._mutex = threading.Lock()
+        self._cleared = False
+
+    def add_job(self, job):
+        self._jobs.put(job)
+
+    def run(self):
+        while True:
+            self._do_next_job()
+
+    def _do_next_job(self):
+        with self._mutex:
+            while True:
+                job = self._jobs.peek()
+                difference = job.next_time - time.time()
+                duration = min(difference, self.min_reaction_time)
+                if duration <= 0:
+                    break
+                with released(self._mutex):
+                    time.sleep(duration)
+
+            self._cleared = False
+            job = self._jobs.get()
+            with released(self._mutex):
+                if job.func.thread and not is_coroutine_function(job.func):
+                    self.bot.workers.submit(self._call, (job.func,))
+                else:
+                    self._call(job.func)
+                job.next()
+            if not self._cleared:
+                self._jobs.put(job)
+
+    def _call(self, func):
+        func(self.bot)
+
+
+class MockBot(object):
+    def error(self):
+        raise
+
+
+class Lateness(object):
+    """A job which records how late each of its calls is."""
+
+    thread = False
+
+    def __init__(self, delays):
+        self.delays = delays
+        self.job = None
+
+    def __call__(self, bot):
+        self.delays.append(time.time() - self.job.next_time)
+
+
+def run_jobs(scheduler_class, count, duration=3.0):
+    scheduler = scheduler_class(MockBot())
+    scheduler.daemon = True
+    delays = []
+    start = time.time()
+    for i in range(count):
+        func = Lateness(delays)
+        func.job = Job(0.5 + i / count, func)
+        scheduler.add_job(func.job)
+    added = time.time() - start
+    scheduler.start()
+    time.sleep(duration)
+    calls = list(delays)
+    calls.sort()
+    return added, calls
+
+
+def wakeup(scheduler_class, timeout=35.0):
+    scheduler = scheduler_class(MockBot())
+    scheduler.daemon = True
+    called = threading.Event()
+
+    def func(bot):
+        called.set()
+
+    func.thread = False
+    scheduler.add_job(Job(3600, func))
+    scheduler.start()
+    time.sleep(0.1)
+    start = time.time()
+    scheduler.add_job(Job(0.01, func))
+    called.wait(timeout)
+    return time.time() - start
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    for name, scheduler_class in (('heap', JobScheduler),
+                                  ('legacy', LegacyJobScheduler)):
+        added, delays = run_jobs(scheduler_class, count)
+        common.report('add jobs ({})'.format(name), count, added, 'jobs')
+        print('{:<40} {:>10} calls, late by {:.1f}ms mean, {:.1f}ms p99'
+              .format('run jobs ({})'.format(name), len(delays),
+                      sum(delays) / len(delays) * 1000,
+                      delays[int(len(delays) * 0.99)] * 1000))
+        print('{:<40} {:>10.3f}s'.format(
+            'earlier job noticed ({})'.format(name), wakeup(scheduler_class)))
+    common.finish()
+
+
+if __name__ == '__main__':
+    main()
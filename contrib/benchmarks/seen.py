@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Measure the database writes which seen.py makes for each channel message.
+
+Usage: ./seen.py [raw.log]
+
+Each PRIVMSG to a channel in the recorded log is passed to ``seen.note``, with
+the value cache in ``write-through`` and ``write-behind`` mode. For
+comparison, the same four values are also written the way they used to be:
+with ``set_nick_value`` once per key, on ``LegacySopelDB``, which opens a new
+connection for every query and has no cache, as ``SopelDB`` did before.
+
+Reading a value for each message's sender (as the clock module does for its
+timezone) is measured with and without the cache too.
+"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import json
+import re
+import sqlite3
+import sys
+import time
+
+import common
+from sopel.db import SopelDB, _deserialize
+from sopel.modules import seen
+from sopel.trigger import PreTrigger, Trigger
+
+
+class LegacySopelDB(SopelDB):
+    def execute(self, *args, **kwargs):
+        with self.connect() as conn:
+            cur = conn.cursor()
+            return cur.execute(*args, **kwargs)
+
+    def get_nick_id(self, nick, create=True):
+        slug = nick.lower()
+        nick_id = self.execute('SELECT nick_id from nicknames where slug = ?',
+                               [slug]).fetchone()
+        if nick_id is None:
+            with self.connect() as conn:
+                cur = conn.cursor()
+                cur.execute('INSERT INTO nick_ids VALUES (NULL)')
+                nick_id = cur.execute('SELECT last_insert_rowid()').fetchone()[0]
+                cur.execute(
+                    'INSERT INTO nicknames (nick_id, slug, canonical) VALUES '
+                    '(?, ?, ?)',
+                    [nick_id, slug, nick]
+                )
+            nick_id = self.execute('SELECT nick_id from nicknames where slug = ?',
+                                   [slug]).fetchone()
+        return nick_id[0]
+
+    def set_nick_value(self, nick, key, value):
+        value = json.dumps(value, ensure_ascii=False)
+        nick_id = self.get_nick_id(nick)
+        self.execute('INSERT OR REPLACE INTO nick_values VALUES (?, ?, ?)',
+                     [nick_id, key, value])
+
+    def get_nick_value(self, nick, key):
+        result = self.execute(
+            'SELECT value FROM nicknames JOIN nick_values '
+            'ON nicknames.nick_id = nick_values.nick_id '
+            'WHERE slug = ? AND key = ?',
+            [nick.lower(), key]
+        ).fetchone()
+        if result is not None:
+            result = result[0]
+        return _deserialize(result)
+
+
+class StubBot(object):
+    def __init__(self, db):
+        self.db = db
+
+
+def main():
+    config = common.make_config()
+    match = re.match('.*', '')
+    triggers = []
+    for line in common.read_log(*sys.argv[1:2]):
+        pretrigger = PreTrigger('Sopel', line)
+        if pretrigger.event == 'PRIVMSG' and not pretrigger.sender.is_nick():
+            triggers.append(Trigger(config, pretrigger, match))
+    count = len(triggers)
+
+    def old():
+        db = LegacySopelDB(config)
+        for trigger in triggers:
+            db.set_nick_value(trigger.nick, 'seen_timestamp', time.time())
+            db.set_nick_value(trigger.nick, 'seen_channel', trigger.sender)
+            db.set_nick_value(trigger.nick, 'seen_message', trigger)
+            db.set_nick_value(trigger.nick, 'seen_action',
+                              'intent' in trigger.tags)
+
+    def new():
+        db = SopelDB(config)
+        bot = StubBot(db)
+        for trigger in triggers:
+            seen.note(bot, trigger)
+        db.close()
+
+    behind_config = common.make_config(db_cache_mode='write-behind')
+
+    def behind():
+        db = SopelDB(behind_config)
+        bot = StubBot(db)
+        for trigger in triggers:
+            seen.note(bot, trigger)
+        db.close()
+
+    def reads(db):
+        def read():
+            for trigger in triggers:
+                db.get_nick_value(trigger.nick, 'timezone')
+        return read
+
+    # Switch the file out of WAL mode, which the old code never used
+    db = SopelDB(config)
+    db.close()
+    conn = sqlite3.connect(db.filename)
+    conn.execute('PRAGMA journal_mode=DELETE')
+    conn.close()
+    common.report('seen.note, connection per query (old)', count,
+                  common.best_of(old, repeat=3), unit='messages')
+    common.report('seen.note, set_nick_values', count,
+                  common.best_of(new, repeat=3), unit='messages')
+    common.report('seen.note, write-behind', count,
+                  common.best_of(behind, repeat=3), unit='messages')
+
+    old_db = LegacySopelDB(config)
+    new_db = SopelDB(config)
+    for trigger in triggers[::2]:
+        new_db.set_nick_value(trigger.nick, 'timezone', 'Europe/Paris')
+    common.report('get_nick_value, connection per query (old)', count,
+                  common.best_of(reads(old_db), repeat=3), unit='messages')
+    common.report('get_nick_value, cached', count,
+                  common.best_of(reads(new_db), repeat=3), unit='messages')
+    common.finish()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# coding=utf-8
+"""Measure how fast the bot can send lines to a local fake IRCd.
+
+Usage: ./write.py [asynchat|asyncio] [lines]
+
+Flood protection is turned off, so that only the cost of getting the lines
+out of ``Bot.write`` and onto the socket is measured. Each run is made with the
+lines coalesced into one write per batch, as they are normally, and again with
+one write per line.
+"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import os
+import socket
+import sys
+import threading
+import time
+
+import common
+from sopel import backends, irc
+
+
+class FakeIRCd(object):
+    """Accepts one connection, and counts the lines received on it."""
+    def __init__(self):
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.bind(('127.0.0.1', 0))
+        self.listener.listen(1)
+        self.port = self.listener.getsockname()[1]
+        self.lines = 0
+        self.registered = threading.Event()
+        self.done = threading.Event()
+        self.expected = None
+        thread = threading.Thread(target=self.serve)
+        thread.daemon = True
+        thread.start()
+
+    def serve(self):
+        conn, _ = self.listener.accept()
+        self.listener.close()
+        self.conn = conn
+        while True:
+            data = conn.recv(65536)
+            if not data:
+                break
+            if not self.registered.is_set() and b'USER ' in data:
+                self.registered.set()
+                continue
+            self.lines += data.count(b'\n')
+            if self.expected is not None and self.lines >= self.expected:
+                self.done.set()
+        conn.close()
+
+    def close(self):
+        self.conn.shutdown(socket.SHUT_RDWR)
+
+
+def send_lines(backend, count, batch_size):
+    config = common.make_config(backend=backend, flood_burst_lines=count,
+                                flood_refill_rate=10 ** 9, timeout=600)
+    bot = irc.Bot(config)
+    bot.outbound.batch_size = batch_size
+    server = FakeIRCd()
+    server.expected = count
+    thread = threading.Thread(target=bot.run, args=('127.0.0.1', server.port))
+    thread.daemon = True
+    thread.start()
+    assert server.registered.wait(10), 'The bot did not connect'
+
+    text = 'x' * 400
+    start = time.time()
+    for i in range(count):
+        bot.write(('PRIVMSG', '#channel{}'.format(i % 10)), text)
+    assert server.done.wait(60), 'Not all lines arrived'
+    duration = time.time() - start
+    server.close()
+    thread.join(10)
+    return duration
+
+
+def main():
+    names = sys.argv[1:2] or backends.available_backends()
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 20000
+    stderr = sys.stderr
+    sys.stderr = open(os.devnull, 'w')
+    try:
+        for name in names:
+            for label, batch_size in (('coalesced', 50), ('per line', 1)):
+                duration = min(send_lines(name, count, batch_size)
+                               for _ in range(3))
+                common.report('write, {} ({})'.format(name, label), count,
+                              duration)
+    finally:
+        sys.stderr = stderr
+    common.finish()
+
+
+if __name__ == '__main__':
+    main()
@@ -49,7 +49,7 @@ setup(
     ),
     # Distutils is shit, and doesn't check if it's a list of basestring
     # but instead requires str.
-    packages=[str('sopel'), str('sopel.modules'),
+    packages=[str('sopel'), str('sopel.modules'), str('sopel.backends'),
               str('sopel.config'), str('sopel.tools')],
     license='Eiffel Forum License, version 2',
     platforms='Linux x86, x86-64',
@@ -0,0 +1,190 @@
+# coding=utf-8
+"""Transports which carry the bot's connection to the IRC server.
+
+A backend owns the socket: it connects, frames incoming data into lines and
+sends outgoing data. Everything that has to do with the IRC protocol itself
+stays in :class:`sopel.irc.Bot`, which the backend calls back into with
+``on_connect()``, ``on_message(line)`` and ``on_close()``.
+
+Which backend is used is chosen with the ``backend`` setting of the ``[core]``
+config section.
+"""
+# Licensed under the Eiffel Forum License 2.
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import codecs
+import sys
+
+from sopel.logger import get_logger
+
+if sys.version_info.major >= 3:
+    unicode = str
+    py3 = True
+else:
+    py3 = False
+
+LOGGER = get_logger(__name__)
+
+BACKENDS = ('asynchat', 'asyncio')
+"""The names of the known backends, for use in the ``backend`` setting."""
+
+
+def _has_module(name):
+    try:
+        __import__(name)
+    except (ImportError, SyntaxError):
+        return False
+    return True
+
+
+def available_backends():
+    """Return the names of the backends which work on this Python."""
+    available = []
+    if _has_module('asynchat'):
+        available.append('asynchat')
+    if sys.version_info >= (3, 5):
+        available.append('asyncio')
+    return available
+
+
+def default_backend():
+    """Return the name of the backend to use when none is configured.
+
+    The ``asynchat`` backend is kept wherever it still exists, since that is
+    what Sopel has always used; ``asyncio`` is used on Python versions which
+    have dropped ``asynchat`` (3.12 and later).
+    """
+    available = available_backends()
+    return available[0] if available else 'asynchat'
+
+
+def get_backend(name):
+    """Return the backend class called ``name``.
+
+    :raises ValueError: if there is no such backend, or it can't be used on
+        this version of Python
+    """
+    if name not in BACKENDS:
+        raise ValueError('Unknown backend: %s' % name)
+    if name not in available_backends():
+        raise ValueError('The %s backend is not available on Python %s' %
+                         (name, sys.version.split()[0]))
+    if name == 'asyncio':
+        from sopel.backends.asyncio_backend import AsyncioBackend
+        return AsyncioBackend
+    from sopel.backends.asynchat_backend import AsynchatBackend
+    return AsynchatBackend
+
+
+class AbstractBackend(object):
+    """The interface :class:`sopel.irc.Bot` expects of its transport.
+
+    ``send`` may be called from any thread, and so may ``disconnect`` and
+    ``close_when_done``; everything else is only called from the thread which
+    called ``run``.
+    """
+    def __init__(self, bot):
+        self.bot = bot
+        self.config = bot.config
+        self.encodings = ['utf-8'] + [
+            encoding for encoding in self.config.core.encoding_fallbacks
+            if encoding.lower() not in ('utf-8', 'utf8')]
+        """The encodings to try, in order, on each line received."""
+        for encoding in self.encodings:
+            # Fail now, rather than on the first line which isn't UTF-8
+            codecs.lookup(encoding)
+
+    def run(self, host, port):
+        """Connect to ``host`` and handle the connection until it's closed."""
+        raise NotImplementedError
+
+    def is_connected(self):
+        """Whether the connection is up, and data can be sent."""
+        raise NotImplementedError
+
+    def send(self, data):
+        """Send ``data``, a ``bytes`` object, to the server."""
+        raise NotImplementedError
+
+    def disconnect(self):
+        """Close the connection now, discarding anything not yet sent."""
+        raise NotImplementedError
+
+    def close_when_done(self):
+        """Close the connection once everything queued has been sent."""
+        raise NotImplementedError
+
+    def decode(self, data):
+        """Decode data received from the server into text.
+
+        We can't trust clients to pass valid unicode, so this falls back to
+        the encodings in the ``encoding_fallbacks`` setting, in order. ``None``
+        is returned if none of them work.
+        """
+        for encoding in self.encodings:
+            try:
+                return unicode(data, encoding=encoding)
+            except UnicodeDecodeError:
+                pass
+        return None
+
+
+class LineBuffer(object):
+    """Frames the data received from the server into lines.
+
+    Incoming data is appended to a ``bytearray``, and each complete line is
+    cut out of it through a ``memoryview`` and passed to ``decode`` exactly
+    once. Only the newly received data is searched for line endings.
+
+    A partial line longer than ``max_length`` bytes is discarded, along with
+    the rest of that line when it arrives.
+    """
+    def __init__(self, decode, max_length=2 ** 16):
+        self.decode = decode
+        self.max_length = max_length
+        self._buffer = bytearray()
+        self._discarding = False
+
+    def __len__(self):
+        return len(self._buffer)
+
+    def pending(self):
+        """Return the partial line waiting for its end, as text."""
+        return bytes(self._buffer).decode('utf-8', 'replace')
+
+    def feed(self, data):
+        """Add ``data``, and return a list of the lines it completed.
+
+        The lines are decoded, and their trailing ``\\n`` is removed. Lines
+        which can't be decoded are left out.
+        """
+        buffer = self._buffer
+        start = len(buffer)
+        buffer += data
+        end = buffer.find(b'\n', start)
+        if end == -1:
+            if len(buffer) > self.max_length:
+                if not self._discarding:
+                    LOGGER.warning('Discarding a line longer than %d bytes',
+                                   self.max_length)
+                self._discarding = True
+                del buffer[:]
+            return []
+
+        lines = []
+        begin = 0
+        # Python 2 can't decode a memoryview, but can a bytearray slice
+        view = memoryview(buffer) if py3 else buffer
+        while end != -1:
+            if self._discarding:
+                self._discarding = False
+            else:
+                line = self.decode(view[begin:end])
+                if line is not None:
+                    lines.append(line)
+            begin = end + 1
+            end = buffer.find(b'\n', begin)
+        # The buffer can't be resized while a view of it exists
+        del view
+        del buffer[:begin]
+        return lines
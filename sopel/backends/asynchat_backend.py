@@ -0,0 +1,259 @@
+# coding=utf-8
+"""The asyncore/asynchat backend, which Sopel has always used.
+
+``asyncore`` and ``asynchat`` were removed from the standard library in Python
+3.12; use the ``asyncio`` backend there.
+"""
+# Copyright 2008, Sean B. Palmer, inamidst.com
+# Copyright 2012, Elsie Powell, http://embolalia.com
+# Copyright © 2012, Elad Alfassa <elad@fedoraproject.org>
+#
+# Licensed under the Eiffel Forum License 2.
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import asynchat
+import asyncore
+import errno
+import os
+import select
+import socket
+import threading
+import time
+from datetime import datetime
+
+from sopel.backends import AbstractBackend, LineBuffer
+from sopel.logger import get_logger
+from sopel.tools import stderr
+try:
+    import ssl
+    if not hasattr(ssl, 'match_hostname'):
+        # Attempt to import ssl_match_hostname from python-backports
+        import backports.ssl_match_hostname
+        ssl.match_hostname = backports.ssl_match_hostname.match_hostname
+        ssl.CertificateError = backports.ssl_match_hostname.CertificateError
+    has_ssl = True
+except ImportError:
+    # no SSL support
+    has_ssl = False
+
+LOGGER = get_logger(__name__)
+
+
+class AsynchatBackend(asynchat.async_chat, AbstractBackend):
+    def __init__(self, bot):
+        asynchat.async_chat.__init__(self)
+        AbstractBackend.__init__(self, bot)
+        self.buffer = LineBuffer(self.decode)
+        self._send_chunk = self._plain_send
+        self._send_lock = threading.Lock()
+
+        # Work around bot.connecting missing in Python older than 2.7.4
+        if not hasattr(self, "connecting"):
+            self.connecting = False
+
+    def run(self, host, port):
+        try:
+            self.initiate_connect(host, port)
+        except socket.error as e:
+            stderr('Connection error: %s' % e)
+            self.handle_close()
+
+    def initiate_connect(self, host, port):
+        stderr('Connecting to %s:%s...' % (host, port))
+        source_address = ((self.config.core.bind_host, 0)
+                          if self.config.core.bind_host else None)
+        self.set_socket(socket.create_connection((host, port),
+                        source_address=source_address))
+        if self.config.core.use_ssl and has_ssl:
+            self._send_chunk = self._ssl_send
+            self.recv = self._ssl_recv
+        elif not has_ssl and self.config.core.use_ssl:
+            stderr('SSL is not avilable on your system, attempting connection '
+                   'without it')
+        self.connect((host, port))
+        try:
+            asyncore.loop()
+        except KeyboardInterrupt:
+            print('KeyboardInterrupt')
+            self.bot.quit('KeyboardInterrupt')
+
+    def is_connected(self):
+        return self.connected
+
+    def send(self, data):
+        """Send all of ``data``, waiting whenever the socket's buffer is full.
+
+        This is called from the outbound queue's thread, so it's fine for it to
+        wait; the asyncore loop only ever reads.
+        """
+        with self._send_lock:
+            view = memoryview(data)
+            while view and (self.connected or self.connecting):
+                sent = self._send_chunk(view)
+                if sent:
+                    view = view[sent:]
+                else:
+                    select.select([], [self.socket], [], 1.0)
+
+    def _plain_send(self, data):
+        return asynchat.async_chat.send(self, data)
+
+    def disconnect(self):
+        self.handle_close()
+
+    def handle_close(self):
+        self.bot.on_close()
+
+        # This will eventually call asyncore dispatchers close method, which
+        # will release the main thread. This should be called last to avoid
+        # race conditions.
+        self.close()
+
+    def handle_connect(self):
+        """Handle TLS, then let the bot register with the server."""
+        if self.config.core.use_ssl and has_ssl:
+            if not self.config.core.verify_ssl:
+                self.ssl = ssl.wrap_socket(self.socket,
+                                           do_handshake_on_connect=True,
+                                           suppress_ragged_eofs=True)
+            else:
+                self.ssl = ssl.wrap_socket(self.socket,
+                                           do_handshake_on_connect=True,
+                                           suppress_ragged_eofs=True,
+                                           cert_reqs=ssl.CERT_REQUIRED,
+                                           ca_certs=self.bot.ca_certs)
+                # connect to host specified in config first
+                try:
+                    ssl.match_hostname(self.ssl.getpeercert(), self.config.core.host)
+                except ssl.CertificateError:
+                    # the host in config and certificate don't match
+                    LOGGER.error("hostname mismatch between configuration and certificate")
+                    # check (via exception) if a CNAME matches as a fallback
+                    has_matched = False
+                    for hostname in self._get_cnames(self.config.core.host):
+                        try:
+                            ssl.match_hostname(self.ssl.getpeercert(), hostname)
+                            LOGGER.warning("using {0} instead of {1} for TLS connection"
+                                           .format(hostname, self.config.core.host))
+                            has_matched = True
+                            break
+                        except ssl.CertificateError:
+                            pass
+                    if not has_matched:
+                        # everything is broken
+                        stderr("Invalid certificate, hostname mismatch!")
+                        LOGGER.error("invalid certificate, no hostname matches")
+                        if hasattr(self.config.core, 'pid_file_path'):
+                            os.unlink(self.config.core.pid_file_path)
+                            os._exit(1)
+            self.set_socket(self.ssl)
+
+        self.bot.on_connect()
+
+        # maintain connection
+        timeout_check_thread = threading.Thread(target=self._timeout_check)
+        timeout_check_thread.daemon = True
+        timeout_check_thread.start()
+        ping_thread = threading.Thread(target=self._send_ping)
+        ping_thread.daemon = True
+        ping_thread.start()
+
+    def _get_cnames(self, domain):
+        """
+        Determine the CNAMEs for a given domain.
+
+        :param domain: domain to check
+        :type domain: str
+        :returns: list (of str)
+        """
+        import dns.resolver
+        cnames = []
+        try:
+            answer = dns.resolver.query(domain, "CNAME")
+        except dns.resolver.NoAnswer:
+            return []
+        for data in answer:
+            if isinstance(data, dns.rdtypes.ANY.CNAME.CNAME):
+                cname = data.to_text()[:-1]
+                cnames.append(cname)
+        return cnames
+
+    def _timeout_check(self):
+        while self.connected or self.connecting:
+            if (datetime.now() - self.bot.last_ping_time).seconds > int(self.config.core.timeout):
+                stderr('Ping timeout reached after %s seconds, closing connection' % self.config.core.timeout)
+                self.handle_close()
+                break
+            else:
+                time.sleep(int(self.config.core.timeout))
+
+    def _send_ping(self):
+        while self.connected or self.connecting:
+            if self.connected and (datetime.now() - self.bot.last_ping_time).seconds > int(self.config.core.timeout) / 2:
+                try:
+                    self.bot.write(('PING', self.config.core.host))
+                except socket.error:
+                    pass
+            time.sleep(int(self.config.core.timeout) / 2)
+
+    def _ssl_send(self, data):
+        """Replacement for self.send() during SSL connections."""
+        try:
+            result = self.socket.send(data)
+            return result
+        except ssl.SSLError as why:
+            if why.args[0] in (ssl.SSL_ERROR_WANT_WRITE,
+                               ssl.SSL_ERROR_WANT_READ,
+                               asyncore.EWOULDBLOCK, errno.ESRCH):
+                return 0
+            else:
+                raise why
+            return 0
+
+    def _ssl_recv(self, buffer_size):
+        """Replacement for self.recv() during SSL connections.
+
+        From: http://evanfosmark.com/2010/09/ssl-support-in-asynchatasync_chat
+
+        """
+        try:
+            data = self.socket.read(buffer_size)
+            if not data:
+                self.handle_close()
+                return b''
+            return data
+        except ssl.SSLError as why:
+            if why.args[0] in (asyncore.ECONNRESET, asyncore.ENOTCONN,
+                               asyncore.ESHUTDOWN):
+                self.handle_close()
+                return b''
+            elif why.args[0] in (errno.ENOENT, ssl.SSL_ERROR_WANT_READ):
+                # Required in order to keep it non-blocking
+                return b''
+            else:
+                raise
+
+    def handle_read(self):
+        """Frame received data into lines ourselves, rather than with asynchat.
+
+        asynchat decodes nothing, but copies its whole input buffer each time
+        data arrives; see :class:`sopel.backends.LineBuffer`.
+        """
+        try:
+            data = self.recv(self.ac_in_buffer_size)
+        except socket.error as why:
+            if why.args[0] in (errno.EWOULDBLOCK, errno.EAGAIN):
+                return
+            self.handle_error()
+            return
+
+        for line in self.buffer.feed(data):
+            self.bot.log_raw(line, '<<')
+            try:
+                self.bot.on_message(line)
+            except Exception:
+                self.bot.handle_error()
+
+    def handle_error(self):
+        """Overrides asyncore's handle_error, to log it the bot's way."""
+        self.bot.handle_error()
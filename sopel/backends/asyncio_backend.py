@@ -0,0 +1,199 @@
+# coding=utf-8
+"""The asyncio backend.
+
+The connection is handled entirely within one event loop, on the thread which
+calls ``run``: TLS is done by asyncio itself, lines are framed by the stream
+reader, and the ping and timeout checks are timers on the loop rather than
+threads of their own. This needs Python 3.5 or newer.
+"""
+# Licensed under the Eiffel Forum License 2.
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import asyncio
+import ssl
+import threading
+from datetime import datetime
+
+from sopel.backends import AbstractBackend
+from sopel.logger import get_logger
+from sopel.tools import stderr
+
+LOGGER = get_logger(__name__)
+
+
+class AsyncioBackend(AbstractBackend):
+    line_limit = 2 ** 16
+    """The longest line the server is trusted to send, in bytes.
+
+    Anything longer is logged and discarded, up to the next newline.
+    """
+    quit_timeout = 5.0
+    """How long to wait for the ``QUIT`` to be sent, on a KeyboardInterrupt."""
+
+    def __init__(self, bot):
+        AbstractBackend.__init__(self, bot)
+        self.loop = None
+        self._reader = None
+        self._writer = None
+        self._ping_timer = None
+        self._loop_thread = None
+
+    def run(self, host, port):
+        self.loop = asyncio.new_event_loop()
+        self._loop_thread = threading.current_thread()
+        try:
+            self.loop.run_until_complete(self._run(host, port))
+        except KeyboardInterrupt:
+            print('KeyboardInterrupt')
+            self.bot.quit('KeyboardInterrupt')
+            self.loop.run_until_complete(self._quit())
+        finally:
+            self.loop.close()
+
+    def is_connected(self):
+        return (self._writer is not None and
+                not self._writer.transport.is_closing())
+
+    def send(self, data):
+        if threading.current_thread() is self._loop_thread:
+            self._write(data)
+        elif self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._write, data)
+
+    def disconnect(self):
+        self._call_in_loop(self._abort)
+
+    def close_when_done(self):
+        self._call_in_loop(self._close_transport)
+
+    def _call_in_loop(self, callback):
+        if threading.current_thread() is self._loop_thread:
+            callback()
+        elif self.loop is not None and not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(callback)
+
+    def _write(self, data):
+        if self.is_connected():
+            self._writer.write(data)
+
+    def _close_transport(self):
+        # Anything still buffered is flushed before the transport is closed.
+        if self._writer is not None:
+            self._writer.close()
+
+    def _abort(self):
+        if self._writer is not None:
+            self._writer.transport.abort()
+
+    async def _quit(self):
+        # The QUIT goes out after whatever was queued before it, through the
+        # loop, which has to run meanwhile
+        sent = await self.loop.run_in_executor(
+            None, self.bot.outbound.wait_empty, self.quit_timeout)
+        if not sent:
+            LOGGER.warning('Closing before everything queued was sent.')
+        await self._close()
+
+    async def _close(self):
+        self._close_transport()
+        if self._writer is not None and hasattr(self._writer, 'wait_closed'):
+            try:
+                await self._writer.wait_closed()
+            except (OSError, ssl.SSLError):
+                pass
+
+    def _get_ssl_context(self):
+        if not self.config.core.use_ssl:
+            return None
+        if not self.config.core.verify_ssl:
+            context = ssl.create_default_context()
+            context.check_hostname = False
+            context.verify_mode = ssl.CERT_NONE
+        else:
+            context = ssl.create_default_context(cafile=self.bot.ca_certs)
+        return context
+
+    async def _run(self, host, port):
+        stderr('Connecting to %s:%s...' % (host, port))
+        context = self._get_ssl_context()
+        local_addr = ((self.config.core.bind_host, 0)
+                      if self.config.core.bind_host else None)
+        try:
+            self._reader, self._writer = await asyncio.open_connection(
+                host, port, ssl=context,
+                server_hostname=host if context else None,
+                local_addr=local_addr, limit=self.line_limit)
+        except ssl.CertificateError as e:
+            stderr('Invalid certificate: %s' % e)
+            LOGGER.error('invalid certificate: %s', e)
+            self.bot.on_close()
+            return
+        except OSError as e:
+            stderr('Connection error: %s' % e)
+            self.bot.on_close()
+            return
+
+        try:
+            self.bot.on_connect()
+            self._schedule_ping()
+            await self._read_lines()
+        finally:
+            if self._ping_timer is not None:
+                self._ping_timer.cancel()
+            self._close_transport()
+            self.bot.on_close()
+
+    async def _read_lines(self):
+        while True:
+            try:
+                data = await self._reader.readuntil(b'\n')
+            except asyncio.IncompleteReadError:
+                # EOF, with or without a partial line.
+                return
+            except asyncio.LimitOverrunError as e:
+                LOGGER.warning('Discarding a line longer than %d bytes',
+                               self.line_limit)
+                try:
+                    await self._skip_line(e.consumed)
+                except asyncio.IncompleteReadError:
+                    return
+                continue
+            except (OSError, ssl.SSLError) as e:
+                stderr('Connection error: %s' % e)
+                return
+
+            line = self.decode(memoryview(data)[:-1])
+            if line is None:
+                # Discard line if encoding is unknown
+                continue
+            self.bot.log_raw(line, '<<')
+            try:
+                self.bot.on_message(line)
+            except Exception:
+                self.bot.handle_error()
+
+    async def _skip_line(self, consumed):
+        """Throw away the rest of a line that was too long to read."""
+        while True:
+            await self._reader.readexactly(consumed)
+            try:
+                await self._reader.readuntil(b'\n')
+                return
+            except asyncio.LimitOverrunError as e:
+                consumed = e.consumed
+
+    def _schedule_ping(self):
+        self._ping_timer = self.loop.call_later(
+            int(self.config.core.timeout) / 2, self._check_ping)
+
+    def _check_ping(self):
+        """Send a PING after half the timeout, and give up after all of it."""
+        timeout = int(self.config.core.timeout)
+        idle = (datetime.now() - self.bot.last_ping_time).total_seconds()
+        if idle > timeout:
+            stderr('Ping timeout reached after %s seconds, closing connection' % timeout)
+            self._abort()
+            return
+        if idle > timeout / 2:
+            self.bot.write(('PING', self.config.core.host))
+        self._schedule_ping()
@@ -11,19 +11,32 @@ import collections
 import os
 import re
 import sys
-import threading
 import time
 
 from sopel import tools
 from sopel import irc
 from sopel.db import SopelDB
 from sopel.tools import stderr, Identifier
+from sopel.tools import ratelimit
+from sopel.tools.autojoin import JoinScheduler
+from sopel.tools.isupport import ISupport
+from sopel.tools.target import PrivilegesView
 import sopel.tools.jobs
 from sopel.trigger import Trigger
 from sopel.module import NOLIMIT
 from sopel.logger import get_logger
 import sopel.loader
 
+try:
+    import asyncio
+except ImportError:
+    # Python 2, where there are no async callables
+    asyncio = None
+
+try:
+    from re import _parser as sre_parse  # Python 3.11+
+except ImportError:
+    import sre_parse
 
 LOGGER = get_logger(__name__)
 
@@ -34,6 +47,246 @@ if sys.version_info.major >= 3:
 else:
     py3 = False
 
+_plain_command = re.compile(r'^[\w-]+$', re.UNICODE)
+_global_flags = re.compile(r'^\(\?([aiLmsux]+)\)')
+_inline_flags = re.compile(r'\(\?[aiLmsux]+\)')
+_group_references = re.compile(r'\\[1-9]|\(\?P=|\(\?\(')
+_scoped_flags = ((re.IGNORECASE, 'i'), (re.MULTILINE, 'm'), (re.DOTALL, 's'),
+                 (re.VERBOSE, 'x'))
+if py3:
+    _scoped_flags += ((re.ASCII, 'a'),)
+
+
+def _scoped_pattern(regexp):
+    """Return the pattern of ``regexp``, with its flags scoped to a group.
+
+    The result can be embedded in a larger pattern without changing what it
+    matches. ``None`` is returned if that isn't possible, e.g. because the
+    pattern refers to its own groups by number.
+    """
+    pattern = regexp.pattern
+    if not isinstance(pattern, unicode) or regexp.groupindex:
+        return None
+    match = _global_flags.match(pattern)
+    while match:
+        pattern = pattern[match.end():]
+        match = _global_flags.match(pattern)
+    if _inline_flags.search(pattern) or _group_references.search(pattern):
+        return None
+    flags = ''.join(flag for value, flag in _scoped_flags
+                    if regexp.flags & value)
+    if not flags:
+        return '(?:{})'.format(pattern)
+    if 'x' in flags:
+        # A trailing comment would swallow the closing paren
+        pattern += '\n'
+    return '(?{}:{})'.format(flags, pattern)
+
+
+class _CombinedRules(object):
+    """Finds which of many rules match a line, in as few passes as possible.
+
+    Rules are compiled together into a handful of regexps, in which each rule
+    is an optional lookahead with its own named group. Matching one of those
+    at the start of a line tries every rule in it, and the groups which
+    captured something tell which rules matched. Rules which can't be
+    combined are kept aside, and always reported as candidates.
+    """
+    max_rules = 50
+    """The most rules to put into a single combined regexp."""
+
+    def __init__(self, entries):
+        self.single = []
+        self.combined = []
+        chunk = []
+        for entry in entries:
+            pattern = _scoped_pattern(entry[1])
+            if pattern is None:
+                self.single.append(entry)
+                continue
+            chunk.append((pattern, entry))
+            if len(chunk) == self.max_rules:
+                self._combine(chunk)
+                chunk = []
+        if chunk:
+            self._combine(chunk)
+
+    def _combine(self, chunk):
+        if len(chunk) == 1:
+            self.single.append(chunk[0][1])
+            return
+        pattern = ''.join('(?:(?=(?P<_rule{}>{})))?'.format(i, rule)
+                          for i, (rule, _) in enumerate(chunk))
+        try:
+            regexp = re.compile(pattern)
+        except (re.error, AssertionError, OverflowError, RuntimeError):
+            # e.g. too many groups, or no scoped flags on this Python
+            self.single.extend(entry for _, entry in chunk)
+            return
+        groups = [(regexp.groupindex['_rule{}'.format(i)] - 1, entry)
+                  for i, (_, entry) in enumerate(chunk)]
+        self.combined.append((regexp, groups))
+
+    def candidates(self, text):
+        """Return the entries whose rules may match ``text``."""
+        entries = list(self.single)
+        for regexp, groups in self.combined:
+            found = regexp.match(text).groups()
+            entries.extend(entry for group, entry in groups
+                           if found[group] is not None)
+        return entries
+
+
+class _Blocklist(object):
+    """A list of blocks, which nicks or hosts are checked against.
+
+    Each entry is a regular expression, which has to match the whole value
+    (ignoring case), or else a value which is blocked exactly. If given,
+    ``normalize`` is applied to entries and values before they are compared
+    exactly. The expressions are combined into one regexp when the list is
+    built, and the result for each value is remembered (for up to
+    ``cache_size`` values) until the entries change.
+    """
+    def __init__(self, entries=(), normalize=None, cache_size=10000):
+        self.normalize = normalize
+        self.cache_size = cache_size
+        self.update(entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+    def update(self, entries):
+        """Replace the entries, and forget any earlier results."""
+        entries = [entry.strip() for entry in entries]
+        self.entries = [entry for entry in entries if entry]
+        normalize = self.normalize or (lambda value: value)
+        self._exact = set(normalize(entry) for entry in self.entries)
+        self._regexps = []
+        combinable = []
+        for entry in self.entries:
+            # Only the end is anchored, as it always has been: in 'a|b', that
+            # is only of the last alternative
+            try:
+                regexp = re.compile(entry + '$', re.IGNORECASE)
+            except re.error:
+                LOGGER.warning('Block %r is not a valid regular expression; '
+                               'only blocking it exactly.', entry)
+                continue
+            scoped = _scoped_pattern(regexp)
+            if scoped is None:
+                self._regexps.append(regexp)
+            else:
+                combinable.append((scoped, regexp))
+        if len(combinable) > 1:
+            pattern = '|'.join(scoped for scoped, _ in combinable)
+            try:
+                self._regexps.insert(0, re.compile(pattern))
+                combinable = []
+            except (re.error, AssertionError, OverflowError, RuntimeError):
+                pass  # e.g. too many groups; match them one by one
+        self._regexps.extend(regexp for _, regexp in combinable)
+        self._results = {}
+
+    def matches(self, value):
+        """Return whether ``value`` is blocked."""
+        if not self.entries:
+            return False
+        results = self._results
+        result = results.get(value)
+        if result is None:
+            exact = self.normalize(value) if self.normalize else value
+            result = (exact in self._exact or
+                      any(regexp.match(value) for regexp in self._regexps))
+            if len(results) >= self.cache_size:
+                results.clear()
+            results[value] = result
+        return result
+
+
+def _is_fixed_width(regexp):
+    """Whether every match of ``regexp`` has the same length."""
+    try:
+        low, high = sre_parse.parse(regexp.pattern, regexp.flags).getwidth()
+    except Exception:  # sre_parse is an implementation detail; be careful
+        return False
+    return low == high
+
+
+class _DispatchIndex(object):
+    """Lookup tables used by :meth:`Sopel.dispatch` to find candidate rules.
+
+    Rules are bucketed by event, so that a line is only checked against the
+    rules of callables which could be triggered by it. Within an event, rules
+    created by :func:`sopel.module.commands` are found by looking up the
+    command name which follows the prefix, rather than being matched one by
+    one. The remaining free-form rules are combined with
+    :class:`_CombinedRules`, so they can be scanned in a single pass.
+
+    The prefix must match a fixed number of characters for the command name to
+    be unambiguous. If it doesn't, commands are scanned like any other rule.
+    """
+    def __init__(self, callables, prefix):
+        prefix = re.sub(r"(\s)", r"\\\1", prefix)
+        self.prefix_regexp = re.compile('(?:{})'.format(prefix),
+                                        re.IGNORECASE | re.VERBOSE)
+        if not _is_fixed_width(self.prefix_regexp):
+            self.prefix_regexp = None
+        self.commands = collections.defaultdict(
+            lambda: collections.defaultdict(list))
+        """Maps events to command names to their ``(order, regexp, funcs)``"""
+        self.rules = {}
+        """Maps events to the :class:`_CombinedRules` to be scanned"""
+
+        rules = collections.defaultdict(list)
+        order = 0
+        for priority in ('high', 'medium', 'low'):
+            for regexp, funcs in callables[priority].items():
+                order += 1
+                command = self._get_command(regexp, funcs)
+                by_event = collections.OrderedDict()
+                for func in funcs:
+                    for event in func.event:
+                        by_event.setdefault(event, []).append(func)
+                for event, event_funcs in by_event.items():
+                    entry = (order, regexp, event_funcs)
+                    if command is None:
+                        rules[event].append(entry)
+                    else:
+                        self.commands[event][command].append(entry)
+        for event, entries in rules.items():
+            self.rules[event] = _CombinedRules(entries)
+
+    def _get_command(self, regexp, funcs):
+        """Return the name to index ``regexp`` under, or ``None``."""
+        if self.prefix_regexp is None or not funcs:
+            return None
+        commands = set(getattr(func, '_command_rules', {}).get(regexp)
+                       for func in funcs)
+        if len(commands) != 1:
+            return None
+        command = commands.pop()
+        if command is None or not _plain_command.match(command):
+            return None
+        return command.lower()
+
+    def candidates(self, event, text):
+        """Return the ``(regexp, funcs)`` which may match ``text``, in order.
+
+        Every rule which could match is returned, but the caller still needs to
+        match the regexp itself; a returned rule will not necessarily match.
+        """
+        rules = self.rules.get(event)
+        entries = rules.candidates(text) if rules else []
+        commands = self.commands.get(event)
+        if commands:
+            match = self.prefix_regexp.match(text)
+            if match:
+                name = text[match.end():].split(None, 1)
+                if name and name[0].lower() in commands:
+                    entries.extend(commands[name[0].lower()])
+        entries.sort(key=lambda entry: entry[0])
+        return [(regexp, funcs) for _, regexp, funcs in entries]
+
 
 class _CapReq(object):
     def __init__(self, prefix, module, failure=None, arg=None, success=None):
@@ -59,6 +312,11 @@ class Sopel(irc.Bot):
             'medium': collections.defaultdict(list),
             'low': collections.defaultdict(list)
         }
+        self._dispatch_index = None
+        """Cached :class:`_DispatchIndex` of ``_callables``.
+
+        Reset to ``None`` whenever callables are added or removed, and rebuilt
+        on the next dispatch."""
         self.config = config
         """The :class:`sopel.config.Config` for the current Sopel instance."""
         self.doc = {}
@@ -71,11 +329,12 @@ class Sopel(irc.Bot):
         self._command_groups = collections.defaultdict(list)
         """A mapping of module names to a list of commands in it."""
         self.stats = {}  # deprecated, remove in 7.0
-        self._times = {}
-        """
-        A dictionary mapping lower-case'd nicks to dictionaries which map
-        funtion names to the time which they were last used by that nick.
-        """
+        self.rate_limiter = ratelimit.RateLimiter()
+        """The :class:`sopel.tools.ratelimit.RateLimiter` which keeps track of
+        the callables' rate limits, and who they currently apply to."""
+        self._nick_blocklist = _Blocklist(
+            normalize=lambda nick: Identifier(nick).lower())
+        self._host_blocklist = _Blocklist()
 
         self.server_capabilities = {}
         """A dict mapping supported IRCv3 capabilities to their options.
@@ -90,17 +349,12 @@ class Sopel(irc.Bot):
         self._cap_reqs = dict()
         """A dictionary of capability names to a list of requests"""
 
-        self.privileges = dict()
-        """A dictionary of channels to their users and privilege levels
+        self.isupport = ISupport()
+        """The features the server advertises in RPL_ISUPPORT.
 
-        The value associated with each channel is a dictionary of
-        :class:`sopel.tools.Identifier`\\s to
-        a bitwise integer value, determined by combining the appropriate
-        constants from :mod:`sopel.module`.
-
-        .. deprecated:: 6.2.0
-            Use :attr:`channels` instead.
-        """
+        A :class:`sopel.tools.isupport.ISupport`, which gives e.g. the
+        server's line length, and how many targets or modes a line may have.
+        Until the server has sent them, the defaults are used."""
 
         self.channels = tools.SopelMemory()  # name to chan obj
         """A map of the channels that Sopel is in.
@@ -109,6 +363,19 @@ class Sopel(irc.Bot):
         :class:`sopel.tools.target.Channel` objects which contain the users in
         the channel and their permissions.
         """
+
+        self.privileges = PrivilegesView(self.channels)
+        """A dictionary of channels to their users and privilege levels
+
+        The value associated with each channel is a dictionary of
+        :class:`sopel.tools.Identifier`\\s to
+        a bitwise integer value, determined by combining the appropriate
+        constants from :mod:`sopel.module`. It's a read-only view of the
+        ``privileges`` of each of :attr:`channels`, which are changed in place.
+
+        .. deprecated:: 6.2.0
+            Use :attr:`channels` instead.
+        """
         self.users = tools.SopelMemory()  # name to user obj
         """A map of the users that Sopel is aware of.
 
@@ -130,6 +397,25 @@ class Sopel(irc.Bot):
         self.shutdown_methods = []
         """List of methods to call on shutdown"""
 
+        core = self.config.core
+        self.workers = sopel.tools.jobs.WorkerPool(
+            core.worker_threads, core.worker_queue_size, core.worker_overflow,
+            sopel.tools.jobs.WorkerPool.parse_module_limits(
+                core.worker_module_limits))
+        """The :class:`sopel.tools.jobs.WorkerPool` for threaded callables.
+
+        Its ``stats()`` give the depth of the queue, and how long calls wait."""
+
+        self.coroutines = sopel.tools.jobs.CoroutineRunner()
+        """The :class:`sopel.tools.jobs.CoroutineRunner` for ``async def``
+        callables and jobs."""
+
+        self.autojoin = JoinScheduler(self.join, rate=core.throttle_join)
+        """The :class:`sopel.tools.autojoin.JoinScheduler` for ``channels``.
+
+        It's started once connected. Its ``stats()`` tell how far along
+        joining the channels is."""
+
         self.scheduler = sopel.tools.jobs.JobScheduler(self)
         self.scheduler.start()
 
@@ -139,11 +425,27 @@ class Sopel(irc.Bot):
             self.config.core.nick_blocks = []
         if not self.config.core.host_blocks:
             self.config.core.host_blocks = []
+        self.reload_blocks()
         self.setup()
 
     # Backwards-compatibility aliases to attributes made private in 6.2. Remove
     # these in 7.0
-    times = property(lambda self: getattr(self, '_times'))
+    @property
+    def times(self):
+        # A snapshot of the rate limits in effect, in the shape of the old
+        # _times: {nick or channel: {func: when it was last used}}, with the
+        # bot's nick standing for global limits.
+        now = time.time()
+        times = {}
+        rates = {ratelimit.USER: 'rate', ratelimit.CHANNEL: 'channel_rate',
+                 ratelimit.GLOBAL: 'global_rate'}
+        for limit in self.rate_limiter.limits(now=now):
+            rate = getattr(limit.func, rates[limit.scope])
+            target = self.nick if limit.target is None else limit.target
+            times.setdefault(target, {})[limit.func] = (
+                now - rate + limit.remaining)
+        return times
+
     command_groups = property(lambda self: getattr(self, '_command_groups'))
 
     def write(self, args, text=None):  # Shim this in here for autodocs
@@ -216,10 +518,9 @@ class Sopel(irc.Bot):
                 callb_list = self._callables[obj.priority][rule]
                 if obj in callb_list:
                     callb_list.remove(obj)
+            self._dispatch_index = None
         if hasattr(obj, 'interval'):
-            # TODO this should somehow find the right job to remove, rather than
-            # clearing the entire queue. Issue #831
-            self.scheduler.clear_jobs()
+            self.scheduler.remove_jobs(func=obj)
         if (getattr(obj, '__name__', None) == 'shutdown' and
                     obj in self.shutdown_methods):
             self.shutdown_methods.remove(obj)
@@ -242,9 +543,14 @@ class Sopel(irc.Bot):
                 self._command_groups[category].append(callbl.commands[0])
             for command, docs in callbl._docs.items():
                 self.doc[command] = docs
+        self._dispatch_index = None
         for func in jobs:
             for interval in func.interval:
-                job = sopel.tools.jobs.Job(interval, func)
+                job = sopel.tools.jobs.Job(
+                    interval, func,
+                    jitter=getattr(func, 'jitter', 0),
+                    misfire=getattr(func, 'misfire',
+                                    sopel.tools.jobs.MISFIRE_CATCH_UP))
                 self.scheduler.add_job(job)
 
         if not self.memory.contains('url_callbacks'):
@@ -263,12 +569,28 @@ class Sopel(irc.Bot):
         assumed to split the argument into the channel to join and its
         password.  `channel` should not contain a space if `password` is given.
 
+        `channel` may also be a list of channels, each either a name or a
+        ``(name, password)`` tuple. They're joined with as few lines as the
+        server allows (see :meth:`sopel.tools.isupport.ISupport.batch_joins`).
         """
-        if password is None:
+        if isinstance(channel, (list, tuple)):
+            for args in self.isupport.batch_joins(channel):
+                self.write(['JOIN'] + args)
+        elif password is None:
             self.write(('JOIN', channel))
         else:
             self.write(['JOIN', channel, password])
 
+    def set_modes(self, channel, changes):
+        """Change the modes of ``channel``, with as few lines as allowed.
+
+        ``changes`` is a list of ``(mode, parameter)`` pairs, like
+        ``('+o', 'Embolalia')`` or ``('+m', None)``. They're sent in order,
+        with up to the server's ``MODES`` changes with a parameter per line.
+        """
+        for args in self.isupport.batch_modes(changes):
+            self.write(['MODE', channel] + args)
+
     def msg(self, recipient, text, max_messages=1):
         # Deprecated, but way too much of a pain to remove.
         self.say(text, recipient, max_messages)
@@ -283,17 +605,26 @@ class Sopel(irc.Bot):
         By default, this will attempt to send the entire ``text`` in one
         message. If the text is too long for the server, it may be truncated.
         If ``max_messages`` is given, the ``text`` will be split into at most
-        that many messages, each no more than 400 bytes. The split is made at
-        the last space character before the 400th byte, or at the 400th byte if
-        no such space exists. If the ``text`` is too long to fit into the
+        that many messages, each no longer than fits in the server's
+        ``LINELEN`` once relayed with the bot's hostmask. The split is made at
+        the last space character before that, or at the limit itself if no
+        such space exists. If the ``text`` is too long to fit into the
         specified number of messages using the above splitting, the final
         message will contain the entire remainder, which may be truncated by
         the server.
+
+        ``recipient`` may also be a list, to send the same ``text`` to each
+        of them. Where the server allows a ``PRIVMSG`` to have several
+        targets (``TARGMAX``), each line is sent to as many as it may.
+
+        The message is queued in :attr:`outbound`, so this never blocks; it's
+        sent as soon as flood protection allows.
         """
-        # We're arbitrarily saying that the max is 400 bytes of text when
-        # messages will be split. Otherwise, we'd have to acocunt for the bot's
-        # hostmask, which is hard.
-        max_text_length = 400
+        if isinstance(recipient, (list, tuple, set, frozenset)):
+            for targets in self.isupport.batch_targets('PRIVMSG', recipient):
+                self.say(text, ','.join(targets), max_messages)
+            return
+        max_text_length = self._max_text_length('PRIVMSG', recipient)
         # Encode to bytes, for propper length calculation
         if isinstance(text, unicode):
             encoded_text = text.encode('utf-8')
@@ -311,45 +642,32 @@ class Sopel(irc.Bot):
         # We'll then send the excess at the end
         # Back to unicode again, so we don't screw things up later.
         text = encoded_text.decode('utf-8')
-        try:
-            self.sending.acquire()
-
-            # No messages within the last 3 seconds? Go ahead!
-            # Otherwise, wait so it's been at least 0.8 seconds + penalty
-
-            recipient_id = Identifier(recipient)
-
-            if recipient_id not in self.stack:
-                self.stack[recipient_id] = []
-            elif self.stack[recipient_id]:
-                elapsed = time.time() - self.stack[recipient_id][-1][0]
-                if elapsed < 3:
-                    penalty = float(max(0, len(text) - 40)) / 70
-                    wait = 0.8 + penalty
-                    if elapsed < wait:
-                        time.sleep(wait - elapsed)
-
-                # Loop detection
-                messages = [m[1] for m in self.stack[recipient_id][-8:]]
-
-                # If what we about to send repeated at least 5 times in the
-                # last 2 minutes, replace with '...'
-                if messages.count(text) >= 5 and elapsed < 120:
-                    text = '...'
-                    if messages.count('...') >= 3:
-                        # If we said '...' 3 times, discard message
-                        return
-
-            self.write(('PRIVMSG', recipient), text)
-            self.stack[recipient_id].append((time.time(), self.safe(text)))
-            self.stack[recipient_id] = self.stack[recipient_id][-10:]
-        finally:
-            self.sending.release()
+        text = self.outbound.check_loop(recipient, text)
+        if text is None:
+            return
+        self.write(('PRIVMSG', recipient), text)
         # Now that we've sent the first part, we need to send the rest. Doing
         # this recursively seems easier to me than iteratively
         if excess:
             self.msg(recipient, excess, max_messages - 1)
 
+    def _max_text_length(self, command, recipient):
+        """Return how many bytes of text fit in a ``command`` to ``recipient``.
+
+        The server relays the line with the bot's hostmask in front, so that
+        is counted too; if the bot's hostmask isn't known yet, the longest
+        host allowed is assumed.
+        """
+        user = self.users.get(self.nick)
+        if user is not None and user.host:
+            ident, host = user.user, user.host
+        else:
+            # The server may prefix the ident with ~ if it can't verify it
+            ident, host = '~' + self.user, 'x' * 63
+        relayed = ':{}!{}@{} {} {} :\r\n'.format(
+            self.nick, ident, host, command, recipient)
+        return max(self.isupport.linelen - len(relayed.encode('utf-8')), 1)
+
     def notice(self, text, dest):
         """Send an IRC NOTICE to a user or a channel.
 
@@ -431,111 +749,141 @@ class Sopel(irc.Bot):
                 reply_to = self._trigger.nick
             self._bot.reply(message, destination, reply_to, notice)
 
+    class AsyncSopelWrapper(SopelWrapper):
+        """The bot, as passed to ``async def`` callables.
+
+        ``say``, ``action``, ``notice`` and ``reply`` return awaitables, for
+        ``await bot.say(...)``. Messages are only queued to be sent, so there
+        is never anything to wait for.
+        """
+        def _queued(self):
+            future = asyncio.get_event_loop().create_future()
+            future.set_result(None)
+            return future
+
+        def say(self, message, destination=None, max_messages=1):
+            Sopel.SopelWrapper.say(self, message, destination, max_messages)
+            return self._queued()
+
+        def action(self, message, destination=None):
+            Sopel.SopelWrapper.action(self, message, destination)
+            return self._queued()
+
+        def notice(self, message, destination=None):
+            Sopel.SopelWrapper.notice(self, message, destination)
+            return self._queued()
+
+        def reply(self, message, destination=None, reply_to=None, notice=False):
+            Sopel.SopelWrapper.reply(self, message, destination, reply_to,
+                                     notice)
+            return self._queued()
+
+    def run_coroutine(self, coro):
+        """Schedule the coroutine ``coro`` to run on the bot's event loop.
+
+        That is the asyncio backend's loop when it's in use, or else the loop
+        of :attr:`coroutines`. This may be called from any thread, and returns
+        a :class:`concurrent.futures.Future` for the coroutine's result.
+        """
+        return self.coroutines.submit(coro, getattr(self.backend, 'loop', None))
+
     def call(self, func, sopel, trigger):
-        nick = trigger.nick
         current_time = time.time()
-        if nick not in self._times:
-            self._times[nick] = dict()
-        if self.nick not in self._times:
-            self._times[self.nick] = dict()
-        if not trigger.is_privmsg and trigger.sender not in self._times:
-            self._times[trigger.sender] = dict()
-
-        if not trigger.admin and not func.unblockable:
-            if func in self._times[nick]:
-                usertimediff = current_time - self._times[nick][func]
-                if func.rate > 0 and usertimediff < func.rate:
-                    #self._times[nick][func] = current_time
-                    LOGGER.info(
-                        "%s prevented from using %s in %s due to user limit: %d < %d",
-                        trigger.nick, func.__name__, trigger.sender, usertimediff,
-                        func.rate
-                    )
-                    return
-            if func in self._times[self.nick]:
-                globaltimediff = current_time - self._times[self.nick][func]
-                if func.global_rate > 0 and globaltimediff < func.global_rate:
-                    #self._times[self.nick][func] = current_time
-                    LOGGER.info(
-                        "%s prevented from using %s in %s due to global limit: %d < %d",
-                        trigger.nick, func.__name__, trigger.sender, globaltimediff,
-                        func.global_rate
-                    )
-                    return
-
-            if not trigger.is_privmsg and func in self._times[trigger.sender]:
-                chantimediff = current_time - self._times[trigger.sender][func]
-                if func.channel_rate > 0 and chantimediff < func.channel_rate:
-                    #self._times[trigger.sender][func] = current_time
-                    LOGGER.info(
-                        "%s prevented from using %s in %s due to channel limit: %d < %d",
-                        trigger.nick, func.__name__, trigger.sender, chantimediff,
-                        func.channel_rate
-                    )
-                    return
+        channel = None if trigger.is_privmsg else trigger.sender
+
+        if not func.unblockable and not trigger.admin:
+            limit = self.rate_limiter.check(func, trigger.nick, channel,
+                                            current_time)
+            if limit is not None:
+                LOGGER.info(
+                    "%s prevented from using %s in %s due to %s limit: "
+                    "%d seconds left",
+                    trigger.nick, func.__name__, trigger.sender, limit.scope,
+                    limit.remaining
+                )
+                return
+
+        if tools.jobs.is_coroutine_function(func):
+            future = self.run_coroutine(func(sopel, trigger))
+            future.add_done_callback(
+                lambda future: self._finish_call(
+                    func, trigger, current_time, future.result))
+        else:
+            self._finish_call(func, trigger, current_time,
+                              lambda: func(sopel, trigger))
 
+    def _finish_call(self, func, trigger, current_time, get_exit_code):
+        """Get the result of a call, and record it for the rate limits."""
         try:
-            exit_code = func(sopel, trigger)
+            exit_code = get_exit_code()
         except Exception:  # TODO: Be specific
             exit_code = None
             self.error(trigger)
 
         if exit_code != NOLIMIT:
-            self._times[nick][func] = current_time
-            self._times[self.nick][func] = current_time
-            if not trigger.is_privmsg:
-                self._times[trigger.sender][func] = current_time
+            channel = None if trigger.is_privmsg else trigger.sender
+            self.rate_limiter.record(func, trigger.nick, channel, current_time)
 
     def dispatch(self, pretrigger):
         args = pretrigger.args
         event, args, text = pretrigger.event, args, args[-1] if args else ''
 
-        if self.config.core.nick_blocks or self.config.core.host_blocks:
-            nick_blocked = self._nick_blocked(pretrigger.nick)
-            host_blocked = self._host_blocked(pretrigger.host)
-        else:
-            nick_blocked = host_blocked = None
+        # Worked out once per line, when first needed
+        blocks = self._nick_blocklist or self._host_blocklist
+        nick_blocked = host_blocked = None
+        account = missing = object()
 
-        list_of_blocked_functions = []
-        for priority in ('high', 'medium', 'low'):
-            items = self._callables[priority].items()
+        index = self._dispatch_index
+        if index is None:
+            index = _DispatchIndex(self._callables, self.config.core.prefix)
+            self._dispatch_index = index
 
-            for regexp, funcs in items:
-                match = regexp.match(text)
-                if not match:
-                    continue
+        list_of_blocked_functions = []
+        for regexp, funcs in index.candidates(event, text):
+            match = regexp.match(text)
+            if not match:
+                continue
+            if account is missing:
                 user_obj = self.users.get(pretrigger.nick)
                 account = user_obj.account if user_obj else None
-                trigger = Trigger(self.config, pretrigger, match, account)
-                wrapper = self.SopelWrapper(self, trigger)
-
-                for func in funcs:
-                    if (not trigger.admin and
-                            not func.unblockable and
-                            (nick_blocked or host_blocked)):
+            # Triggers for the same line share their admin/owner checks
+            trigger = Trigger(self.config, pretrigger, match, account)
+            wrapper = None
+
+            for func in funcs:
+                if blocks and not func.unblockable and not trigger.admin:
+                    if nick_blocked is None:
+                        nick_blocked = self._nick_blocked(pretrigger.nick)
+                        host_blocked = self._host_blocked(pretrigger.host)
+                    if nick_blocked or host_blocked:
                         function_name = "%s.%s" % (
                             func.__module__, func.__name__
                         )
                         list_of_blocked_functions.append(function_name)
                         continue
 
-                    if event not in func.event:
+                if hasattr(func, 'intents'):
+                    if not trigger.tags.get('intent'):
                         continue
-                    if hasattr(func, 'intents'):
-                        if not trigger.tags.get('intent'):
-                            continue
-                        match = False
-                        for intent in func.intents:
-                            if intent.match(trigger.tags.get('intent')):
-                                match = True
-                        if not match:
-                            continue
-                    if func.thread:
-                        targs = (func, wrapper, trigger)
-                        t = threading.Thread(target=self.call, args=targs)
-                        t.start()
-                    else:
-                        self.call(func, wrapper, trigger)
+                    match = False
+                    for intent in func.intents:
+                        if intent.match(trigger.tags.get('intent')):
+                            match = True
+                    if not match:
+                        continue
+                if tools.jobs.is_coroutine_function(func):
+                    self.call(func, self.AsyncSopelWrapper(self, trigger),
+                              trigger)
+                    continue
+                if wrapper is None:
+                    wrapper = self.SopelWrapper(self, trigger)
+                if func.thread:
+                    self.workers.submit(
+                        self.call, (func, wrapper, trigger),
+                        priority=func.priority, module=func.__module__,
+                        name="%s.%s" % (func.__module__, func.__name__))
+                else:
+                    self.call(func, wrapper, trigger)
 
         if list_of_blocked_functions:
             if nick_blocked and host_blocked:
@@ -547,31 +895,24 @@ class Sopel(irc.Bot):
             LOGGER.info(
                 "[%s]%s prevented from using %s.",
                 block_type,
-                trigger.nick,
+                pretrigger.nick,
                 ', '.join(list_of_blocked_functions)
             )
 
+    def reload_blocks(self):
+        """Rebuild the blocklists from the ``nick_blocks`` and ``host_blocks``
+        settings.
+
+        This must be called after changing either of them.
+        """
+        self._nick_blocklist.update(self.config.core.nick_blocks)
+        self._host_blocklist.update(self.config.core.host_blocks)
+
     def _host_blocked(self, host):
-        bad_masks = self.config.core.host_blocks
-        for bad_mask in bad_masks:
-            bad_mask = bad_mask.strip()
-            if not bad_mask:
-                continue
-            if (re.match(bad_mask + '$', host, re.IGNORECASE) or
-                    bad_mask == host):
-                return True
-        return False
+        return self._host_blocklist.matches(host)
 
     def _nick_blocked(self, nick):
-        bad_nicks = self.config.core.nick_blocks
-        for bad_nick in bad_nicks:
-            bad_nick = bad_nick.strip()
-            if not bad_nick:
-                continue
-            if (re.match(bad_nick + '$', nick, re.IGNORECASE) or
-                    Identifier(bad_nick) == nick):
-                return True
-        return False
+        return self._nick_blocklist.matches(nick)
 
     def _shutdown(self):
         stderr(
@@ -592,6 +933,11 @@ class Sopel(irc.Bot):
                         shutdown_method.__module__, e
                     )
                 )
+        self.autojoin.stop()
+        self.scheduler.stop()
+        self.workers.stop()
+        self.coroutines.stop()
+        self.db.close()
 
     def cap_req(self, module_name, capability, arg=None, failure_callback=None,
                 success_callback=None):
@@ -12,9 +12,10 @@ dispatch function in bot.py and making it easier to maintain.
 # Licensed under the Eiffel Forum License 2.
 from __future__ import unicode_literals, absolute_import, print_function, division
 
+import collections
 from random import randint
-import re
 import sys
+import threading
 import time
 import sopel
 import sopel.module
@@ -32,6 +33,61 @@ LOGGER = get_logger(__name__)
 batched_caps = {}
 who_reqs = {}  # Keeps track of reqs coming from this module, rather than others
 
+MAX_PENDING_WHO = 2
+"""How many WHO requests for channels the bot joined may await a reply.
+
+The rest are queued, so that joining many channels at once doesn't have the
+server send all of their users at once, which can exceed its send queue limit
+and get the bot disconnected."""
+
+WHO_TIMEOUT = 60
+"""Seconds after which a WHO request which hasn't been answered is given up.
+
+This is checked whenever a WHO is answered or queued, and every
+``WHO_TIMEOUT / 4`` seconds by :func:`expire_who`, so that the queue moves on
+even if the server never answers."""
+
+PRIVILEGE_MODES = {'v': sopel.module.VOICE,
+                   'h': sopel.module.HALFOP,
+                   'o': sopel.module.OP,
+                   'a': sopel.module.ADMIN,
+                   'q': sopel.module.OWNER}
+"""The channel modes which give privileges, and the privileges they give."""
+
+
+class _ChannelSync(object):
+    """The NAMES and WHO replies being collected, and the WHOs to send."""
+    def __init__(self):
+        self.names = {}
+        """Names from RPL_NAMREPLY, by channel, until RPL_ENDOFNAMES."""
+        self.who = []
+        """Replies to WHO, until RPL_ENDOFWHO."""
+        self.who_queue = collections.deque()
+        """Channels to send a WHO for, once fewer are pending."""
+        self.who_pending = {}
+        """Channels a WHO was sent for, and when."""
+        self.who_lock = threading.RLock()
+        """Guards the WHO queue, which is also checked by a scheduled job."""
+
+
+def _channel_sync(bot):
+    sync = bot.memory.get('channel_sync')
+    if sync is None:
+        sync = bot.memory['channel_sync'] = _ChannelSync()
+    return sync
+
+
+def _privileges(bot):
+    """Map the server's privilege modes, and their prefixes, to privileges.
+
+    Return a dict of the channel modes which give privileges, and one of the
+    prefixes in NAMES replies which show them, to their privilege values.
+    Modes which Sopel has no privilege value for are mapped to 0.
+    """
+    modes, prefixes = bot.isupport.prefix
+    values = [PRIVILEGE_MODES.get(mode, 0) for mode in modes]
+    return dict(zip(modes, values)), dict(zip(prefixes, values))
+
 
 def auth_after_register(bot):
     """Do NickServ/AuthServ auth"""
@@ -91,19 +147,16 @@ def startup(bot, trigger):
     modes = bot.config.core.modes
     bot.write(('MODE ', '%s +%s' % (bot.nick, modes)))
 
-    bot.memory['retry_join'] = dict()
+    bot.memory['channel_sync'] = _ChannelSync()
+    # The server is about to send them again
+    bot.isupport.clear()
 
-    if bot.config.core.throttle_join:
-        throttle_rate = int(bot.config.core.throttle_join)
-        channels_joined = 0
-        for channel in bot.config.core.channels:
-            channels_joined += 1
-            if not channels_joined % throttle_rate:
-                time.sleep(1)
-            bot.join(channel)
-    else:
-        for channel in bot.config.core.channels:
-            bot.join(channel)
+    channels = []
+    for channel in bot.config.core.channels:
+        name, _, key = channel.strip().partition(' ')
+        channels.append((name, key.strip() or None))
+    bot.autojoin.add(channels)
+    bot.autojoin.start()
 
     if (not bot.config.core.owner_account and
             'account-tag' in bot.enabled_capabilities and
@@ -117,6 +170,65 @@ def startup(bot, trigger):
         bot.msg(bot.config.core.owner, msg)
 
 
+@sopel.module.event(events.RPL_ISUPPORT)
+@sopel.module.rule('.*')
+@sopel.module.priority('high')
+@sopel.module.thread(False)
+@sopel.module.unblockable
+def handle_isupport(bot, trigger):
+    """Record the features the server supports, in ``bot.isupport``."""
+    # The last arg is the "are supported by this server" text
+    tokens = trigger.args[1:-1]
+    bot.isupport.update(tokens)
+    names = set(token.partition('=')[0] for token in tokens)
+    if 'CASEMAPPING' in names:
+        try:
+            changed = Identifier.set_casemapping(bot.isupport.casemapping)
+        except ValueError:
+            LOGGER.warning('Unsupported casemapping %s, using %s',
+                           bot.isupport.casemapping, Identifier.casemapping)
+        else:
+            if changed:
+                _refold(bot)
+    if 'CHANTYPES' in names:
+        Identifier.chantypes = tuple(bot.isupport.chantypes)
+
+
+def _refold_keys(mapping):
+    """Rebuild ``mapping`` with its keys lowered per the new casemapping."""
+    items = [(key.refold(), value) for key, value in mapping.items()]
+    mapping.clear()
+    for key, value in items:
+        mapping[key] = value
+
+
+def _refold(bot):
+    """Replace the Identifiers the bot keeps, after the casemapping changed.
+
+    Identifiers compare as they were lowered when they were created, and the
+    dicts keyed by them can't find them once they'd be lowered differently,
+    so everything tracked is rebuilt with new ones.
+    """
+    bot.nick = bot.nick.refold()
+    for user in bot.users.values():
+        user.nick = user.nick.refold()
+        _refold_keys(user.channels)
+    for channel in bot.channels.values():
+        channel.name = channel.name.refold()
+        _refold_keys(channel.users)
+        _refold_keys(channel.privileges)
+    _refold_keys(bot.users)
+    _refold_keys(bot.channels)
+    sync = _channel_sync(bot)
+    _refold_keys(sync.names)
+    _refold_keys(sync.who_pending)
+    sync.who_queue = collections.deque(
+        channel.refold() for channel in sync.who_queue)
+    bot.autojoin.refold()
+    # Its exact entries were lowered when the list was built
+    bot._nick_blocklist.update(bot._nick_blocklist.entries)
+
+
 @sopel.module.require_privmsg()
 @sopel.module.require_owner()
 @sopel.module.commands('useserviceauth')
@@ -137,29 +249,63 @@ def enable_service_auth(bot, trigger):
             'owner.')
 
 
-@sopel.module.event(events.ERR_NOCHANMODES)
+@sopel.module.event(events.ERR_NOCHANMODES, events.ERR_UNAVAILRESOURCE,
+                    events.ERR_CHANNELISFULL)
 @sopel.module.rule('.*')
 @sopel.module.priority('high')
+@sopel.module.thread(False)
 def retry_join(bot, trigger):
-    """Give NickServer enough time to identify on a +R channel.
+    """Try joining a channel again later, if it may work by then.
 
-    Give NickServ enough time to identify, and retry rejoining an
-    identified-only (+R) channel. Maximum of ten rejoin attempts.
+    ERR_NOCHANMODES is given for identified-only (+R) channels, before
+    NickServ has had time to identify the bot. The channel may also be full
+    for now, or unavailable after a netsplit. The channel is retried with a
+    growing delay, up to ten times (see :attr:`sopel.bot.Sopel.autojoin`),
+    if it's one of those the bot joins on connecting.
+    """
+    channel = Identifier(trigger.args[1])
+    if channel.is_nick():
+        # ERR_UNAVAILRESOURCE is also given for nicks
+        return
+    bot.autojoin.failed(channel)
 
+
+@sopel.module.event(events.ERR_LINKCHANNEL)
+@sopel.module.rule('.*')
+@sopel.module.priority('high')
+@sopel.module.thread(False)
+def forward_join(bot, trigger):
+    """Stop waiting on a channel which forwarded the bot to another one.
+
+    The ``JOIN`` which follows is for the channel forwarded to, so the one
+    asked for would otherwise be tried again, as if it had had no reply.
     """
-    channel = trigger.args[1]
-    if channel in bot.memory['retry_join'].keys():
-        bot.memory['retry_join'][channel] += 1
-        if bot.memory['retry_join'][channel] > 10:
-            LOGGER.warning('Failed to join %s after 10 attempts.', channel)
-            return
-    else:
-        bot.memory['retry_join'][channel] = 0
-        bot.join(channel)
+    if len(trigger.args) < 3:
         return
+    LOGGER.info('Forwarded from %s to %s.', trigger.args[1], trigger.args[2])
+    bot.autojoin.joined(trigger.args[1])
 
-    time.sleep(6)
-    bot.join(channel)
+
+@sopel.module.event(events.ERR_NOSUCHCHANNEL, events.ERR_TOOMANYCHANNELS,
+                    events.ERR_INVITEONLYCHAN, events.ERR_BANNEDFROMCHAN,
+                    events.ERR_BADCHANNELKEY, events.ERR_BADCHANMASK)
+@sopel.module.rule('.*')
+@sopel.module.priority('high')
+@sopel.module.thread(False)
+def fail_join(bot, trigger):
+    """Stop waiting on a channel which can't be joined."""
+    if len(trigger.args) > 2:
+        bot.autojoin.failed(trigger.args[1], retry=False)
+
+
+@sopel.module.event(events.RPL_TRYAGAIN)
+@sopel.module.rule('.*')
+@sopel.module.priority('high')
+@sopel.module.thread(False)
+def throttle_join(bot, trigger):
+    """Slow down joining, when the server says to try again later."""
+    if len(trigger.args) > 1 and trigger.args[1].upper() == 'JOIN':
+        bot.autojoin.throttled()
 
 
 @sopel.module.rule('(.*)')
@@ -168,32 +314,40 @@ def retry_join(bot, trigger):
 @sopel.module.thread(False)
 @sopel.module.unblockable
 def handle_names(bot, trigger):
-    """Handle NAMES response, happens when joining to channels."""
-    names = trigger.split()
+    """Collect a NAMES reply, which is applied once it's complete."""
+    # <client> <symbol> <channel> :<names>
+    if len(trigger.args) < 4:
+        return
+    names = _channel_sync(bot).names
+    channel = Identifier(trigger.args[2])
+    names.setdefault(channel, []).extend(trigger.args[3].split())
+
 
-    # TODO specific to one channel type. See issue 281.
-    channels = re.search(r'(#\S*)', trigger.raw)
-    if not channels:
+@sopel.module.rule('.*')
+@sopel.module.event(events.RPL_ENDOFNAMES)
+@sopel.module.priority('high')
+@sopel.module.thread(False)
+@sopel.module.unblockable
+def end_names(bot, trigger):
+    """Record the privileges from a complete NAMES reply, in one pass."""
+    channel = Identifier(trigger.args[1])
+    names = _channel_sync(bot).names.pop(channel, ())
+    if channel not in bot.channels:
+        # Some module asked for the names in a channel we aren't in
         return
-    channel = Identifier(channels.group(1))
-    if channel not in bot.privileges:
-        bot.privileges[channel] = dict()
-
-    # This could probably be made flexible in the future, but I don't think
-    # it'd be worth it.
-    mapping = {'+': sopel.module.VOICE,
-               '%': sopel.module.HALFOP,
-               '@': sopel.module.OP,
-               '&': sopel.module.ADMIN,
-               '~': sopel.module.OWNER}
 
+    prefixes = _privileges(bot)[1]
+    chars = ''.join(prefixes)
+    privileges = {}
     for name in names:
+        nick = name.lstrip(chars)
         priv = 0
-        for prefix, value in iteritems(mapping):
-            if prefix in name:
-                priv = priv | value
-        nick = Identifier(name.lstrip(''.join(mapping.keys())))
-        bot.privileges[channel][nick] = priv
+        # With multi-prefix, there is one for each privilege the user has
+        for prefix in name[:len(name) - len(nick)]:
+            priv |= prefixes[prefix]
+        # With userhost-in-names, the names are full hostmasks
+        privileges[Identifier(nick.partition('!')[0])] = priv
+    bot.channels[channel].privileges.update(privileges)
 
 
 @sopel.module.rule('(.*)')
@@ -205,44 +359,36 @@ def track_modes(bot, trigger):
     """Track usermode changes and keep our lists of ops up to date."""
     # Mode message format: <channel> *( ( "-" / "+" ) *<modes> *<modeparams> )
     channel = Identifier(trigger.args[0])
-    line = trigger.args[1:]
 
     # If the first character of where the mode is being set isn't a #
     # then it's a user mode, not a channel mode, so we'll ignore it.
-    if channel.is_nick():
+    if channel.is_nick() or channel not in bot.channels or (
+            len(trigger.args) < 2):
         return
-
-    mapping = {'v': sopel.module.VOICE,
-               'h': sopel.module.HALFOP,
-               'o': sopel.module.OP,
-               'a': sopel.module.ADMIN,
-               'q': sopel.module.OWNER}
-
-    modes = []
-    for arg in line:
-        if len(arg) == 0:
-            continue
-        if arg[0] in '+-':
-            # There was a comment claiming IRC allows e.g. MODE +aB-c foo, but
-            # I don't see it in any RFCs. Leaving in the extra parsing for now.
-            sign = ''
-            modes = []
-            for char in arg:
-                if char == '+' or char == '-':
-                    sign = char
-                else:
-                    modes.append(sign + char)
-        else:
-            arg = Identifier(arg)
-            for mode in modes:
-                priv = bot.privileges[channel].get(arg, 0)
-                value = mapping.get(mode[1])
-                if value is not None:
-                    if mode[0] == '+':
-                        priv = priv | value
-                    else:
-                        priv = priv & ~value
-                    bot.privileges[channel][arg] = priv
+    privileges = bot.channels[channel].privileges
+    mapping = _privileges(bot)[0]
+    list_modes, param_modes, set_param_modes, _ = bot.isupport.chanmodes
+
+    # Each mode which takes a parameter takes the next one, in order
+    params = iter(trigger.args[2:])
+    sign = '+'
+    for char in trigger.args[1]:
+        if char in '+-':
+            sign = char
+        elif char in mapping:
+            nick = next(params, None)
+            if nick is None:
+                break
+            nick = Identifier(nick)
+            priv = privileges.get(nick, 0)
+            if sign == '+':
+                priv = priv | mapping[char]
+            else:
+                priv = priv & ~mapping[char]
+            privileges[nick] = priv
+        elif (char in list_modes or char in param_modes or
+              (char in set_param_modes and sign == '+')):
+            next(params, None)
 
 
 @sopel.module.rule('.*')
@@ -272,16 +418,12 @@ def track_nicks(bot, trigger):
         bot.msg(bot.config.core.owner, privmsg)
         return
 
-    for channel in bot.privileges:
-        channel = Identifier(channel)
-        if old in bot.privileges[channel]:
-            value = bot.privileges[channel].pop(old)
-            bot.privileges[channel][new] = value
-
     for channel in bot.channels.values():
         channel.rename_user(old, new)
     if old in bot.users:
-        bot.users[new] = bot.users.pop(old)
+        user = bot.users.pop(old)
+        user.nick = new
+        bot.users[new] = user
 
 
 @sopel.module.rule('(.*)')
@@ -308,7 +450,6 @@ def track_kick(bot, trigger):
 
 def _remove_from_channel(bot, nick, channel):
     if nick == bot.nick:
-        bot.privileges.pop(channel, None)
         bot.channels.pop(channel, None)
 
         lost_users = []
@@ -319,13 +460,11 @@ def _remove_from_channel(bot, nick, channel):
         for nick_ in lost_users:
             bot.users.pop(nick_, None)
     else:
-        bot.privileges[channel].pop(nick, None)
-
-        user = bot.users.get(nick)
-        if user and channel in user.channels:
+        if channel in bot.channels:
             bot.channels[channel].clear_user(nick)
-            if not user.channels:
-                bot.users.pop(nick, None)
+        user = bot.users.get(nick)
+        if user is not None and not user.channels:
+            bot.users.pop(nick, None)
 
 
 def _whox_enabled(bot):
@@ -337,6 +476,50 @@ def _whox_enabled(bot):
 
 
 def _send_who(bot, channel):
+    """Queue a WHO for ``channel``, to be sent once few enough are pending."""
+    sync = _channel_sync(bot)
+    with sync.who_lock:
+        if channel not in sync.who_pending and channel not in sync.who_queue:
+            sync.who_queue.append(channel)
+        _send_queued_who(bot)
+
+
+def _send_queued_who(bot):
+    sync = _channel_sync(bot)
+    now = time.time()
+    with sync.who_lock:
+        for channel, sent in list(sync.who_pending.items()):
+            if now - sent > WHO_TIMEOUT:
+                LOGGER.warning('No reply to WHO for %s, giving up on it.',
+                               channel)
+                del sync.who_pending[channel]
+                _release_whox(channel)
+        while sync.who_queue and len(sync.who_pending) < MAX_PENDING_WHO:
+            channel = sync.who_queue.popleft()
+            if channel not in bot.channels:
+                # Parted before its turn came
+                continue
+            sync.who_pending[channel] = now
+            _write_who(bot, channel)
+
+
+def _release_whox(channel):
+    """Forget the WHOX tokens of the requests for ``channel``."""
+    for token, requested in list(who_reqs.items()):
+        if requested == channel:
+            who_reqs.pop(token, None)
+
+
+@sopel.module.interval(WHO_TIMEOUT / 4)
+@sopel.module.thread(False)
+def expire_who(bot):
+    """Give up on WHO requests which had no reply, and send the next ones."""
+    sync = bot.memory.get('channel_sync')
+    if sync is not None and sync.who_pending:
+        _send_queued_who(bot)
+
+
+def _write_who(bot, channel):
     if _whox_enabled(bot):
         # WHOX syntax, see http://faerion.sourceforge.net/doc/irc/whox.var
         # Needed for accounts in who replies. The random integer is a param
@@ -359,15 +542,14 @@ def _send_who(bot, channel):
 @sopel.module.thread(False)
 @sopel.module.unblockable
 def track_join(bot, trigger):
+    if trigger.nick == bot.nick:
+        bot.autojoin.joined(trigger.sender)
     if trigger.nick == bot.nick and trigger.sender not in bot.channels:
         bot.write(('TOPIC', trigger.sender))
 
-        bot.privileges[trigger.sender] = dict()
         bot.channels[trigger.sender] = Channel(trigger.sender)
         _send_who(bot, trigger.sender)
 
-    bot.privileges[trigger.sender][trigger.nick] = 0
-
     user = bot.users.get(trigger.nick)
     if user is None:
         user = User(trigger.nick, trigger.user, trigger.host)
@@ -386,8 +568,6 @@ def track_join(bot, trigger):
 @sopel.module.thread(False)
 @sopel.module.unblockable
 def track_quit(bot, trigger):
-    for chanprivs in bot.privileges.values():
-        chanprivs.pop(trigger.nick, None)
     for channel in bot.channels.values():
         channel.clear_user(trigger.nick)
     bot.users.pop(trigger.nick, None)
@@ -611,6 +791,7 @@ def blocks(bot, trigger):
             bot.reply(STRINGS['invalid'] % ("adding"))
             return
 
+        bot.reload_blocks()
         bot.reply(STRINGS['success_add'] % (text[3]))
 
     elif len(text) == 4 and text[1] == "del":
@@ -621,6 +802,7 @@ def blocks(bot, trigger):
             nicks.remove(Identifier(text[3]))
             bot.config.core.nick_blocks = [unicode(n) for n in nicks]
             bot.config.save()
+            bot.reload_blocks()
             bot.reply(STRINGS['success_del'] % (text[3]))
         elif text[2] == "hostmask":
             mask = text[3].lower()
@@ -630,6 +812,7 @@ def blocks(bot, trigger):
             masks.remove(mask)
             bot.config.core.host_blocks = [unicode(m) for m in masks]
             bot.config.save()
+            bot.reload_blocks()
             bot.reply(STRINGS['success_del'] % (text[3]))
         else:
             bot.reply(STRINGS['invalid'] % ("deleting"))
@@ -652,6 +835,7 @@ def account_notify(bot, trigger):
 @sopel.module.event(events.RPL_WHOSPCRPL)
 @sopel.module.rule('.*')
 @sopel.module.priority('high')
+@sopel.module.thread(False)
 @sopel.module.unblockable
 def recv_whox(bot, trigger):
     if len(trigger.args) < 2 or trigger.args[1] not in who_reqs:
@@ -661,41 +845,61 @@ def recv_whox(bot, trigger):
         return LOGGER.warning('While populating `bot.accounts` a WHO response was malformed.')
     _, _, channel, user, host, nick, status, account = trigger.args
     away = 'G' in status
-    _record_who(bot, channel, user, host, nick, account, away)
-
-
-def _record_who(bot, channel, user, host, nick, account=None, away=None):
-    nick = Identifier(nick)
-    channel = Identifier(channel)
-    if nick not in bot.users:
-        bot.users[nick] = User(nick, user, host)
-    user = bot.users[nick]
-    if account == '0':
-        user.account = None
-    else:
-        user.account = account
-    user.away = away
-    if channel not in bot.channels:
-        bot.channels[channel] = Channel(channel)
-    bot.channels[channel].add_user(user)
+    _channel_sync(bot).who.append(
+        (channel, user, host, nick, account, away))
+
+
+def _record_who(bot, replies):
+    users = bot.users
+    channels = bot.channels
+    for channel, user, host, nick, account, away in replies:
+        nick = Identifier(nick)
+        user_obj = users.get(nick)
+        channel = channels.get(Identifier(channel))
+        if channel is None:
+            # Some module asked about a channel (or a nick) we aren't in; only
+            # refresh what we know about users we already track
+            if user_obj is None:
+                continue
+        elif user_obj is None:
+            user_obj = users[nick] = User(nick, user, host)
+        if account == '0':
+            user_obj.account = None
+        else:
+            user_obj.account = account
+        user_obj.away = away
+        if channel is not None:
+            channel.add_user(user_obj)
 
 
 @sopel.module.event(events.RPL_WHOREPLY)
 @sopel.module.rule('.*')
 @sopel.module.priority('high')
+@sopel.module.thread(False)
 @sopel.module.unblockable
 def recv_who(bot, trigger):
     channel, user, host, _, nick, = trigger.args[1:6]
-    _record_who(bot, channel, user, host, nick)
+    _channel_sync(bot).who.append((channel, user, host, nick, None, None))
 
 
 @sopel.module.event(events.RPL_ENDOFWHO)
 @sopel.module.rule('.*')
 @sopel.module.priority('high')
+@sopel.module.thread(False)
 @sopel.module.unblockable
 def end_who(bot, trigger):
-    if _whox_enabled(bot):
-        who_reqs.pop(trigger.args[1], None)
+    """Record the replies to a WHO in one pass, and send the next one."""
+    sync = _channel_sync(bot)
+    # A server answers each WHO in full before the next, so everything
+    # collected so far is the reply to this one
+    replies, sync.who = sync.who, []
+    _record_who(bot, replies)
+
+    mask = Identifier(trigger.args[1])
+    _release_whox(mask)
+    with sync.who_lock:
+        sync.who_pending.pop(mask, None)
+        _send_queued_who(bot)
 
 
 @sopel.module.rule('.*')
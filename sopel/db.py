@@ -1,21 +1,73 @@
 # coding=utf-8
 from __future__ import unicode_literals, absolute_import, print_function, division
 
+import collections
+import contextlib
 import json
 import os.path
+import re
 import sys
 import sqlite3
+import threading
+import time
 
-from sopel.tools import Identifier
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+try:
+    import sqlalchemy
+except ImportError:
+    sqlalchemy = None
+
+from sopel.logger import get_logger
+from sopel.tools import CASEMAPPINGS, Identifier
 
 if sys.version_info.major >= 3:
     unicode = str
     basestring = str
+    _binary_types = (bytes, bytearray, memoryview)
+else:
+    _binary_types = (bytearray, type(sqlite3.Binary(b'')))
+
+LOGGER = get_logger(__name__)
+
+_MISSING = object()
+
+
+def _slug(name):
+    """Lower a nick or channel the way it's stored in the database.
+
+    Slugs are always lowered per ``rfc1459``, whatever the server's
+    ``CASEMAPPING``, so that rows stored on one network are found on another,
+    or after the casemapping changes."""
+    return CASEMAPPINGS['rfc1459'](unicode(name))
+
+
+# A quoted string or identifier, which is skipped, or a placeholder
+_placeholder_regex = re.compile(r"""'(?:[^']|'')*'|"(?:[^"]|"")*"|\?""")
+
+
+def _normalize(value):
+    """Return a value as read from the database, as text or a binary."""
+    if value is None:
+        return None
+    if isinstance(value, _binary_types):
+        return sqlite3.Binary(value)
+    # Tables from before the first migration give strings of digits back as
+    # numbers
+    return unicode(value)
 
 
 def _deserialize(value):
     if value is None:
         return None
+    if isinstance(value, _binary_types):
+        if msgpack is None:
+            raise ImportError('msgpack must be installed to read values '
+                              'which were stored with it.')
+        return msgpack.unpackb(bytes(value), raw=False)
     # sqlite likes to return ints for strings that look like ints, even though
     # the column type is string. That's how you do dynamic typing wrong.
     value = unicode(value)
@@ -28,43 +80,236 @@ def _deserialize(value):
     return value
 
 
-class SopelDB(object):
-    """*Availability: 5.0+*
+class _LRUCache(object):
+    """A mapping which keeps only the ``size`` most recently used items.
 
-    This defines an interface for basic, common operations on a sqlite
-    database. It simplifies those common operations, and allows direct access
-    to the database, wherever the user has configured it to be.
+    With a ``ttl``, items are also dropped that many seconds after they were
+    stored."""
 
-    When configured with a relative filename, it is assumed to be in the same
-    directory as the config."""
+    def __init__(self, size, ttl=None):
+        self.size = size
+        self.ttl = ttl
+        self._items = collections.OrderedDict()  # key to (value, stored)
 
-    def __init__(self, config):
-        path = config.core.db_filename
-        config_dir, config_file = os.path.split(config.filename)
-        config_name, _ = os.path.splitext(config_file)
-        if path is None:
-            path = os.path.join(config_dir, config_name + '.db')
-        path = os.path.expanduser(path)
-        if not os.path.isabs(path):
-            path = os.path.normpath(os.path.join(config_dir, path))
-        self.filename = path
-        self._create()
+    def __len__(self):
+        return len(self._items)
+
+    def get(self, key, default=None):
+        items = self._items
+        try:
+            value, stored = items.pop(key)
+        except KeyError:
+            return default
+        if self.ttl and time.time() - stored > self.ttl:
+            return default
+        items[key] = (value, stored)
+        return value
+
+    def __setitem__(self, key, value):
+        items = self._items
+        items.pop(key, None)
+        items[key] = (value, time.time() if self.ttl else None)
+        while len(items) > self.size:
+            items.popitem(last=False)
+
+    def pop(self, key):
+        self._items.pop(key, None)
+
+    def discard(self, match):
+        """Remove every item for which ``match(key, value)`` is true."""
+        for key in [key for key, (value, _) in self._items.items()
+                    if match(key, value)]:
+            del self._items[key]
+
+    def clear(self):
+        self._items.clear()
+
+
+def _convert_placeholders(sql, paramstyle):
+    """Rewrite ``sql``, written with ``?`` placeholders, for ``paramstyle``.
+
+    ``paramstyle`` is one of those defined by PEP 249. Question marks inside
+    quoted strings and identifiers are left alone."""
+    if paramstyle == 'qmark':
+        return sql
+    if paramstyle in ('format', 'pyformat'):
+        sql = sql.replace('%', '%%')
+    count = [0]
+
+    def replace(match):
+        if match.group(0) != '?':
+            return match.group(0)
+        count[0] += 1
+        if paramstyle == 'numeric':
+            return ':{}'.format(count[0])
+        if paramstyle == 'named':
+            return ':p{}'.format(count[0])
+        return '%s'
+    return _placeholder_regex.sub(replace, sql)
+
+
+def _convert_params(params, paramstyle):
+    if paramstyle == 'named':
+        return dict(('p{}'.format(i), value)
+                    for i, value in enumerate(params or (), 1))
+    return tuple(params or ())
+
+
+class _Result(object):
+    """The rows a query returned, kept after its connection was released."""
+
+    def __init__(self, cursor):
+        self.description = cursor.description
+        self.rowcount = cursor.rowcount
+        self.lastrowid = getattr(cursor, 'lastrowid', None)
+        rows = cursor.fetchall() if cursor.description else []
+        self._rows = collections.deque(rows)
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def fetchone(self):
+        return self._rows.popleft() if self._rows else None
+
+    def fetchmany(self, size=1):
+        return [self._rows.popleft() for _ in range(min(size, len(self._rows)))]
+
+    def fetchall(self):
+        rows = list(self._rows)
+        self._rows.clear()
+        return rows
+
+
+class _Connection(object):
+    """A DB-API connection which takes queries with ``?`` placeholders."""
+
+    def __init__(self, conn, paramstyle):
+        self.raw = conn
+        self.paramstyle = paramstyle
+
+    def execute(self, sql, params=()):
+        cursor = self.raw.cursor()
+        cursor.execute(_convert_placeholders(sql, self.paramstyle),
+                       _convert_params(params, self.paramstyle))
+        return cursor
+
+    def executemany(self, sql, rows):
+        cursor = self.raw.cursor()
+        cursor.executemany(_convert_placeholders(sql, self.paramstyle),
+                           [_convert_params(row, self.paramstyle)
+                            for row in rows])
+        return cursor
+
+    def commit(self):
+        self.raw.commit()
+
+    def rollback(self):
+        self.raw.rollback()
+
+    def close(self):
+        self.raw.close()
+
+
+class SQLiteBackend(object):
+    """Runs SopelDB's queries on an SQLite file, with the ``sqlite3`` module.
+
+    This is the default backend. A connection is kept open for each thread
+    which uses the database (until the thread ends, or the backend is
+    closed), and the file is put in WAL mode, so that readers
+    don't wait on the writer. Writers still wait on each other (for up to ten
+    seconds), so many busy bots shouldn't share one file."""
+
+    dialect = 'sqlite'
+    """The SQL dialect, as SQLAlchemy names it."""
+    nick_value_sql = 'INSERT OR REPLACE INTO nick_values VALUES (?, ?, ?)'
+    """Sets a nick value, from ``(nick_id, key, value)``."""
+    channel_value_sql = 'INSERT OR REPLACE INTO channel_values VALUES (?, ?, ?)'
+    """Sets a channel value, from ``(channel, key, value)``."""
+    integrity_error = sqlite3.IntegrityError
+    """What the driver raises when a unique constraint is broken."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._local = threading.local()
+        self._connections = {}  # thread to its connection
+        self._connections_lock = threading.Lock()
+
+    def get_uri(self):
+        return 'sqlite:///{}'.format(self.filename)
 
     def connect(self):
-        """Return a raw database connection object."""
         return sqlite3.connect(self.filename, timeout=10)
 
+    def connection(self):
+        """Return this thread's connection, opening it if needed.
+
+        It's in autocommit mode, so that each statement is committed on its
+        own, unless it's run inside :meth:`transaction`. Statements are
+        prepared once per connection, and reused from sqlite3's cache."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Only ever used from this thread, but may be closed from another
+            conn = sqlite3.connect(self.filename, timeout=10,
+                                   isolation_level=None,
+                                   check_same_thread=False,
+                                   cached_statements=256)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.depth = 0
+            with self._connections_lock:
+                # Threads come and go (one per call, with no worker pool), so
+                # close the connections of those which have ended
+                ended = [thread for thread in self._connections
+                         if not thread.is_alive()]
+                stale = [self._connections.pop(thread) for thread in ended]
+                self._connections[threading.current_thread()] = conn
+            for old in stale:
+                old.close()
+        return conn
+
+    def close(self):
+        with self._connections_lock:
+            connections, self._connections = self._connections, {}
+            self._local = threading.local()
+        for conn in connections.values():
+            conn.close()
+
+    def in_transaction(self):
+        return bool(getattr(self._local, 'depth', 0))
+
+    @contextlib.contextmanager
+    def transaction(self):
+        conn = self.connection()
+        local = self._local
+        if local.depth:
+            local.depth += 1
+            try:
+                yield conn
+            finally:
+                local.depth -= 1
+            return
+        # Take the write lock up front, rather than on the first write
+        conn.execute('BEGIN IMMEDIATE')
+        local.depth = 1
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        else:
+            conn.execute('COMMIT')
+        finally:
+            local.depth = 0
+
     def execute(self, *args, **kwargs):
-        """Execute an arbitrary SQL query against the database.
+        return self.connection().execute(*args, **kwargs)
 
-        Returns a cursor object, on which things like `.fetchall()` can be
-        called per PEP 249."""
-        with self.connect() as conn:
-            cur = conn.cursor()
-            return cur.execute(*args, **kwargs)
+    def new_nick_id(self, conn):
+        """Add a row to ``nick_ids`` with ``conn``, and return its ID."""
+        return conn.execute('INSERT INTO nick_ids VALUES (NULL)').lastrowid
 
-    def _create(self):
-        """Create the basic database structure."""
+    def create_tables(self):
         self.execute(
             'CREATE TABLE IF NOT EXISTS nick_ids (nick_id INTEGER PRIMARY KEY AUTOINCREMENT)'
         )
@@ -85,9 +330,521 @@ class SopelDB(object):
             'PRIMARY KEY (channel, key))'
         )
 
+
+class SQLAlchemyBackend(object):
+    """Runs SopelDB's queries on a database SQLAlchemy connects to.
+
+    It's used when the ``db_url`` setting is given, and needs SQLAlchemy and
+    the database's driver to be installed. PostgreSQL is supported, so that
+    several bots can share one database, and so is SQLite (an in-memory
+    database, from ``sqlite://``, is handy for tests).
+
+    Connections come from the engine's pool: one is checked out for each
+    query, or for the length of a transaction, and is given back as soon as
+    it's done. Queries are written with ``?`` placeholders, as for SQLite, and
+    are rewritten for the driver."""
+
+    dialects = ('postgresql', 'sqlite')
+    """The databases whose SQL SopelDB's queries are written in."""
+
+    def __init__(self, url, pool_size=10):
+        if sqlalchemy is None:
+            raise ImportError('SQLAlchemy must be installed to use db_url.')
+        url = sqlalchemy.engine.url.make_url(url)
+        kwargs = {'pool_pre_ping': True}
+        if url.get_backend_name() == 'sqlite':
+            if url.database in (None, '', ':memory:'):
+                # Otherwise, each connection would get a database of its own
+                kwargs['poolclass'] = sqlalchemy.pool.StaticPool
+                kwargs['connect_args'] = {'check_same_thread': False}
+        else:
+            kwargs['pool_size'] = pool_size
+        self.engine = sqlalchemy.create_engine(url, **kwargs)
+        dialect = self.engine.dialect
+        if dialect.name not in self.dialects:
+            raise ValueError('Unsupported database: {}'.format(dialect.name))
+        self.dialect = dialect.name
+        self.paramstyle = dialect.paramstyle
+        dbapi = getattr(dialect, 'loaded_dbapi', None) or dialect.dbapi
+        self.integrity_error = dbapi.IntegrityError
+        self.nick_value_sql = (
+            'INSERT INTO nick_values VALUES (?, ?, ?) '
+            'ON CONFLICT (nick_id, key) DO UPDATE SET value = excluded.value')
+        self.channel_value_sql = (
+            'INSERT INTO channel_values VALUES (?, ?, ?) '
+            'ON CONFLICT (channel, key) DO UPDATE SET value = excluded.value')
+        self._local = threading.local()
+
+    def get_uri(self):
+        url = self.engine.url
+        try:
+            return url.render_as_string(hide_password=False)
+        except AttributeError:
+            return str(url)
+
+    def connect(self):
+        return self.engine.raw_connection()
+
+    def close(self):
+        self.engine.dispose()
+
+    def in_transaction(self):
+        return getattr(self._local, 'conn', None) is not None
+
+    @contextlib.contextmanager
+    def transaction(self):
+        local = self._local
+        if getattr(local, 'conn', None) is not None:
+            yield local.conn
+            return
+        conn = _Connection(self.engine.raw_connection(), self.paramstyle)
+        local.conn = conn
+        try:
+            yield conn
+        except BaseException:
+            conn.rollback()
+            raise
+        else:
+            conn.commit()
+        finally:
+            local.conn = None
+            # Back to the pool
+            conn.close()
+
+    def execute(self, sql, params=()):
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None:
+            return conn.execute(sql, params)
+        with self.transaction() as conn:
+            return _Result(conn.execute(sql, params))
+
+    def new_nick_id(self, conn):
+        if self.dialect == 'postgresql':
+            return conn.execute('INSERT INTO nick_ids DEFAULT VALUES '
+                                'RETURNING nick_id').fetchone()[0]
+        return conn.execute('INSERT INTO nick_ids DEFAULT VALUES').lastrowid
+
+    def create_tables(self):
+        types = sqlalchemy.types
+        metadata = sqlalchemy.MetaData()
+        sqlalchemy.Table(
+            'nick_ids', metadata,
+            sqlalchemy.Column('nick_id', types.Integer, primary_key=True),
+            sqlite_autoincrement=True)
+        sqlalchemy.Table(
+            'nicknames', metadata,
+            sqlalchemy.Column('nick_id', types.Integer,
+                              sqlalchemy.ForeignKey('nick_ids.nick_id')),
+            sqlalchemy.Column('slug', types.String(255), primary_key=True),
+            sqlalchemy.Column('canonical', types.String(255)))
+        sqlalchemy.Table(
+            'nick_values', metadata,
+            sqlalchemy.Column('nick_id', types.Integer,
+                              sqlalchemy.ForeignKey('nick_ids.nick_id'),
+                              primary_key=True),
+            sqlalchemy.Column('key', types.String(255), primary_key=True),
+            sqlalchemy.Column('value', types.Text))
+        sqlalchemy.Table(
+            'channel_values', metadata,
+            sqlalchemy.Column('channel', types.String(255), primary_key=True),
+            sqlalchemy.Column('key', types.String(255), primary_key=True),
+            sqlalchemy.Column('value', types.Text))
+        metadata.create_all(self.engine)
+
+
+def _retype_columns(db, conn):
+    """Give SQLite's text columns TEXT affinity, and values none at all.
+
+    They were declared as ``STRING``, which SQLite takes for NUMERIC, so
+    strings of digits were stored (and given back) as numbers. Values are
+    declared as ``BLOB``, so that they're kept as they're given, text or
+    binary."""
+    if db._backend.dialect != 'sqlite':
+        return
+    tables = (
+        ('nicknames',
+         'nick_id INTEGER REFERENCES nick_ids, slug TEXT PRIMARY KEY, '
+         'canonical TEXT',
+         'nick_id, CAST(slug AS TEXT), CAST(canonical AS TEXT)'),
+        ('nick_values',
+         'nick_id INTEGER REFERENCES nick_ids(nick_id), key TEXT, '
+         'value BLOB, PRIMARY KEY (nick_id, key)',
+         'nick_id, CAST(key AS TEXT), CAST(value AS TEXT)'),
+        ('channel_values',
+         'channel TEXT, key TEXT, value BLOB, PRIMARY KEY (channel, key)',
+         'CAST(channel AS TEXT), CAST(key AS TEXT), CAST(value AS TEXT)'),
+    )
+    for table, columns, select in tables:
+        conn.execute('CREATE TABLE {}_new ({})'.format(table, columns))
+        conn.execute('INSERT INTO {0}_new SELECT {1} FROM {0}'.format(
+            table, select))
+        conn.execute('DROP TABLE {}'.format(table))
+        conn.execute('ALTER TABLE {0}_new RENAME TO {0}'.format(table))
+
+
+def _index_keys(db, conn):
+    """Index values by key, for queries across all nicks or channels."""
+    conn.execute('CREATE INDEX IF NOT EXISTS nick_values_key '
+                 'ON nick_values (key, nick_id)')
+    conn.execute('CREATE INDEX IF NOT EXISTS channel_values_key '
+                 'ON channel_values (key, channel)')
+
+
+MIGRATIONS = [_retype_columns, _index_keys]
+"""The changes made to the schema since it was first created, in order.
+
+Each is called with the :class:`SopelDB` and the connection, in the same
+transaction as the others. The ``schema_version`` table records how many have
+been made; a new database starts with the first schema, and has them all made
+straight away. New migrations must only ever be added to the end."""
+
+
+class SopelDB(object):
+    """*Availability: 5.0+*
+
+    This defines an interface for basic, common operations on a sqlite
+    database. It simplifies those common operations, and allows direct access
+    to the database, wherever the user has configured it to be.
+
+    When configured with a relative filename, it is assumed to be in the same
+    directory as the config.
+
+    Nick and channel values are cached in memory (see ``db_cache_size``), so
+    reading one again doesn't touch the database, and neither does setting it
+    to the value it already has. Nick IDs are cached the same way. The cache
+    only knows about changes made through SopelDB's own methods; modules
+    which change ``nicknames``, ``nick_values`` or ``channel_values`` with
+    raw queries should call :meth:`clear_cache`.
+
+    So the cache assumes that this bot is the only one writing to the
+    database. Bots sharing one (through ``db_url``, or the same
+    ``db_filename``) each keep their own copy, and don't see each other's
+    changes until it's dropped: caching is off by default with ``db_url``,
+    and ``db_cache_ttl`` limits how long a cached item is trusted."""
+
+    def __init__(self, config):
+        if config.core.db_url:
+            self.filename = None
+            self._backend = SQLAlchemyBackend(config.core.db_url,
+                                              config.core.db_pool_size)
+        else:
+            path = config.core.db_filename
+            config_dir, config_file = os.path.split(config.filename)
+            config_name, _ = os.path.splitext(config_file)
+            if path is None:
+                path = os.path.join(config_dir, config_name + '.db')
+            path = os.path.expanduser(path)
+            if not os.path.isabs(path):
+                path = os.path.normpath(os.path.join(config_dir, path))
+            self.filename = path
+            self._backend = SQLiteBackend(path)
+        self._local = threading.local()
+        self.write_behind = config.core.db_cache_mode == 'write-behind'
+        self.flush_interval = config.core.db_flush_interval
+        cache_size = config.core.db_cache_size
+        if cache_size is None:
+            # Another bot may well be writing to a database server too
+            cache_size = 0 if config.core.db_url else 10000
+        cache_ttl = config.core.db_cache_ttl
+        self._cache = _LRUCache(cache_size, cache_ttl)
+        self._nick_ids = _LRUCache(cache_size, cache_ttl)
+        self._cache_lock = threading.Lock()
+        # Bumped on every change, so that a value read from the database while
+        # something else is written isn't cached
+        self._cache_version = 0
+        self._dirty = {}
+        self._flushing = {}
+        self._flush_lock = threading.RLock()
+        self._flush_timer = None
+        self.page_size = 500
+        """How many rows the bulk methods ask the database for at once."""
+        self.value_encoding = config.core.db_value_encoding
+        if self.value_encoding == 'msgpack':
+            if msgpack is None:
+                raise ImportError('msgpack must be installed to use it for '
+                                  'db_value_encoding.')
+            if self._backend.dialect != 'sqlite':
+                raise ValueError('msgpack values can only be stored in SQLite')
+        self._backend.create_tables()
+        self._migrate()
+
+    def _migrate(self):
+        """Bring the schema up to date, by making the :data:`MIGRATIONS`."""
+        with self.transaction() as conn:
+            conn.execute('CREATE TABLE IF NOT EXISTS schema_version '
+                         '(version INTEGER NOT NULL)')
+            row = conn.execute('SELECT version FROM schema_version').fetchone()
+            if row is None:
+                conn.execute('INSERT INTO schema_version VALUES (0)')
+            version = row[0] if row is not None else 0
+            if version > len(MIGRATIONS):
+                LOGGER.warning('The database schema is version %d, which is '
+                               'newer than this version of Sopel knows.',
+                               version)
+            for number, migration in enumerate(MIGRATIONS[version:],
+                                               version + 1):
+                LOGGER.info('Updating the database schema to version %d.',
+                            number)
+                migration(self, conn)
+                conn.execute('UPDATE schema_version SET version = ?',
+                             [number])
+
+    def _serialize(self, value):
+        if self.value_encoding == 'msgpack':
+            return sqlite3.Binary(msgpack.packb(value, use_bin_type=True))
+        return json.dumps(value, ensure_ascii=False)
+
+    def connect(self):
+        """Return a raw database connection object.
+
+        This is a new connection, which the caller must close. SopelDB's own
+        queries go through connections it manages itself instead."""
+        return self._backend.connect()
+
+    def close(self):
+        """Close the connections which SopelDB has open.
+
+        Changes waiting to be written in ``write-behind`` mode are written
+        first. The connections are opened again as needed, so this is safe to
+        call at any point where no transaction is in progress."""
+        self.flush()
+        self._backend.close()
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Group the queries made in a ``with`` block into one transaction.
+
+        Everything SopelDB does in the block (on this thread) is committed at
+        once at its end, or rolled back if it raises. Transactions may be
+        nested, in which case only the outermost one commits. The connection
+        is given as the ``as`` target, for raw queries::
+
+            with bot.db.transaction() as conn:
+                bot.db.set_nick_value(nick, 'foo', 'bar')
+                conn.execute('DELETE FROM my_table WHERE nick = ?', [nick])
+        """
+        outermost = not self._backend.in_transaction()
+        if outermost:
+            self._local.invalidate = []
+        try:
+            with self._backend.transaction() as conn:
+                yield conn
+        finally:
+            if outermost:
+                # Other threads may have cached what they read before the
+                # commit
+                for values, nicks in self._local.invalidate:
+                    self._invalidate(values, nicks)
+                self._local.invalidate = []
+
+    def execute(self, *args, **kwargs):
+        """Execute an arbitrary SQL query against the database.
+
+        Returns a cursor object, on which things like `.fetchall()` can be
+        called per PEP 249. Placeholders are written as ``?``, whichever
+        database is used."""
+        return self._backend.execute(*args, **kwargs)
+
+    # CACHE FUNCTIONS
+
+    def _in_transaction(self):
+        return self._backend.in_transaction()
+
+    def _cached(self, cache_key):
+        """Return the cached value for ``cache_key``, or ``_MISSING``.
+
+        The cache lock must be held."""
+        value = self._dirty.get(cache_key, _MISSING)
+        if value is _MISSING:
+            value = self._flushing.get(cache_key, _MISSING)
+        if value is _MISSING:
+            value = self._cache.get(cache_key, _MISSING)
+        return value
+
+    def _read_value(self, cache_key, sql, params):
+        """Return the serialized value for ``cache_key``, caching it."""
+        with self._cache_lock:
+            value = self._cached(cache_key)
+            version = self._cache_version
+        if value is not _MISSING:
+            return value
+        row = self.execute(sql, params).fetchone()
+        value = _normalize(row[0]) if row is not None else None
+        self._fill(self._cache, cache_key, value, version)
+        return value
+
+    def _read_many(self, cache, keys, query):
+        """Return a dict of the values for ``keys`` in ``cache``.
+
+        Those which aren't cached are looked up with ``query``, which is
+        called with lists of at most :attr:`page_size` keys, and returns
+        ``(key, value)`` pairs for those it finds; the others are ``None``."""
+        with self._cache_lock:
+            if cache is self._cache:
+                # Including the changes which are waiting to be written
+                found = dict((key, self._cached(key)) for key in keys)
+            else:
+                found = dict((key, cache.get(key, _MISSING)) for key in keys)
+            version = self._cache_version
+        missing = [key for key, value in found.items() if value is _MISSING]
+        for start in range(0, len(missing), self.page_size):
+            page = missing[start:start + self.page_size]
+            found.update((key, None) for key in page)
+            found.update(query(page))
+        if missing and not self._in_transaction():
+            with self._cache_lock:
+                if self._cache_version == version:
+                    for key in missing:
+                        cache[key] = found[key]
+        return found
+
+    def _write_values(self, sql, values):
+        """Store the serialized ``values``, a dict keyed by cache key.
+
+        ``sql`` is the backend's ``nick_value_sql`` or ``channel_value_sql``,
+        to match the keys. Values which haven't changed aren't written."""
+        with self._cache_lock:
+            changed = dict((key, value) for key, value in values.items()
+                           if self._cached(key) != value)
+            if not changed:
+                return
+            if self.write_behind:
+                self._defer(changed)
+                return
+            for key in changed:
+                self._cache.pop(key)
+            self._cache_version += 1
+            version = self._cache_version
+        in_transaction = self._in_transaction()
+        written = False
+        try:
+            with self.transaction() as conn:
+                conn.executemany(sql, [
+                    (target, key, value)
+                    for (_, target, key), value in changed.items()])
+            written = True
+        finally:
+            with self._cache_lock:
+                if (written and not in_transaction and
+                        self._cache_version == version):
+                    for key, value in changed.items():
+                        self._cache[key] = value
+                self._cache_version += 1
+        if in_transaction:
+            self._local.invalidate.append(
+                (lambda key, value: key in changed, None))
+
+    def _defer(self, values):
+        """Queue ``values`` to be written by :meth:`flush`.
+
+        The cache lock must be held."""
+        for key, value in values.items():
+            self._cache[key] = value
+            self._dirty[key] = value
+        if self._flush_timer is None:
+            self._flush_timer = threading.Timer(self.flush_interval,
+                                                self._flush_later)
+            self._flush_timer.daemon = True
+            self._flush_timer.start()
+
+    def _flush_later(self):
+        try:
+            self.flush()
+        except Exception:
+            LOGGER.exception('Could not write pending changes to the database.')
+
+    def _fill(self, cache, key, value, version, replace=True):
+        """Cache ``value``, unless the cache has changed since ``version``.
+
+        Without ``replace``, a value cached for ``key`` meanwhile is kept."""
+        # Inside a transaction, it may be a change which is rolled back
+        if self._in_transaction():
+            return
+        with self._cache_lock:
+            if self._cache_version != version:
+                return
+            if replace or cache.get(key, _MISSING) is _MISSING:
+                cache[key] = value
+
+    def _cache_nick_id(self, slug, nick_id):
+        """Cache the ID of a nick (or alias) which has just been added.
+
+        This is done for the one slug, rather than with :meth:`_invalidate`,
+        which would go through the whole cache."""
+        if self._in_transaction():
+            # It's rolled back if the transaction is; it's cached once it's
+            # committed and read again
+            with self._cache_lock:
+                self._nick_ids.pop(slug)
+            self._local.invalidate.append(
+                (None, lambda cached, _: cached == slug))
+            return
+        with self._cache_lock:
+            self._nick_ids[slug] = nick_id
+
+    def _invalidate(self, values=None, nicks=None):
+        """Drop cached items which match.
+
+        ``values`` is called with each cached value's key (a tuple of
+        ``'nick'`` and nick ID or ``'channel'`` and channel, then the value's
+        key) and its serialized value. ``nicks`` is called with each cached
+        slug and its nick ID (``None`` for unknown nicks)."""
+        with self._cache_lock:
+            if values is not None:
+                self._cache.discard(values)
+            if nicks is not None:
+                self._nick_ids.discard(nicks)
+            self._cache_version += 1
+        if self._in_transaction():
+            self._local.invalidate.append((values, nicks))
+
+    def flush(self):
+        """Write the changes waiting in ``write-behind`` mode to the database.
+
+        This is done every ``db_flush_interval`` seconds, and when the
+        database is closed, so it's only needed before reading the values
+        with raw queries. All of them are written in one transaction."""
+        with self._flush_lock:
+            with self._cache_lock:
+                if self._flush_timer is not None:
+                    self._flush_timer.cancel()
+                    self._flush_timer = None
+                pending, self._dirty = self._dirty, {}
+                self._flushing = pending
+            if not pending:
+                return
+            try:
+                with self.transaction() as conn:
+                    conn.executemany(self._backend.nick_value_sql, [
+                        (target, key, value)
+                        for (kind, target, key), value in pending.items()
+                        if kind == 'nick'])
+                    conn.executemany(self._backend.channel_value_sql, [
+                        (target, key, value)
+                        for (kind, target, key), value in pending.items()
+                        if kind == 'channel'])
+            except BaseException:
+                with self._cache_lock:
+                    # Keep them for the next try, unless they've changed since
+                    for key, value in pending.items():
+                        self._dirty.setdefault(key, value)
+                    self._flushing = {}
+                    if self._dirty:
+                        self._defer({})
+                raise
+            with self._cache_lock:
+                self._flushing = {}
+
+    def clear_cache(self):
+        """Forget the cached nick IDs, and nick and channel values.
+
+        Changes waiting to be written are written first."""
+        self.flush()
+        self._invalidate(lambda key, value: True, lambda slug, nick_id: True)
+
     def get_uri(self):
         """Returns a URL for the database, usable to connect with SQLAlchemy."""
-        return 'sqlite:///{}'.format(self.filename)
+        return self._backend.get_uri()
 
     # NICK FUNCTIONS
 
@@ -97,24 +854,36 @@ class SopelDB(object):
         This identifier is unique to a user, and shared across all of that
         user's aliases. If create is True, a new ID will be created if one does
         not already exist"""
-        slug = nick.lower()
-        nick_id = self.execute('SELECT nick_id from nicknames where slug = ?',
-                               [slug]).fetchone()
-        if nick_id is None:
-            if not create:
-                raise ValueError('No ID exists for the given nick')
-            with self.connect() as conn:
-                cur = conn.cursor()
-                cur.execute('INSERT INTO nick_ids VALUES (NULL)')
-                nick_id = cur.execute('SELECT last_insert_rowid()').fetchone()[0]
-                cur.execute(
-                    'INSERT INTO nicknames (nick_id, slug, canonical) VALUES '
-                    '(?, ?, ?)',
+        slug = _slug(nick)
+        sql = 'SELECT nick_id from nicknames where slug = ?'
+        with self._cache_lock:
+            nick_id = self._nick_ids.get(slug, _MISSING)
+            version = self._cache_version
+        if nick_id is _MISSING:
+            row = self.execute(sql, [slug]).fetchone()
+            nick_id = row[0] if row is not None else None
+            # Unknown nicks are cached too, as None, unless it's been
+            # created (and cached) since
+            self._fill(self._nick_ids, slug, nick_id, version, replace=False)
+        if nick_id is not None:
+            return nick_id
+        if not create:
+            raise ValueError('No ID exists for the given nick')
+        with self.transaction() as conn:
+            # Another thread may have created it since we looked
+            row = conn.execute(sql, [slug]).fetchone()
+            if row is None:
+                nick_id = self._backend.new_nick_id(conn)
+                conn.execute(
+                    'INSERT INTO nicknames (nick_id, slug, canonical) '
+                    'VALUES (?, ?, ?)',
                     [nick_id, slug, nick]
                 )
-            nick_id = self.execute('SELECT nick_id from nicknames where slug = ?',
-                                   [slug]).fetchone()
-        return nick_id[0]
+            else:
+                nick_id = row[0]
+        # Replace the None cached for it as an unknown nick
+        self._cache_nick_id(slug, nick_id)
+        return nick_id
 
     def alias_nick(self, nick, alias):
         """Create an alias for a nick.
@@ -125,32 +894,131 @@ class SopelDB(object):
         alias = Identifier(alias)
         nick_id = self.get_nick_id(nick)
         sql = 'INSERT INTO nicknames (nick_id, slug, canonical) VALUES (?, ?, ?)'
-        values = [nick_id, alias.lower(), alias]
+        slug = _slug(alias)
+        values = [nick_id, slug, alias]
         try:
             self.execute(sql, values)
-        except sqlite3.IntegrityError:
+        except self._backend.integrity_error:
             raise ValueError('Alias already exists.')
+        self._cache_nick_id(slug, nick_id)
 
     def set_nick_value(self, nick, key, value):
         """Sets the value for a given key to be associated with the nick."""
         nick = Identifier(nick)
-        value = json.dumps(value, ensure_ascii=False)
+        value = self._serialize(value)
+        nick_id = self.get_nick_id(nick)
+        self._write_values(self._backend.nick_value_sql,
+                           {('nick', nick_id, key): value})
+
+    def set_nick_values(self, nick, values):
+        """Sets several keys for the nick at once, from the dict ``values``.
+
+        This is a single transaction, so it's much faster than setting each
+        key in turn."""
+        nick = Identifier(nick)
         nick_id = self.get_nick_id(nick)
-        self.execute('INSERT OR REPLACE INTO nick_values VALUES (?, ?, ?)',
-                     [nick_id, key, value])
+        self._write_values(self._backend.nick_value_sql, dict(
+            (('nick', nick_id, key), self._serialize(value))
+            for key, value in values.items()))
 
     def get_nick_value(self, nick, key):
         """Retrieves the value for a given key associated with a nick."""
         nick = Identifier(nick)
-        result = self.execute(
-            'SELECT value FROM nicknames JOIN nick_values '
-            'ON nicknames.nick_id = nick_values.nick_id '
-            'WHERE slug = ? AND key = ?',
-            [nick.lower(), key]
-        ).fetchone()
-        if result is not None:
-            result = result[0]
-        return _deserialize(result)
+        try:
+            nick_id = self.get_nick_id(nick, False)
+        except ValueError:
+            return None
+        return _deserialize(self._read_value(
+            ('nick', nick_id, key),
+            'SELECT value FROM nick_values WHERE nick_id = ? AND key = ?',
+            [nick_id, key]))
+
+    def get_nick_values(self, nick, keys):
+        """Return a dict of the values of ``keys`` for the nick.
+
+        Keys which aren't set are ``None``. This makes at most one query,
+        where calling :meth:`get_nick_value` for each key would make one each.
+        """
+        keys = list(keys)
+        try:
+            nick_id = self.get_nick_id(Identifier(nick), False)
+        except ValueError:
+            return dict((key, None) for key in keys)
+
+        def query(cache_keys):
+            rows = self.execute(
+                'SELECT key, value FROM nick_values '
+                'WHERE nick_id = ? AND key IN ({})'.format(
+                    ', '.join('?' * len(cache_keys))),
+                [nick_id] + [cache_key[2] for cache_key in cache_keys])
+            return [(('nick', nick_id, key), _normalize(value))
+                    for key, value in rows]
+        found = self._read_many(
+            self._cache, [('nick', nick_id, key) for key in keys], query)
+        return dict((key, _deserialize(found['nick', nick_id, key]))
+                    for key in keys)
+
+    def get_many(self, nicks, key):
+        """Return a dict of the value of ``key`` for each of ``nicks``.
+
+        It's keyed by :class:`~sopel.tools.Identifier`, and nicks which don't
+        have the key set are ``None``. The nicks' IDs and values are looked
+        up :attr:`page_size` at a time, rather than one by one."""
+        nicks = [Identifier(nick) for nick in nicks]
+
+        def query_ids(slugs):
+            rows = self.execute(
+                'SELECT slug, nick_id FROM nicknames WHERE slug IN ({})'.format(
+                    ', '.join('?' * len(slugs))), slugs)
+            return list(rows)
+        nick_ids = self._read_many(
+            self._nick_ids, set(_slug(nick) for nick in nicks), query_ids)
+
+        def query_values(cache_keys):
+            rows = self.execute(
+                'SELECT nick_id, value FROM nick_values '
+                'WHERE key = ? AND nick_id IN ({})'.format(
+                    ', '.join('?' * len(cache_keys))),
+                [key] + [cache_key[1] for cache_key in cache_keys])
+            return [(('nick', nick_id, key), _normalize(value))
+                    for nick_id, value in rows]
+        found = self._read_many(
+            self._cache,
+            set(('nick', nick_id, key) for nick_id in nick_ids.values()
+                if nick_id is not None),
+            query_values)
+
+        values = {}
+        for nick in nicks:
+            nick_id = nick_ids[_slug(nick)]
+            values[nick] = (None if nick_id is None
+                            else _deserialize(found['nick', nick_id, key]))
+        return values
+
+    def iter_nick_values(self, key, page_size=None):
+        """Yield ``(nick, value)`` for each nick which has ``key`` set.
+
+        Each alias of a nick is given, in order of their lowercased form. The
+        values are read ``page_size`` (by default :attr:`page_size`) at a
+        time, so that all of them are never in memory at once. No transaction
+        is held open between pages, so changes made while iterating may or
+        may not be seen."""
+        page_size = page_size or self.page_size
+        self.flush()
+        last = ''
+        while True:
+            rows = self.execute(
+                'SELECT nicknames.slug, nicknames.canonical, nick_values.value '
+                'FROM nicknames JOIN nick_values '
+                'ON nicknames.nick_id = nick_values.nick_id '
+                'WHERE nick_values.key = ? AND nicknames.slug > ? '
+                'ORDER BY nicknames.slug LIMIT ?',
+                [key, last, page_size]).fetchall()
+            for slug, canonical, value in rows:
+                yield Identifier(canonical), _deserialize(_normalize(value))
+            if len(rows) < page_size:
+                return
+            last = rows[-1][0]
 
     def unalias_nick(self, alias):
         """Removes an alias.
@@ -164,14 +1032,26 @@ class SopelDB(object):
                              [nick_id]).fetchone()[0]
         if count <= 1:
             raise ValueError('Given alias is the only entry in its group.')
-        self.execute('DELETE FROM nicknames WHERE slug = ?', [alias.lower()])
+        slug = _slug(alias)
+        self.execute('DELETE FROM nicknames WHERE slug = ?', [slug])
+        self._invalidate(nicks=lambda cached, _: cached == slug)
 
     def delete_nick_group(self, nick):
         """Removes a nickname, and all associated aliases and settings."""
         nick = Identifier(nick)
         nick_id = self.get_nick_id(nick, False)
-        self.execute('DELETE FROM nicknames WHERE nick_id = ?', [nick_id])
-        self.execute('DELETE FROM nick_values WHERE nick_id = ?', [nick_id])
+        # Pending changes are written first, so that they can't bring the
+        # deleted values back
+        with self._flush_lock:
+            self.flush()
+            with self.transaction():
+                self.execute('DELETE FROM nicknames WHERE nick_id = ?',
+                             [nick_id])
+                self.execute('DELETE FROM nick_values WHERE nick_id = ?',
+                             [nick_id])
+            self._invalidate(
+                lambda cache_key, _: cache_key[:2] == ('nick', nick_id),
+                lambda _, cached_id: cached_id == nick_id)
 
     def merge_nick_groups(self, first_nick, second_nick):
         """Merges the nick groups for the specified nicks.
@@ -184,34 +1064,62 @@ class SopelDB(object):
         Note that merging of data only applies to the native key-value store.
         If modules define their own tables which rely on the nick table, they
         will need to have their merging done separately."""
-        first_id = self.get_nick_id(Identifier(first_nick))
-        second_id = self.get_nick_id(Identifier(second_nick))
-        self.execute(
-            'UPDATE OR IGNORE nick_values SET nick_id = ? WHERE nick_id = ?',
-            [first_id, second_id])
-        self.execute('DELETE FROM nick_values WHERE nick_id = ?', [second_id])
-        self.execute('UPDATE nicknames SET nick_id = ? WHERE nick_id = ?',
-                     [first_id, second_id])
+        with self._flush_lock:
+            self.flush()
+            with self.transaction():
+                first_id = self.get_nick_id(Identifier(first_nick))
+                second_id = self.get_nick_id(Identifier(second_nick))
+                # The first nick's values win
+                self.execute(
+                    'DELETE FROM nick_values WHERE nick_id = ? AND key IN '
+                    '(SELECT key FROM nick_values WHERE nick_id = ?)',
+                    [second_id, first_id])
+                self.execute(
+                    'UPDATE nick_values SET nick_id = ? WHERE nick_id = ?',
+                    [first_id, second_id])
+                self.execute(
+                    'UPDATE nicknames SET nick_id = ? WHERE nick_id = ?',
+                    [first_id, second_id])
+            self._invalidate(
+                lambda cache_key, _: (cache_key[0] == 'nick' and
+                                      cache_key[1] in (first_id, second_id)),
+                lambda _, cached_id: cached_id == second_id)
 
     # CHANNEL FUNCTIONS
 
     def set_channel_value(self, channel, key, value):
         """Sets the value for a given key to be associated with the channel."""
-        channel = Identifier(channel).lower()
-        value = json.dumps(value, ensure_ascii=False)
-        self.execute('INSERT OR REPLACE INTO channel_values VALUES (?, ?, ?)',
-                     [channel, key, value])
+        channel = _slug(channel)
+        value = self._serialize(value)
+        self._write_values(self._backend.channel_value_sql,
+                           {('channel', channel, key): value})
 
     def get_channel_value(self, channel, key):
         """Retrieves the value for a given key associated with a channel."""
-        channel = Identifier(channel).lower()
-        result = self.execute(
+        channel = _slug(channel)
+        return _deserialize(self._read_value(
+            ('channel', channel, key),
             'SELECT value FROM channel_values WHERE channel = ? AND key = ?',
-            [channel, key]
-        ).fetchone()
-        if result is not None:
-            result = result[0]
-        return _deserialize(result)
+            [channel, key]))
+
+    def iter_channel_values(self, key, page_size=None):
+        """Yield ``(channel, value)`` for each channel which has ``key`` set.
+
+        Channels are given lowercased, in order. As with
+        :meth:`iter_nick_values`, they're read ``page_size`` at a time."""
+        page_size = page_size or self.page_size
+        self.flush()
+        last = ''
+        while True:
+            rows = self.execute(
+                'SELECT channel, value FROM channel_values '
+                'WHERE key = ? AND channel > ? ORDER BY channel LIMIT ?',
+                [key, last, page_size]).fetchall()
+            for channel, value in rows:
+                yield Identifier(channel), _deserialize(_normalize(value))
+            if len(rows) < page_size:
+                return
+            last = rows[-1][0]
 
     # NICK AND CHANNEL FUNCTIONS
 
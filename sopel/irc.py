@@ -11,29 +11,15 @@
 from __future__ import unicode_literals, absolute_import, print_function, division
 
 import sys
-import time
-import socket
-import asyncore
-import asynchat
 import os
 import codecs
 import traceback
-from sopel.logger import get_logger
+from sopel.backends import get_backend
+from sopel.logger import get_logger, RawLogWriter
 from sopel.tools import stderr, Identifier
-from sopel.trigger import PreTrigger
-try:
-    import ssl
-    if not hasattr(ssl, 'match_hostname'):
-        # Attempt to import ssl_match_hostname from python-backports
-        import backports.ssl_match_hostname
-        ssl.match_hostname = backports.ssl_match_hostname.match_hostname
-        ssl.CertificateError = backports.ssl_match_hostname.CertificateError
-    has_ssl = True
-except ImportError:
-    # no SSL support
-    has_ssl = False
-
-import errno
+from sopel.tools.outbound import OutboundQueue
+from sopel.trigger import PreTrigger, parse_line  # NOQA
+
 import threading
 from datetime import datetime
 if sys.version_info.major >= 3:
@@ -42,13 +28,24 @@ if sys.version_info.major >= 3:
 LOGGER = get_logger(__name__)
 
 
-class Bot(asynchat.async_chat):
+class Bot(object):
+    priority_commands = frozenset([
+        'PONG', 'PING', 'CAP', 'AUTHENTICATE', 'PASS', 'NICK', 'USER'])
+    """Commands which are sent ahead of everything else that's waiting.
+
+    ``QUIT`` is not one of them: it's sent after everything else, so that
+    replies queued before it aren't lost."""
+
     def __init__(self, config):
         ca_certs = config.core.ca_certs
 
-        asynchat.async_chat.__init__(self)
-        self.set_terminator(b'\n')
-        self.buffer = ''
+        self.config = config
+        self.backend = None
+        """The transport used for the current connection.
+
+        See :mod:`sopel.backends`; it's picked with the ``backend`` setting,
+        and created by ``run()``.
+        """
 
         self.nick = Identifier(config.core.nick)
         """Sopel's current ``Identifier``. Changing this while Sopel is running is
@@ -58,15 +55,25 @@ class Bot(asynchat.async_chat):
         self.name = config.core.name
         """Sopel's "real name", as used for whois."""
 
-        self.stack = {}
         self.ca_certs = ca_certs
         self.enabled_capabilities = set()
         self.hasquit = False
 
-        self.sending = threading.RLock()
-        self.writing_lock = threading.Lock()
+        self.outbound = OutboundQueue(self._send_lines,
+                                      config.core.flood_burst_lines,
+                                      config.core.flood_refill_rate)
+        """The :class:`sopel.tools.outbound.OutboundQueue` of lines to send.
+
+        Its ``queue_length(target)`` tells how many messages are waiting to be
+        sent to a channel or nick."""
         self.raw = None
 
+        self.raw_log = None
+        """The :class:`sopel.logger.RawLogWriter` for ``raw.log``.
+
+        This is only created once there's something to log."""
+        self._raw_log_lock = threading.Lock()
+
         # Right now, only accounting for two op levels.
         # This might be expanded later.
         # These lists are filled in startup.py, as of right now.
@@ -85,14 +92,26 @@ class Bot(asynchat.async_chat):
         """ Set to True when a server has accepted the client connection and
         messages can be sent and received. """
 
-        # Work around bot.connecting missing in Python older than 2.7.4
-        if not hasattr(self, "connecting"):
-            self.connecting = False
+        self.last_ping_time = datetime.now()
 
     def log_raw(self, line, prefix):
         """Log raw line to the raw log."""
+        self.log_raw_lines([line], prefix)
+
+    def log_raw_lines(self, lines, prefix):
+        """Log several raw lines to the raw log."""
         if not self.config.core.log_raw:
             return
+        raw_log = self.raw_log
+        if raw_log is None:
+            with self._raw_log_lock:
+                if self.raw_log is None:
+                    self.raw_log = self._open_raw_log()
+                raw_log = self.raw_log
+        for line in lines:
+            raw_log.write(line, prefix)
+
+    def _open_raw_log(self):
         if not os.path.isdir(self.config.core.logdir):
             try:
                 os.mkdir(self.config.core.logdir)
@@ -101,14 +120,11 @@ class Bot(asynchat.async_chat):
                 stderr('%s %s' % (str(e.__class__), str(e)))
                 stderr('Please fix this and then run Sopel again.')
                 os._exit(1)
-        f = codecs.open(os.path.join(self.config.core.logdir, 'raw.log'),
-                        'a', encoding='utf-8')
-        f.write(prefix + unicode(time.time()) + "\t")
-        temp = line.replace('\n', '')
-
-        f.write(temp)
-        f.write("\n")
-        f.close()
+        return RawLogWriter(
+            os.path.join(self.config.core.logdir, 'raw.log'),
+            max_bytes=self.config.core.log_raw_max_bytes,
+            backup_count=self.config.core.log_raw_backups,
+            compress=self.config.core.log_raw_compress)
 
     def safe(self, string):
         """Remove newlines from a string."""
@@ -125,56 +141,43 @@ class Bot(asynchat.async_chat):
         args = [self.safe(arg) for arg in args]
         if text is not None:
             text = self.safe(text)
-        try:
-            # Blocking lock, can't send two things at a time
-            self.writing_lock.acquire()
-
-            # From RFC2812 Internet Relay Chat: Client Protocol
-            # Section 2.3
-            #
-            # https://tools.ietf.org/html/rfc2812.html
-            #
-            # IRC messages are always lines of characters terminated with a
-            # CR-LF (Carriage Return - Line Feed) pair, and these messages SHALL
-            # NOT exceed 512 characters in length, counting all characters
-            # including the trailing CR-LF. Thus, there are 510 characters
-            # maximum allowed for the command and its parameters.  There is no
-            # provision for continuation of message lines.
-
-            if text is not None:
-                temp = (' '.join(args) + ' :' + text)[:510] + '\r\n'
-            else:
-                temp = ' '.join(args)[:510] + '\r\n'
-            self.log_raw(temp, '>>')
-            self.send(temp.encode('utf-8'))
-        finally:
-            self.writing_lock.release()
+        # From RFC2812 Internet Relay Chat: Client Protocol
+        # Section 2.3
+        #
+        # https://tools.ietf.org/html/rfc2812.html
+        #
+        # IRC messages are always lines of characters terminated with a
+        # CR-LF (Carriage Return - Line Feed) pair, and these messages SHALL
+        # NOT exceed 512 characters in length, counting all characters
+        # including the trailing CR-LF. Thus, there are 510 characters
+        # maximum allowed for the command and its parameters.  There is no
+        # provision for continuation of message lines.
+
+        if text is not None:
+            temp = (' '.join(args) + ' :' + text)[:510] + '\r\n'
+        else:
+            temp = ' '.join(args)[:510] + '\r\n'
+
+        command = args[0].upper() if args else ''
+        if command == 'QUIT':
+            self.outbound.put_last(temp)
+            return
+        target = None
+        if command in ('PRIVMSG', 'NOTICE') and len(args) > 1:
+            target = args[1]
+        self.outbound.put(temp, target, command in self.priority_commands)
+
+    def _send_lines(self, lines):
+        """Send lines from the outbound queue, with a single write."""
+        self.log_raw_lines(lines, '>>')
+        if self.backend is not None:
+            self.backend.send(''.join(lines).encode('utf-8'))
 
     def run(self, host, port=6667):
-        try:
-            self.initiate_connect(host, port)
-        except socket.error as e:
-            stderr('Connection error: %s' % e)
-            self.handle_close()
-
-    def initiate_connect(self, host, port):
-        stderr('Connecting to %s:%s...' % (host, port))
-        source_address = ((self.config.core.bind_host, 0)
-                          if self.config.core.bind_host else None)
-        self.set_socket(socket.create_connection((host, port),
-                        source_address=source_address))
-        if self.config.core.use_ssl and has_ssl:
-            self.send = self._ssl_send
-            self.recv = self._ssl_recv
-        elif not has_ssl and self.config.core.use_ssl:
-            stderr('SSL is not avilable on your system, attempting connection '
-                   'without it')
-        self.connect((host, port))
-        try:
-            asyncore.loop()
-        except KeyboardInterrupt:
-            print('KeyboardInterrupt')
-            self.quit('KeyboardInterrupt')
+        """Connect to ``host``, and handle the connection until it's closed."""
+        self.backend = get_backend(self.config.core.backend)(self)
+        self.outbound.start()
+        self.backend.run(host, port)
 
     def quit(self, message):
         """Disconnect from IRC and close the bot."""
@@ -188,61 +191,22 @@ class Bot(asynchat.async_chat):
         # release the main thread, which is problematic because whomever called
         # quit might still want to do something before main thread quits.
 
-    def handle_close(self):
+    def on_close(self):
+        """Called by the backend once the connection has been closed."""
         self.connection_registered = False
+        self.outbound.stop()
+        if self.raw_log is not None:
+            self.raw_log.close()
 
         if hasattr(self, '_shutdown'):
             self._shutdown()
         stderr('Closed!')
 
-        # This will eventually call asyncore dispatchers close method, which
-        # will release the main thread. This should be called last to avoid
-        # race conditions.
-        self.close()
+    def on_connect(self):
+        """Called by the backend once connected, to register with the server.
 
-    def handle_connect(self):
-        """
-        Connect to IRC server, handle TLS and authenticate
-        user if an account exists.
+        This also authenticates the user, if an account exists.
         """
-        # handle potential TLS connection
-        if self.config.core.use_ssl and has_ssl:
-            if not self.config.core.verify_ssl:
-                self.ssl = ssl.wrap_socket(self.socket,
-                                           do_handshake_on_connect=True,
-                                           suppress_ragged_eofs=True)
-            else:
-                self.ssl = ssl.wrap_socket(self.socket,
-                                           do_handshake_on_connect=True,
-                                           suppress_ragged_eofs=True,
-                                           cert_reqs=ssl.CERT_REQUIRED,
-                                           ca_certs=self.ca_certs)
-                # connect to host specified in config first
-                try:
-                    ssl.match_hostname(self.ssl.getpeercert(), self.config.core.host)
-                except ssl.CertificateError:
-                    # the host in config and certificate don't match
-                    LOGGER.error("hostname mismatch between configuration and certificate")
-                    # check (via exception) if a CNAME matches as a fallback
-                    has_matched = False
-                    for hostname in self._get_cnames(self.config.core.host):
-                        try:
-                            ssl.match_hostname(self.ssl.getpeercert(), hostname)
-                            LOGGER.warning("using {0} instead of {1} for TLS connection"
-                                           .format(hostname, self.config.core.host))
-                            has_matched = True
-                            break
-                        except ssl.CertificateError:
-                            pass
-                    if not has_matched:
-                        # everything is broken
-                        stderr("Invalid certificate, hostname mismatch!")
-                        LOGGER.error("invalid certificate, no hostname matches")
-                        if hasattr(self.config.core, 'pid_file_path'):
-                            os.unlink(self.config.core.pid_file_path)
-                            os._exit(1)
-            self.set_socket(self.ssl)
-
         # Request list of server capabilities. IRCv3 servers will respond with
         # CAP * LS (which we handle in coretasks). v2 servers will respond with
         # 421 Unknown command, which we'll ignore
@@ -255,114 +219,13 @@ class Bot(asynchat.async_chat):
         self.write(('NICK', self.nick))
         self.write(('USER', self.user, '+iw', self.nick), self.name)
 
-        # maintain connection
         stderr('Connected.')
         self.last_ping_time = datetime.now()
-        timeout_check_thread = threading.Thread(target=self._timeout_check)
-        timeout_check_thread.daemon = True
-        timeout_check_thread.start()
-        ping_thread = threading.Thread(target=self._send_ping)
-        ping_thread.daemon = True
-        ping_thread.start()
-
-    def _get_cnames(self, domain):
-        """
-        Determine the CNAMEs for a given domain.
-
-        :param domain: domain to check
-        :type domain: str
-        :returns: list (of str)
-        """
-        import dns.resolver
-        cnames = []
-        try:
-            answer = dns.resolver.query(domain, "CNAME")
-        except dns.resolver.NoAnswer:
-            return []
-        for data in answer:
-            if isinstance(data, dns.rdtypes.ANY.CNAME.CNAME):
-                cname = data.to_text()[:-1]
-                cnames.append(cname)
-        return cnames
-
-    def _timeout_check(self):
-        while self.connected or self.connecting:
-            if (datetime.now() - self.last_ping_time).seconds > int(self.config.core.timeout):
-                stderr('Ping timeout reached after %s seconds, closing connection' % self.config.core.timeout)
-                self.handle_close()
-                break
-            else:
-                time.sleep(int(self.config.core.timeout))
-
-    def _send_ping(self):
-        while self.connected or self.connecting:
-            if self.connected and (datetime.now() - self.last_ping_time).seconds > int(self.config.core.timeout) / 2:
-                try:
-                    self.write(('PING', self.config.core.host))
-                except socket.error:
-                    pass
-            time.sleep(int(self.config.core.timeout) / 2)
-
-    def _ssl_send(self, data):
-        """Replacement for self.send() during SSL connections."""
-        try:
-            result = self.socket.send(data)
-            return result
-        except ssl.SSLError as why:
-            if why[0] in (asyncore.EWOULDBLOCK, errno.ESRCH):
-                return 0
-            else:
-                raise why
-            return 0
-
-    def _ssl_recv(self, buffer_size):
-        """Replacement for self.recv() during SSL connections.
-
-        From: http://evanfosmark.com/2010/09/ssl-support-in-asynchatasync_chat
 
-        """
-        try:
-            data = self.socket.read(buffer_size)
-            if not data:
-                self.handle_close()
-                return b''
-            return data
-        except ssl.SSLError as why:
-            if why[0] in (asyncore.ECONNRESET, asyncore.ENOTCONN,
-                          asyncore.ESHUTDOWN):
-                self.handle_close()
-                return ''
-            elif why[0] == errno.ENOENT:
-                # Required in order to keep it non-blocking
-                return b''
-            else:
-                raise
-
-    def collect_incoming_data(self, data):
-        # We can't trust clients to pass valid unicode.
-        try:
-            data = unicode(data, encoding='utf-8')
-        except UnicodeDecodeError:
-            # not unicode, let's try cp1252
-            try:
-                data = unicode(data, encoding='cp1252')
-            except UnicodeDecodeError:
-                # Okay, let's try ISO8859-1
-                try:
-                    data = unicode(data, encoding='iso8859-1')
-                except UnicodeDecodeError:
-                    # Discard line if encoding is unknown
-                    return
-
-        if data:
-            self.log_raw(data, '<<')
-        self.buffer += data
-
-    def found_terminator(self):
-        line = self.buffer
+    def on_message(self, line):
+        """Called by the backend with each line received from the server."""
         if line.endswith('\r'):
             line = line[:-1]
-        self.buffer = ''
         self.last_ping_time = datetime.now()
         pretrigger = PreTrigger(self.nick, line)
         if all(cap not in self.enabled_capabilities for cap in ['account-tag', 'extended-join']):
@@ -373,10 +236,10 @@ class Bot(asynchat.async_chat):
         elif pretrigger.event == 'ERROR':
             LOGGER.error("ERROR received from server: %s", pretrigger.args[-1])
             if self.hasquit:
-                self.close_when_done()
+                self.backend.close_when_done()
         elif pretrigger.event == '433':
             stderr('Nickname already in use!')
-            self.handle_close()
+            self.backend.disconnect()
 
         self.dispatch(pretrigger)
 
@@ -430,7 +293,7 @@ class Bot(asynchat.async_chat):
     def handle_error(self):
         """Handle any uncaptured error in the core.
 
-        Overrides asyncore's handle_error.
+        Called by the backend when handling a line fails.
 
         """
         trace = traceback.format_exc()
@@ -446,7 +309,9 @@ class Bot(asynchat.async_chat):
         logfile.write('last raw line was %s' % self.raw)
         logfile.write(trace)
         logfile.write('Buffer:\n')
-        logfile.write(self.buffer)
+        buffer = getattr(self.backend, 'buffer', None)
+        if buffer is not None:
+            logfile.write(buffer.pending())
         logfile.write('----------------------------------------\n\n')
         logfile.close()
         if self.error_count > 10:
@@ -14,6 +14,10 @@ del core_section
 
 if sys.version_info.major >= 3:
     basestring = (str, bytes)
+    # Universal newlines are the default, and 'U' is an error since 3.11
+    _source_mode = 'r'
+else:
+    _source_mode = 'U'
 
 
 def get_module_description(path):
@@ -165,9 +169,13 @@ def clean_callable(func, config):
 
     if hasattr(func, 'commands') or hasattr(func, 'nickname_commands'):
         func.rule = getattr(func, 'rule', [])
+        # Remember which rules are prefixed commands, so the bot can look them
+        # up by name instead of matching each regex in turn.
+        func._command_rules = {}
         for command in getattr(func, 'commands', []):
             regexp = get_command_regexp(prefix, command)
             func.rule.append(regexp)
+            func._command_rules[regexp] = command
         for command in getattr(func, 'nickname_commands', []):
             regexp = get_nickname_command_regexp(nick, command, alias_nicks)
             func.rule.append(regexp)
@@ -191,7 +199,7 @@ def load_module(name, path, type_):
     """Load a module, and sort out the callables and shutdowns"""
     if type_ == imp.PY_SOURCE:
         with open(path) as mod:
-            module = imp.load_module(name, mod, path, ('.py', 'U', type_))
+            module = imp.load_module(name, mod, path, ('.py', _source_mode, type_))
     elif type_ == imp.PKG_DIRECTORY:
         module = imp.load_module(name, None, path, ('', '', type_))
     else:
@@ -1,7 +1,18 @@
 # coding=utf-8
 from __future__ import unicode_literals, absolute_import, print_function, division
 
+import collections
+import gzip
+import io
 import logging
+import os
+import shutil
+import sys
+import threading
+import time
+
+if sys.version_info.major >= 3:
+    unicode = str
 
 
 class IrcLoggingHandler(logging.Handler):
@@ -32,6 +43,132 @@ class ChannelOutputFormatter(logging.Formatter):
         return ' - ' + repr(exc_info[1])
 
 
+class RawLogWriter(object):
+
+    """Writes the raw log from a thread of its own.
+
+    :meth:`write` only adds the line to an in-memory ring buffer of
+    ``buffer_lines`` lines, so logging adds no file I/O to handling a message.
+    The buffer is written out once it holds ``flush_lines`` lines, or after
+    ``flush_interval`` seconds. If the writer falls so far behind that the
+    buffer fills up, the oldest lines are dropped, and a note saying how many
+    is logged in their place.
+
+    Once the file is larger than ``max_bytes`` (if that isn't 0), it's rotated
+    like :class:`logging.handlers.RotatingFileHandler` does, keeping up to
+    ``backup_count`` old files. With ``compress``, the old files are gzipped.
+    """
+
+    def __init__(self, filename, max_bytes=0, backup_count=5, compress=False,
+                 buffer_lines=10000, flush_lines=100, flush_interval=1.0):
+        self.filename = filename
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.compress = compress
+        self.flush_lines = flush_lines
+        self.flush_interval = flush_interval
+
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._buffer = collections.deque(maxlen=buffer_lines)
+        self._dropped = 0
+        self._closed = False
+        self._thread = None
+        self._file = None
+
+    def write(self, line, prefix):
+        """Log ``line``, received (``'<<'``) or sent (``'>>'``) just now."""
+        with self._lock:
+            if self._closed:
+                return
+            if len(self._buffer) == self._buffer.maxlen:
+                self._dropped += 1
+            self._buffer.append((prefix, time.time(), line))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run,
+                                                name='sopel-raw-log')
+                self._thread.daemon = True
+                self._thread.start()
+            elif len(self._buffer) in (1, self.flush_lines):
+                # Start the flush timer, or flush right away
+                self._wake.notify()
+
+    def close(self):
+        """Write out everything that's buffered, and close the file."""
+        with self._lock:
+            self._closed = True
+            thread = self._thread
+            self._wake.notify()
+        if thread is not None:
+            thread.join()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._closed and not self._buffer:
+                    self._wake.wait()
+                if not self._closed and len(self._buffer) < self.flush_lines:
+                    self._wake.wait(self.flush_interval)
+                entries = list(self._buffer)
+                self._buffer.clear()
+                dropped, self._dropped = self._dropped, 0
+                closed = self._closed
+            try:
+                self._flush(entries, dropped)
+            except (IOError, OSError) as e:
+                logging.getLogger('sopel').error(
+                    'Could not write to the raw log: %s', e)
+            if closed:
+                if self._file is not None:
+                    self._file.close()
+                    self._file = None
+                return
+
+    def _flush(self, entries, dropped):
+        if not entries and not dropped:
+            return
+        if self._file is None:
+            self._file = io.open(self.filename, 'a', encoding='utf-8',
+                                 newline='')
+        if dropped:
+            self._file.write('!!%s\t%d lines were dropped from the raw log\n'
+                             % (unicode(time.time()), dropped))
+        for prefix, timestamp, line in entries:
+            self._file.write(prefix + unicode(timestamp) + '\t' +
+                             line.replace('\n', '') + '\n')
+        self._file.flush()
+        if self.max_bytes and self._file.tell() >= self.max_bytes:
+            self._rotate()
+
+    def _backup_name(self, number):
+        name = '%s.%d' % (self.filename, number)
+        return name + '.gz' if self.compress else name
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+        if self.backup_count <= 0:
+            os.remove(self.filename)
+            return
+        for number in range(self.backup_count - 1, 0, -1):
+            source = self._backup_name(number)
+            if os.path.exists(source):
+                target = self._backup_name(number + 1)
+                if os.path.exists(target):
+                    os.remove(target)
+                os.rename(source, target)
+        target = self._backup_name(1)
+        if os.path.exists(target):
+            os.remove(target)
+        if self.compress:
+            with open(self.filename, 'rb') as source:
+                with gzip.open(target, 'wb') as compressed:
+                    shutil.copyfileobj(source, compressed)
+            os.remove(self.filename)
+        else:
+            os.rename(self.filename, target)
+
+
 def setup_logging(bot):
     level = bot.config.core.logging_level or 'WARNING'
     logging.basicConfig(level=level)
@@ -1,5 +1,15 @@
 # coding=utf-8
 """This contains decorators and tools for creating callable plugin functions.
+
+On Python 3.5 and newer, the decorated functions may also be coroutine
+functions, defined with ``async def``. These are run on the bot's event loop
+instead of in a thread, and the bot they are given has ``say``, ``action``,
+``notice`` and ``reply`` methods which return awaitables::
+
+    @sopel.module.commands('slow')
+    async def slow(bot, trigger):
+        await asyncio.sleep(10)
+        await bot.reply('That took a while.')
 """
 # Copyright 2013, Ari Koivula, <ari@koivu.la>
 # Copyright © 2013, Elad Alfassa <elad@fedoraproject.org>
@@ -53,6 +63,9 @@ def interval(*args):
     There is no guarantee that the bot is connected to a server or joined a
     channel when the function is called, so care must be taken.
 
+    The function may be defined with ``async def``, in which case it's run on
+    the bot's event loop rather than in a thread.
+
     Example:::
 
         import sopel.module
@@ -72,6 +85,41 @@ def interval(*args):
     return add_attribute
 
 
+def jitter(value):
+    """Decorate an interval function to have each call put off at random.
+
+    Args:
+        value: The most seconds each call may be put off by. Defaults to 0.
+
+    This keeps many functions with the same interval from all being called at
+    once.
+
+    """
+    def add_attribute(function):
+        function.jitter = value
+        return function
+    return add_attribute
+
+
+def misfire(value):
+    """Decorate an interval function to say what to do about missed calls.
+
+    Args:
+        value: One of "catch_up", "coalesce" and "skip". Defaults to
+            catch_up.
+
+    Calls are missed when the bot is too busy to make them on time, or the
+    computer was asleep. With catch_up, the missed calls are made at once, up
+    to a few of them. With coalesce, only one call is made for all of them,
+    and with skip, none are; the function is next called at its next interval.
+
+    """
+    def add_attribute(function):
+        function.misfire = value
+        return function
+    return add_attribute
+
+
 def rule(value):
     """Decorate a function to be called when a line matches the given pattern
 
@@ -109,6 +157,9 @@ def thread(value):
         value: Either True or False. If True the function is called in
             a separate thread. If False from the main thread.
 
+    This has no effect on ``async def`` functions, which always run on the
+    bot's event loop.
+
     """
     def add_attribute(function):
         function.thread = value
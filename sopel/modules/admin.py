@@ -223,6 +223,8 @@ def set_config(bot, trigger):
             bot.say("Can't set attribute: " + str(exc))
             return
     setattr(section, option, value)
+    if section_name == 'core' and option in ('nick_blocks', 'host_blocks'):
+        bot.reload_blocks()
 
 
 @sopel.module.require_privmsg
@@ -232,3 +234,24 @@ def set_config(bot, trigger):
 def save_config(bot, trigger):
     """Save state of sopels config object to the configuration file."""
     bot.config.save()
+
+
+@sopel.module.require_privmsg
+@sopel.module.require_admin
+@sopel.module.commands('ratelimits')
+@sopel.module.priority('low')
+@sopel.module.example('.ratelimits #example')
+def ratelimits(bot, trigger):
+    """List the rate limits in effect, optionally only those on a nick or
+    channel. Can only be done in privmsg by an admin."""
+    limits = bot.rate_limiter.limits(trigger.group(3))
+    if not limits:
+        bot.reply('No rate limits are in effect.')
+        return
+    shown = limits[:10]
+    for limit in shown:
+        bot.say('%s.%s: %s limit on %s, %ds left' % (
+            limit.func.__module__, limit.func.__name__, limit.scope,
+            limit.target or 'everyone', limit.remaining))
+    if len(limits) > len(shown):
+        bot.say('...and %d more.' % (len(limits) - len(shown)))
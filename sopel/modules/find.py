@@ -32,11 +32,13 @@ def collectlines(bot, trigger):
     # Add a log for the channel and nick, if there isn't already one
     if trigger.sender not in bot.memory['find_lines']:
         bot.memory['find_lines'][trigger.sender] = SopelMemory()
-    if Identifier(trigger.nick) not in bot.memory['find_lines'][trigger.sender]:
-        bot.memory['find_lines'][trigger.sender][Identifier(trigger.nick)] = list()
+    channel_lines = bot.memory['find_lines'][trigger.sender]
+    # trigger.nick is already an Identifier
+    if trigger.nick not in channel_lines:
+        channel_lines[trigger.nick] = list()
 
     # Create a temporary list of the user's lines in a channel
-    templist = bot.memory['find_lines'][trigger.sender][Identifier(trigger.nick)]
+    templist = channel_lines[trigger.nick]
     line = trigger.group()
     if line.startswith("s/"):  # Don't remember substitutions
         return
@@ -48,8 +50,6 @@ def collectlines(bot, trigger):
 
     del templist[:-10]  # Keep the log to 10 lines per person
 
-    bot.memory['find_lines'][trigger.sender][Identifier(trigger.nick)] = templist
-
 
 # Match nick, s/find/replace/flags. Flags and nick are optional, nick can be
 # followed by comma or colon, anything after the first space after the third
@@ -80,7 +80,7 @@ def findandreplace(bot, trigger):
     # only do something if there is conversation to work with
     if trigger.sender not in search_dict:
         return
-    if Identifier(rnick) not in search_dict[trigger.sender]:
+    if rnick not in search_dict[trigger.sender]:
         return
 
     # TODO rest[0] is find, rest[1] is replace. These should be made variables of
@@ -34,6 +34,7 @@ def f_reload(bot, trigger):
             'low': collections.defaultdict(list)
         }
         bot._command_groups = collections.defaultdict(list)
+        bot.scheduler.clear_jobs()
         bot.setup()
         return bot.reply('done')
 
@@ -56,7 +56,9 @@ def seen(bot, trigger):
 @priority('low')
 def note(bot, trigger):
     if not trigger.is_privmsg:
-        bot.db.set_nick_value(trigger.nick, 'seen_timestamp', time.time())
-        bot.db.set_nick_value(trigger.nick, 'seen_channel', trigger.sender)
-        bot.db.set_nick_value(trigger.nick, 'seen_message', trigger)
-        bot.db.set_nick_value(trigger.nick, 'seen_action', 'intent' in trigger.tags)
+        bot.db.set_nick_values(trigger.nick, {
+            'seen_timestamp': time.time(),
+            'seen_channel': trigger.sender,
+            'seen_message': trigger,
+            'seen_action': 'intent' in trigger.tags,
+        })
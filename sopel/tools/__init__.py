@@ -184,6 +184,31 @@ class Ddict(dict):
         return dict.__getitem__(self, key)
 
 
+# Non-ASCII letters are lowered too, whatever the casemapping. The tilde
+# replacement isn't needed for identifiers, but is for channels, which may be
+# useful at some point in the future.
+def _lower_ascii(identifier):
+    return identifier.lower()
+
+
+def _lower_rfc1459(identifier):
+    low = identifier.lower().replace('{', '[').replace('}', ']')
+    return low.replace('|', '\\').replace('^', '~')
+
+
+def _lower_strict_rfc1459(identifier):
+    low = identifier.lower().replace('{', '[').replace('}', ']')
+    return low.replace('|', '\\')
+
+
+CASEMAPPINGS = {
+    'ascii': _lower_ascii,
+    'rfc1459': _lower_rfc1459,
+    'strict-rfc1459': _lower_strict_rfc1459,
+}
+"""The supported ``CASEMAPPING``\\s, and the function lowering each."""
+
+
 class Identifier(unicode):
     """A `unicode` subclass which acts appropriately for IRC identifiers.
 
@@ -191,8 +216,24 @@ class Identifier(unicode):
     However, when comparing two Identifier objects, or comparing a Identifier
     object with a `unicode` object, the comparison will be case insensitive.
     This case insensitivity includes the case convention conventions regarding
-    ``[]``, ``{}``, ``|``, ``\\``, ``^`` and ``~`` described in RFC 2812.
+    ``[]``, ``{}``, ``|``, ``\\``, ``^`` and ``~`` described in RFC 2812, or
+    whichever of them the server's ``CASEMAPPING`` says (see
+    :meth:`set_casemapping`).
+
+    Identifiers are interned: constructing one from a string which was used
+    recently returns the same object again.
     """
+    casemapping = 'rfc1459'
+    """The name of the casemapping in use; one of :data:`CASEMAPPINGS`."""
+    chantypes = _channel_prefixes
+    """The characters which channel names start with.
+
+    This is set from the server's ``CHANTYPES`` ISUPPORT token, and decides
+    what :meth:`is_nick` says."""
+    cache_size = 10000
+    """The most Identifiers which are kept for reuse at once."""
+    _fold = staticmethod(_lower_rfc1459)
+    _cache = {}
 
     def __new__(cls, identifier):
         # According to RFC2812, identifiers have to be in the ASCII range.
@@ -200,24 +241,68 @@ class Identifier(unicode):
         # just assume unicode. It won't hurt anything, and is more internally
         # consistent. And who knows, maybe there's another use case for this
         # weird case convention.
+        if cls is Identifier:
+            if type(identifier) is Identifier:
+                # Immutable, so there's no need for a copy
+                return identifier
+            if type(identifier) is unicode:
+                cache = Identifier._cache
+                s = cache.get(identifier)
+                if s is None:
+                    if len(cache) >= Identifier.cache_size:
+                        # Start over, rather than track which are least used
+                        cache.clear()
+                    s = unicode.__new__(cls, identifier)
+                    s._lowered = Identifier._lower(identifier)
+                    cache[identifier] = s
+                return s
         s = unicode.__new__(cls, identifier)
         s._lowered = Identifier._lower(identifier)
         return s
 
+    @classmethod
+    def set_casemapping(cls, name):
+        """Compare identifiers using the casemapping called ``name``.
+
+        This is set from the server's ``CASEMAPPING`` ISUPPORT token. Only
+        Identifiers created afterwards are affected: ones created earlier keep
+        comparing (and hashing) as they did, so they have to be replaced with
+        :meth:`refold`, and dicts keyed by them rebuilt.
+
+        :returns: whether the casemapping changed
+        :raises ValueError: if the casemapping isn't one of
+            :data:`CASEMAPPINGS`
+        """
+        name = name.lower()
+        if name not in CASEMAPPINGS:
+            raise ValueError('Unsupported casemapping: %s' % name)
+        if name == Identifier.casemapping:
+            return False
+        Identifier.casemapping = name
+        Identifier._fold = staticmethod(CASEMAPPINGS[name])
+        Identifier._cache.clear()
+        return True
+
+    def refold(self):
+        """Return this identifier, lowered per the current casemapping.
+
+        This is the same object if the casemapping hasn't changed since it
+        was created."""
+        lowered = Identifier._fold(unicode(self))
+        if lowered == self._lowered:
+            return self
+        return Identifier(unicode(self))
+
     def lower(self):
         """Return the identifier converted to lower-case per RFC 2812."""
         return self._lowered
 
     @staticmethod
     def _lower(identifier):
-        """Returns `identifier` in lower case per RFC 2812."""
+        """Returns `identifier` in lower case per the current casemapping."""
         if isinstance(identifier, Identifier):
             return identifier._lowered
-        # The tilde replacement isn't needed for identifiers, but is for
-        # channels, which may be useful at some point in the future.
-        low = identifier.lower().replace('{', '[').replace('}', ']')
-        low = low.replace('|', '\\').replace('^', '~')
-        return low
+        return Identifier._fold(identifier)
 
     def __repr__(self):
         return "%s(%r)" % (
@@ -259,7 +344,7 @@ class Identifier(unicode):
     def is_nick(self):
         """Returns True if the Identifier is a nickname (as opposed to channel)
         """
-        return self and not self.startswith(_channel_prefixes)
+        return self and not self.startswith(Identifier.chantypes)
 
 
 class OutputRedirect(object):
@@ -84,6 +84,7 @@ class events(object):
     ERR_PASSWDMISMATCH = '464'
     ERR_YOUREBANNEDCREEP = '465'
     ERR_KEYSET = '467'
+    ERR_LINKCHANNEL = '470'
     ERR_CHANNELISFULL = '471'
     ERR_UNKNOWNMODE = '472'
     ERR_INVITEONLYCHAN = '473'
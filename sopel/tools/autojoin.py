@@ -0,0 +1,270 @@
+# coding=utf-8
+"""Joining many channels at a pace the server accepts."""
+# Licensed under the Eiffel Forum License 2.
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import heapq
+import itertools
+import threading
+import time
+
+from sopel.logger import get_logger
+from sopel.tools import Identifier
+
+LOGGER = get_logger(__name__)
+
+
+class JoinScheduler(object):
+
+    """Joins channels in batches, paced by a token bucket, and retries them.
+
+    ``join`` is called, from the scheduler's own thread, with a list of the
+    channels to join at once; each is either a name or a ``(name, key)``
+    tuple, as :meth:`sopel.bot.Sopel.join` takes them. Up to ``burst``
+    channels may be joined at once, after which ``rate`` more may be joined
+    every second. A ``rate`` of 0 means there is no limit.
+
+    Channels which the server refuses for a reason that may pass (see
+    :meth:`failed`) are tried again after ``backoff`` seconds, doubling with
+    each attempt up to ``max_backoff``, at most ``retries`` times. A channel
+    which has had no reply after ``timeout`` seconds is treated the same way.
+    """
+
+    def __init__(self, join, rate=10.0, burst=None, retries=10, backoff=6.0,
+                 max_backoff=300.0, timeout=60.0, name='sopel-autojoin'):
+        self.join = join
+        self.rate = rate
+        self.burst = burst or max(rate, 1)
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.timeout = timeout
+        self.name = name
+
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        self._queue = []  # heap of (when, seq, channel)
+        self._seq = itertools.count()
+        self._keys = {}
+        self._attempts = {}
+        self._sent = {}
+        self._tokens = float(self.burst)
+        self._refilled = time.time()
+        self._paused_until = 0
+        self._thread = None
+        self._stopped = False
+        self._counts = {'joined': 0, 'failed': 0, 'retries': 0}
+        self._started = None
+        self._finished = None
+
+    def add(self, channels, now=None):
+        """Queue ``channels`` to be joined, as names or ``(name, key)``s."""
+        now = time.time() if now is None else now
+        with self._lock:
+            if self._started is None or self._finished is not None:
+                self._started = now
+                self._finished = None
+            for channel in channels:
+                name, key = (channel if isinstance(channel, tuple)
+                             else (channel, None))
+                name = Identifier(name)
+                if name in self._keys:
+                    # Already waiting to be joined
+                    continue
+                self._keys[name] = key
+                self._attempts[name] = 0
+                heapq.heappush(self._queue, (now, next(self._seq), name))
+            self._ready.notify()
+
+    def joined(self, channel):
+        """Record that ``channel`` has been joined.
+
+        This is also how a channel which forwarded the bot to another is
+        dealt with, as the ``JOIN`` which follows is for the other one.
+        """
+        channel = Identifier(channel)
+        with self._lock:
+            if self._sent.pop(channel, None) is None:
+                # Not one of ours, or already joined
+                return
+            self._forget(channel)
+            self._counts['joined'] += 1
+            self._check_finished()
+
+    def failed(self, channel, retry=True, now=None):
+        """Record that joining ``channel`` failed.
+
+        With ``retry``, it's queued to be tried again after a delay, unless
+        it's already been tried too many times. Only channels the scheduler
+        is joining are retried: others (like those a module or an admin
+        joined) are left alone, as the scheduler doesn't have their keys.
+
+        Returns whether it will be tried again.
+        """
+        now = time.time() if now is None else now
+        channel = Identifier(channel)
+        with self._lock:
+            self._sent.pop(channel, None)
+            if channel not in self._keys:
+                return False
+            result = self._retry(channel, now) if retry else False
+            if not result:
+                self._forget(channel)
+                self._counts['failed'] += 1
+                self._check_finished()
+            self._ready.notify()
+            return result
+
+    def throttled(self, now=None):
+        """Back off, after the server says to try joining again later.
+
+        The channels which have had no reply yet are queued again.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            self._tokens = 0
+            self._paused_until = self._refilled = now + self.backoff
+            for channel in list(self._sent):
+                del self._sent[channel]
+                if not self._retry(channel, now):
+                    self._forget(channel)
+                    self._counts['failed'] += 1
+            self._check_finished()
+            self._ready.notify()
+
+    def refold(self):
+        """Rebuild the channel names, after the casemapping has changed."""
+        with self._lock:
+            for name in ('_keys', '_attempts', '_sent'):
+                setattr(self, name, dict(
+                    (channel.refold(), value)
+                    for channel, value in getattr(self, name).items()))
+            # The order is by time, so the heap stays one
+            self._queue = [(when, seq, channel.refold())
+                           for when, seq, channel in self._queue]
+
+    def stats(self):
+        """Return a dict of the progress of joining.
+
+        ``queued`` channels are waiting for their turn (or to be retried),
+        and ``waiting`` ones have been sent a JOIN with no reply yet. The
+        counts of those ``joined``, ``failed`` for good and of ``retries`` are
+        since the scheduler was created. ``elapsed`` is the time taken by the
+        current (or last) set of joins, and ``done`` says whether they've all
+        had a reply.
+        """
+        with self._lock:
+            stats = dict(self._counts)
+            stats['queued'] = len(self._keys) - len(self._sent)
+            stats['waiting'] = len(self._sent)
+            stats['done'] = self._finished is not None
+            if self._started is None:
+                stats['elapsed'] = 0
+            else:
+                stats['elapsed'] = (self._finished or time.time()) - (
+                    self._started)
+        return stats
+
+    def start(self):
+        """Start joining the channels queued."""
+        with self._lock:
+            if self._thread is not None or self._stopped:
+                return
+            self._thread = threading.Thread(target=self._run, name=self.name)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def stop(self):
+        """Stop joining, and forget any channels which are still queued."""
+        with self._lock:
+            self._stopped = True
+            del self._queue[:]
+            self._keys.clear()
+            self._sent.clear()
+            self._ready.notify_all()
+
+    def _retry(self, channel, now):
+        attempts = self._attempts[channel]
+        if attempts >= self.retries:
+            LOGGER.warning('Failed to join %s after %d attempts.', channel,
+                           attempts + 1)
+            return False
+        self._attempts[channel] = attempts + 1
+        self._counts['retries'] += 1
+        delay = min(self.backoff * 2 ** attempts, self.max_backoff)
+        heapq.heappush(self._queue, (now + delay, next(self._seq), channel))
+        return True
+
+    def _forget(self, channel):
+        self._keys.pop(channel, None)
+        self._attempts.pop(channel, None)
+
+    def _check_finished(self):
+        if not self._queue and not self._sent and self._finished is None and (
+                self._started is not None):
+            self._finished = time.time()
+            LOGGER.info('Joined %d channels (%d failed) in %.1fs',
+                        self._counts['joined'], self._counts['failed'],
+                        self._finished - self._started)
+
+    def _take(self, now):
+        """Take the channels to join now.
+
+        Returns them, with how long to wait before there may be more (or
+        ``None`` if there are none left to join).
+        """
+        for channel, sent in list(self._sent.items()):
+            if now - sent > self.timeout:
+                LOGGER.info('No reply to JOIN %s, trying again.', channel)
+                del self._sent[channel]
+                if not self._retry(channel, now):
+                    self._forget(channel)
+                    self._counts['failed'] += 1
+        if now < self._paused_until:
+            return [], self._paused_until - now
+        if self.rate:
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+
+        channels = []
+        while self._queue and self._queue[0][0] <= now and (
+                not self.rate or self._tokens >= 1):
+            _, _, channel = heapq.heappop(self._queue)
+            if channel not in self._keys or channel in self._sent:
+                # Stale entry: joined, given up on, or already sent
+                continue
+            key = self._keys[channel]
+            channels.append((channel, key) if key else channel)
+            self._sent[channel] = now
+            if self.rate:
+                self._tokens -= 1
+
+        if self._sent:
+            # Check for timeouts even if there's nothing else to do
+            wait = min(self._sent.values()) + self.timeout - now
+        else:
+            wait = None
+        if self._queue:
+            if self.rate and self._tokens < 1:
+                until_token = (1 - self._tokens) / self.rate
+            else:
+                until_token = 0
+            until_due = max(self._queue[0][0] - now, until_token)
+            wait = until_due if wait is None else min(wait, until_due)
+        self._check_finished()
+        return channels, wait
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if self._stopped:
+                    return
+                channels, wait = self._take(time.time())
+                if not channels:
+                    self._ready.wait(wait)
+                    continue
+            try:
+                self.join(channels)
+            except Exception:  # TODO: Be specific
+                LOGGER.exception('Error joining channels')
@@ -0,0 +1,303 @@
+# coding=utf-8
+"""The features a server advertises in RPL_ISUPPORT (``005``).
+
+See https://modern.ircdocs.horse/#rplisupport-005 for the tokens which may be
+given, and what they mean.
+"""
+# Licensed under the Eiffel Forum License 2.
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import re
+import sys
+
+if sys.version_info.major >= 3:
+    unichr = chr
+
+DEFAULTS = {
+    'CASEMAPPING': 'rfc1459',
+    'CHANMODES': 'beI,k,l,imnpst',
+    'CHANTYPES': '#&+!',
+    'LINELEN': '512',
+    'MODES': '3',
+    'PREFIX': '(qaohv)~&@%+',
+}
+"""The values assumed for tokens until (or unless) the server gives them.
+
+``PREFIX`` includes the admin and owner modes which many servers have, so
+that their prefixes are recognized even if the server doesn't send one, and
+``CHANTYPES`` has every type of channel in the RFCs."""
+
+LIST_COMMANDS = frozenset(['JOIN', 'PART'])
+"""Commands which have always accepted a comma-separated list of channels."""
+
+_escape_regex = re.compile(r'\\x([0-9A-Fa-f]{2})')
+
+
+def _unescape(value):
+    return _escape_regex.sub(lambda m: unichr(int(m.group(1), 16)), value)
+
+
+def _limit(value):
+    # A limit which is missing, isn't a number or isn't positive means none
+    try:
+        limit = int(value)
+    except ValueError:
+        return None
+    return limit if limit > 0 else None
+
+
+class ISupport(object):
+
+    """The RPL_ISUPPORT tokens of the server the bot is connected to.
+
+    Tokens are looked up by name, like a dict: ``isupport['NETWORK']`` is the
+    value given for ``NETWORK``, which is ``''`` for a token given without a
+    value. The properties give the values of the tokens Sopel uses, parsed,
+    with defaults for those the server hasn't given.
+    """
+
+    def __init__(self):
+        self._tokens = {}
+
+    def update(self, tokens):
+        """Take in the ``tokens`` of an RPL_ISUPPORT reply.
+
+        A token of the form ``-NAME`` removes what was given for ``NAME``.
+        """
+        for token in tokens:
+            if token.startswith('-'):
+                self._tokens.pop(token[1:].upper(), None)
+                continue
+            name, _, value = token.partition('=')
+            self._tokens[name.upper()] = _unescape(value)
+
+    def clear(self):
+        """Forget every token, as when reconnecting."""
+        self._tokens.clear()
+
+    def __contains__(self, name):
+        return name in self._tokens
+
+    def __getitem__(self, name):
+        return self._tokens[name]
+
+    def get(self, name, default=None):
+        """Return the value of the token ``name``, or ``default``."""
+        return self._tokens.get(name, default)
+
+    def _value(self, name):
+        value = self._tokens.get(name)
+        if value is None:
+            return DEFAULTS[name]
+        return value
+
+    def _number(self, name):
+        try:
+            return int(self._value(name))
+        except ValueError:
+            return int(DEFAULTS[name])
+
+    @property
+    def casemapping(self):
+        """The name of the server's casemapping, e.g. ``rfc1459``."""
+        return self._value('CASEMAPPING')
+
+    @property
+    def chantypes(self):
+        """The characters channel names may start with."""
+        return self._value('CHANTYPES')
+
+    @property
+    def chanmodes(self):
+        """The four types of channel modes, as a tuple of strings.
+
+        They are the list modes (like ``b``), the modes which always take a
+        parameter (like ``k``), the ones which only take one when set (like
+        ``l``) and the ones which never do. The modes in :attr:`prefix` are
+        in none of them.
+        """
+        types = self._value('CHANMODES').split(',')
+        return tuple((types + ['', '', '', ''])[:4])
+
+    @property
+    def prefix(self):
+        """The channel modes which give privileges, and their nick prefixes.
+
+        This is a tuple of two strings, from the highest privilege to the
+        lowest, e.g. ``('ov', '@+')``.
+        """
+        value = self._value('PREFIX')
+        if not value.startswith('('):
+            # PREFIX= means there are none
+            return '', ''
+        modes, _, prefixes = value[1:].partition(')')
+        return modes, prefixes
+
+    @property
+    def modes(self):
+        """The most channel modes with a parameter in one ``MODE`` line.
+
+        ``None`` if there is no limit.
+        """
+        if self._tokens.get('MODES') == '':
+            return None
+        return self._number('MODES')
+
+    @property
+    def linelen(self):
+        """The most bytes in a line, counting the trailing CR-LF."""
+        return self._number('LINELEN')
+
+    @property
+    def maxtargets(self):
+        """The most targets a ``PRIVMSG`` or ``NOTICE`` may have, or ``None``.
+
+        This is only given by older servers; see :attr:`targmax`.
+        """
+        return _limit(self._tokens.get('MAXTARGETS', ''))
+
+    @property
+    def targmax(self):
+        """The most targets each command may have, as a dict.
+
+        Commands the server has no limit for, or gave a limit which isn't a
+        number for, map to ``None``. Commands it didn't list aren't in the
+        dict.
+        """
+        targmax = {}
+        for item in self._tokens.get('TARGMAX', '').split(','):
+            command, _, limit = item.partition(':')
+            if command:
+                targmax[command.upper()] = _limit(limit)
+        return targmax
+
+    def max_targets(self, command):
+        """Return the most targets ``command`` may be sent to at once.
+
+        ``None`` means there's no limit, other than the line length.
+        """
+        command = command.upper()
+        targmax = self.targmax
+        if command in targmax:
+            return targmax[command]
+        if command in ('PRIVMSG', 'NOTICE') and self.maxtargets:
+            return self.maxtargets
+        if command in LIST_COMMANDS:
+            return None
+        return 1
+
+    def batch_targets(self, command, targets, length=None):
+        """Split ``targets`` into lists which ``command`` can be sent to.
+
+        Each list is at most :meth:`max_targets` long, and, comma-separated,
+        at most ``length`` bytes (by default, a quarter of the line, to leave
+        room for a message).
+        """
+        limit = self.max_targets(command)
+        if length is None:
+            length = self.linelen // 4
+        batch = []
+        size = 0
+        for target in targets:
+            target_size = len(target.encode('utf-8')) + 1
+            if batch and (len(batch) == limit or size + target_size > length):
+                yield batch
+                batch = []
+                size = 0
+            batch.append(target)
+            size += target_size
+        if batch:
+            yield batch
+
+    def batch_joins(self, channels):
+        """Split ``channels`` into the arguments of as few ``JOIN``\\s as fit.
+
+        ``channels`` is an iterable of channel names, or of ``(name, key)``
+        pairs for channels with a key. Each item yielded is a list of the
+        arguments of one ``JOIN``: the comma-separated channels, then their
+        keys if any have one. Channels with keys are put first, as the keys
+        are matched to channels in order.
+        """
+        keyed = []
+        unkeyed = []
+        for channel in channels:
+            if isinstance(channel, tuple) and channel[1]:
+                keyed.append(channel)
+            else:
+                if isinstance(channel, tuple):
+                    channel = channel[0]
+                unkeyed.append((channel, None))
+        limit = self.max_targets('JOIN')
+        # 'JOIN', two spaces and CR-LF
+        room = self.linelen - 8
+        names = []
+        keys = []
+        size = 0
+        for name, key in keyed + unkeyed:
+            item_size = len(name.encode('utf-8')) + 1
+            if key:
+                item_size += len(key.encode('utf-8')) + 1
+            if names and (len(names) == limit or size + item_size > room):
+                yield self._join_args(names, keys)
+                names = []
+                keys = []
+                size = 0
+            names.append(name)
+            if key:
+                keys.append(key)
+            size += item_size
+        if names:
+            yield self._join_args(names, keys)
+
+    @staticmethod
+    def _join_args(names, keys):
+        if keys:
+            return [','.join(names), ','.join(keys)]
+        return [','.join(names)]
+
+    def batch_modes(self, changes, length=None):
+        """Split mode ``changes`` into the arguments of as few ``MODE``\\s.
+
+        ``changes`` is an iterable of ``(mode, parameter)`` pairs, like
+        ``('+o', 'Embolalia')`` or ``('-m', None)``. Each item yielded is the
+        list of the arguments of one ``MODE`` after the target: the mode
+        string, then the parameters. There are at most :attr:`modes` changes
+        with a parameter in each, and the arguments are at most ``length``
+        bytes (by default, what's left of a line after 100 for the target
+        and prefix).
+        """
+        limit = self.modes
+        if length is None:
+            length = self.linelen - 100
+        batch = []
+        with_param = 0
+        size = 0
+        for mode, param in changes:
+            size_added = len(mode)
+            if param is not None:
+                size_added += len(param.encode('utf-8')) + 1
+            if batch and (
+                    (param is not None and with_param == limit) or
+                    size + size_added > length):
+                yield self._mode_args(batch)
+                batch = []
+                with_param = 0
+                size = 0
+            batch.append((mode, param))
+            if param is not None:
+                with_param += 1
+            size += size_added
+        if batch:
+            yield self._mode_args(batch)
+
+    @staticmethod
+    def _mode_args(changes):
+        modestring = ''
+        sign = None
+        for mode, _ in changes:
+            if mode[0] != sign:
+                sign = mode[0]
+                modestring += sign
+            modestring += mode[1:]
+        return [modestring] + [
+            param for _, param in changes if param is not None]
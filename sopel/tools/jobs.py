@@ -1,12 +1,19 @@
 # coding=utf-8
 from __future__ import unicode_literals, absolute_import, print_function, division
 
+import collections
 import copy
 import datetime
+import heapq
+import inspect
+import itertools
+import random
 import sys
 import threading
 import time
 
+from sopel.logger import get_logger
+
 if sys.version_info.major >= 3:
     unicode = str
     basestring = str
@@ -19,9 +26,20 @@ try:
 except ImportError:
     import queue as Queue
 
+try:
+    import asyncio
+except ImportError:
+    # Python 2, which has no coroutines to run anyway
+    asyncio = None
+
+LOGGER = get_logger(__name__)
+
 
 class released(object):
-    """A context manager that releases a lock temporarily."""
+    """A context manager that releases a lock temporarily.
+
+    Deprecated; :class:`JobScheduler` no longer uses it. Remove in 7.0.
+    """
     def __init__(self, lock):
         self.lock = lock
 
@@ -33,7 +51,11 @@ class released(object):
 
 
 class PriorityQueue(Queue.PriorityQueue):
-    """A priority queue with a peek method."""
+    """A priority queue with a peek method.
+
+    Deprecated; :class:`JobScheduler` keeps its jobs in a heap of its own
+    now. Remove in 7.0.
+    """
     def peek(self):
         """Return a copy of the first element without removing it."""
         self.not_empty.acquire()
@@ -47,52 +69,420 @@ class PriorityQueue(Queue.PriorityQueue):
             self.not_empty.release()
 
 
+class _Task(object):
+    """A call waiting in a :class:`WorkerPool`'s queue."""
+    __slots__ = ('rank', 'seq', 'func', 'args', 'module', 'name', 'submitted')
+
+    def __init__(self, rank, seq, func, args, module, name):
+        self.rank = rank
+        self.seq = seq
+        self.func = func
+        self.args = args
+        self.module = module
+        self.name = name
+        self.submitted = time.time()
+
+    def __lt__(self, other):
+        return (self.rank, self.seq) < (other.rank, other.seq)
+
+
+class WorkerPool(object):
+
+    """A bounded pool of threads which run callables and jobs.
+
+    Calls are queued with a priority (``'high'``, ``'medium'`` or ``'low'``),
+    and the threads always take the highest priority call which has waited the
+    longest. Threads are started as they are needed, up to ``size``.
+
+    At most ``queue_size`` calls may be waiting at a time, and at most
+    ``module_limits[module]`` calls from a single module may be waiting or
+    running. What happens to a call which would go over either limit depends
+    on ``overflow``:
+
+    * ``'drop'``: the new call is discarded.
+    * ``'block'``: :meth:`submit` waits until there is room for the call.
+    * ``'shed'``: the lowest priority waiting call (from the same module, if
+      it's the module's limit which would be exceeded) is discarded to make
+      room, as long as its priority is lower than that of the new call.
+      Otherwise, the new call is discarded.
+
+    If ``size`` is 0, there is no pool; each call gets a new thread, as it did
+    before the pool existed, and none of the limits apply.
+    """
+
+    priorities = ('high', 'medium', 'low')
+    overflow_policies = ('drop', 'block', 'shed')
+
+    def __init__(self, size, queue_size=100, overflow='shed',
+                 module_limits=None, name='sopel-worker'):
+        if overflow not in self.overflow_policies:
+            raise ValueError('overflow must be one of {}'.format(
+                self.overflow_policies))
+        self.size = size
+        self.queue_size = queue_size
+        self.overflow = overflow
+        self.module_limits = module_limits or {}
+        self.name = name
+
+        self._lock = threading.Lock()
+        self._work_ready = threading.Condition(self._lock)
+        self._room_ready = threading.Condition(self._lock)
+        self._queue = []
+        self._threads = []
+        self._idle = 0
+        self._running = 0
+        self._seq = 0
+        self._stopped = False
+        self._outstanding = {}
+        self._counts = {
+            'submitted': 0, 'completed': 0, 'dropped': 0, 'shed': 0}
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._recent_waits = collections.deque(maxlen=100)
+
+    @staticmethod
+    def parse_module_limits(values):
+        """Parse a list of ``module=limit`` strings into a dict.
+
+        This is the format of the ``core.worker_module_limits`` setting.
+        """
+        limits = {}
+        for value in values:
+            module, _, limit = value.partition('=')
+            try:
+                limits[module.strip()] = int(limit)
+            except ValueError:
+                raise ValueError(
+                    'Invalid module limit {!r}, expected module=limit'
+                    .format(value))
+        return limits
+
+    @property
+    def queue_depth(self):
+        """The number of calls waiting for a thread."""
+        return len(self._queue)
+
+    def submit(self, func, args=(), priority='medium', module=None,
+               name=None):
+        """Queue ``func(*args)`` to be called in a worker thread.
+
+        ``name`` is used to refer to the call in logs, and defaults to the name
+        of ``func``. Returns ``False`` if the call was discarded rather than
+        queued.
+        """
+        if self.size <= 0:
+            threading.Thread(target=func, args=args).start()
+            return True
+
+        with self._lock:
+            if self._stopped:
+                return False
+            self._seq += 1
+            rank = self.priorities.index(priority)
+            task = _Task(rank, self._seq, func, args, module,
+                         name or _func_name(func))
+            self._counts['submitted'] += 1
+            while not self._has_room(task):
+                if self.overflow == 'block':
+                    self._room_ready.wait()
+                    if self._stopped:
+                        return False
+                elif self.overflow == 'drop' or not self._shed(task):
+                    self._counts['dropped'] += 1
+                    LOGGER.warning('Worker queue full, dropping call to %s',
+                                   task.name)
+                    return False
+
+            heapq.heappush(self._queue, task)
+            if task.module is not None:
+                self._outstanding[task.module] = (
+                    self._outstanding.get(task.module, 0) + 1)
+            if not self._idle and len(self._threads) < self.size:
+                self._start_thread()
+            self._work_ready.notify()
+        return True
+
+    def _module_full(self, module):
+        limit = self.module_limits.get(module)
+        return limit is not None and self._outstanding.get(module, 0) >= limit
+
+    def _has_room(self, task):
+        return (len(self._queue) < self.queue_size and
+                not self._module_full(task.module))
+
+    def _shed(self, task):
+        """Discard a waiting call with a lower priority than ``task``."""
+        victims = [queued for queued in self._queue if queued.rank > task.rank]
+        if self._module_full(task.module):
+            victims = [queued for queued in victims
+                       if queued.module == task.module]
+        if not victims:
+            return False
+        # Of the lowest priority, shed the newest, which has waited the least
+        victim = max(victims, key=lambda queued: (queued.rank, queued.seq))
+        self._queue.remove(victim)
+        heapq.heapify(self._queue)
+        self._finished(victim)
+        self._counts['shed'] += 1
+        LOGGER.warning('Worker queue full, shedding call to %s',
+                       victim.name)
+        return True
+
+    def _finished(self, task):
+        if task.module is not None:
+            self._outstanding[task.module] -= 1
+            if not self._outstanding[task.module]:
+                del self._outstanding[task.module]
+        self._room_ready.notify_all()
+
+    def _start_thread(self):
+        thread = threading.Thread(
+            target=self._work,
+            name='{}-{}'.format(self.name, len(self._threads) + 1))
+        thread.daemon = True
+        self._threads.append(thread)
+        thread.start()
+
+    def _work(self):
+        while True:
+            with self._lock:
+                self._idle += 1
+                while not self._queue and not self._stopped:
+                    self._work_ready.wait()
+                self._idle -= 1
+                if self._stopped:
+                    return
+                task = heapq.heappop(self._queue)
+                self._room_ready.notify_all()
+                wait = time.time() - task.submitted
+                self._wait_total += wait
+                self._wait_max = max(self._wait_max, wait)
+                self._recent_waits.append(wait)
+                self._running += 1
+            try:
+                task.func(*task.args)
+            except Exception:  # TODO: Be specific
+                LOGGER.exception('Uncaught error in worker thread')
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self._counts['completed'] += 1
+                    self._finished(task)
+
+    def stop(self):
+        """Stop the threads, discarding any calls which are still waiting.
+
+        Calls which are already running are allowed to finish.
+        """
+        with self._lock:
+            self._stopped = True
+            for task in self._queue:
+                self._finished(task)
+            self._queue = []
+            self._work_ready.notify_all()
+            self._room_ready.notify_all()
+
+    def stats(self):
+        """Return a dict with a snapshot of the pool's metrics.
+
+        This includes the number of calls waiting (``queue_depth``), being run
+        (``running``) and outstanding per module (``modules``); counts of calls
+        ``submitted``, ``completed``, ``dropped`` and ``shed``; and how long
+        calls waited for a thread, in seconds, both overall and over the last
+        100 calls (``wait_avg``, ``wait_max``, ``recent_wait_avg`` and
+        ``recent_wait_max``).
+        """
+        with self._lock:
+            started = self._counts['completed'] + self._running
+            recent = list(self._recent_waits)
+            stats = {
+                'threads': len(self._threads),
+                'queue_depth': len(self._queue),
+                'running': self._running,
+                'modules': dict(self._outstanding),
+                'wait_avg': self._wait_total / started if started else 0.0,
+                'wait_max': self._wait_max,
+                'recent_wait_avg': sum(recent) / len(recent) if recent else 0.0,
+                'recent_wait_max': max(recent) if recent else 0.0,
+            }
+            stats.update(self._counts)
+        return stats
+
+
+def is_coroutine_function(func):
+    """Whether ``func`` was defined with ``async def``."""
+    if asyncio is None:
+        return False
+    return inspect.iscoroutinefunction(func)
+
+
+class CoroutineRunner(object):
+
+    """Runs coroutines from ``async def`` callables and jobs.
+
+    A coroutine is run on the event loop given to :meth:`submit`, as long as
+    that loop is running; this is how they end up on the asyncio backend's
+    loop. Otherwise, it's run on the runner's own loop, in a thread which is
+    started the first time it's needed.
+    """
+
+    def __init__(self, name='sopel-coroutines'):
+        self.name = name
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+
+    def submit(self, coro, loop=None):
+        """Schedule ``coro`` to be run, from any thread.
+
+        Returns a :class:`concurrent.futures.Future` for its result.
+        """
+        if loop is None or loop.is_closed() or not loop.is_running():
+            loop = self._own_loop()
+        return asyncio.run_coroutine_threadsafe(coro, loop)
+
+    def _own_loop(self):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever, name=self.name)
+                self._thread.daemon = True
+                self._thread.start()
+            return self._loop
+
+    def stop(self):
+        """Stop the runner's own loop, if it was started.
+
+        Coroutines which are still running on it are abandoned.
+        """
+        with self._lock:
+            loop, self._loop = self._loop, None
+        if loop is not None:
+            loop.call_soon_threadsafe(loop.stop)
+
+
+def _func_name(func):
+    return '{}.{}'.format(getattr(func, '__module__', '?'),
+                          getattr(func, '__name__', repr(func)))
+
+
 class JobScheduler(threading.Thread):
 
     """Calls jobs assigned to it in steady intervals.
 
     JobScheduler is a thread that keeps track of Jobs and calls them every
-    X seconds, where X is a property of the Job. It maintains jobs in a
-    priority queue, where the next job to be called is always the first
-    item.
-    Thread safety is maintained with a mutex that is released during long
-    operations, so methods add_job and clear_jobs can be safely called from
-    the main thread.
+    X seconds, where X is a property of the Job. The jobs are kept in a heap
+    ordered by when each is next due, and the thread sleeps until the first
+    of them is; adding a job which is due sooner wakes it up.
 
+    :meth:`add_job` returns the job, which can be cancelled with
+    :meth:`Job.cancel`, and :meth:`remove_jobs` cancels those of a callable
+    or a module. All of the methods can be called from any thread.
     """
 
     min_reaction_time = 30.0  # seconds
-    """How often should scheduler checks for changes in the job list."""
+    """The longest the scheduler sleeps at once.
+
+    It normally wakes up exactly when the next job is due, or when a job is
+    added; this is only so that it notices if the clock is changed."""
 
     def __init__(self, bot):
         """Requires bot as argument for logging."""
         threading.Thread.__init__(self)
         self.bot = bot
-        self._jobs = PriorityQueue()
-        # While PriorityQueue it self is thread safe, this mutex is needed
-        # to stop old jobs being put into new queue after clearing the
-        # queue.
-        self._mutex = threading.Lock()
-        # self.cleared is used for more fine grained locking.
-        self._cleared = False
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        # [next_time, seq, job] for each job which is waiting; a cancelled
+        # job's entry is left in with None for the job, and skipped when it
+        # comes up
+        self._heap = []
+        self._seq = itertools.count()
+        self._jobs = set()
+        self._cancelled = 0
+        self._running = None
+        self._stopping = False
 
     def add_job(self, job):
-        """Add a Job to the current job queue."""
-        self._jobs.put(job)
+        """Add a Job to the current job queue, and return it."""
+        with self._lock:
+            if job in self._jobs:
+                return job
+            job._scheduler = self
+            job.cancelled = False
+            self._jobs.add(job)
+            if job is not self._running:
+                # Otherwise it's put back once it's done
+                self._push(job)
+        return job
+
+    def cancel(self, job):
+        """Stop calling ``job``. Returns whether it was scheduled."""
+        with self._lock:
+            return self._cancel(job)
+
+    def remove_jobs(self, func=None, module=None):
+        """Cancel the jobs calling ``func``, or any callable in ``module``.
+
+        ``module`` is a module name, as in the callables' ``__module__``.
+        Returns how many jobs were cancelled.
+        """
+        with self._lock:
+            removed = [job for job in self._jobs
+                       if (func is not None and job.func is func) or
+                       (module is not None and
+                        getattr(job.func, '__module__', None) == module)]
+            for job in removed:
+                self._cancel(job)
+        return len(removed)
 
     def clear_jobs(self):
         """Clear current Job queue and start fresh."""
-        if self._jobs.empty():
-            # Guards against getting stuck waiting for self._mutex when
-            # thread is waiting for self._jobs to not be empty.
-            return
-        with self._mutex:
-            self._cleared = True
-            self._jobs = PriorityQueue()
+        with self._lock:
+            for job in list(self._jobs):
+                self._cancel(job)
+
+    def jobs(self):
+        """Return the jobs which are scheduled, the next one due first."""
+        with self._lock:
+            return sorted(self._jobs, key=lambda job: job.next_time)
+
+    def stop(self):
+        """Stop calling jobs, and let the thread end."""
+        with self._lock:
+            self._stopping = True
+            self._wakeup.notify()
+
+    def _push(self, job):
+        entry = [job.next_time, next(self._seq), job]
+        job._entry = entry
+        heapq.heappush(self._heap, entry)
+        if self._heap[0] is entry:
+            # It's due before whatever the thread is waiting for
+            self._wakeup.notify()
+
+    def _cancel(self, job):
+        if job not in self._jobs:
+            return False
+        job.cancelled = True
+        self._jobs.discard(job)
+        if job._entry is None:
+            # It's running, and won't be put back
+            return True
+        job._entry[2] = None
+        job._entry = None
+        self._cancelled += 1
+        if self._cancelled > 100 and self._cancelled > len(self._heap) // 2:
+            # Don't let cancelled jobs pile up in the heap
+            self._heap = [entry for entry in self._heap
+                          if entry[2] is not None]
+            heapq.heapify(self._heap)
+            self._cancelled = 0
+        return True
 
     def run(self):
-        """Run forever."""
-        while True:
+        """Run until stopped."""
+        while not self._stopping:
             try:
                 self._do_next_job()
             except Exception:  # TODO: Be specific
@@ -103,47 +493,82 @@ class JobScheduler(threading.Thread):
                 self.bot.error()
                 # Sleep a bit to guard against busy-looping and filling
                 # the log with useless error messages.
-                time.sleep(10.0)  # seconds
+                with self._lock:
+                    if not self._stopping:
+                        self._wakeup.wait(10.0)  # seconds
+
+    def _next_job(self):
+        """Wait until a job is due, and take it; ``None`` if stopping."""
+        with self._lock:
+            while not self._stopping:
+                if not self._heap:
+                    self._wakeup.wait(self.min_reaction_time)
+                    continue
+                next_time, _, job = self._heap[0]
+                if job is None:
+                    heapq.heappop(self._heap)
+                    self._cancelled -= 1
+                    continue
+                delay = next_time - time.time()
+                if delay > 0:
+                    self._wakeup.wait(min(delay, self.min_reaction_time))
+                    continue
+                heapq.heappop(self._heap)
+                job._entry = None
+                self._running = job
+                return job
+        return None
 
     def _do_next_job(self):
         """Wait until there is a job and do it."""
-        with self._mutex:
-            # Wait until the next job should be executed.
-            # This has to be a loop, because signals stop time.sleep().
-            while True:
-                job = self._jobs.peek()
-                difference = job.next_time - time.time()
-                duration = min(difference, self.min_reaction_time)
-                if duration <= 0:
-                    break
-                with released(self._mutex):
-                    time.sleep(duration)
-
-            self._cleared = False
-            job = self._jobs.get()
-            with released(self._mutex):
-                if job.func.thread:
-                    t = threading.Thread(
-                        target=self._call, args=(job.func,)
-                    )
-                    t.start()
+        job = self._next_job()
+        if job is None:
+            return
+        try:
+            if not job.skip_misfire():
+                if job.func.thread and not is_coroutine_function(job.func):
+                    self.bot.workers.submit(
+                        self._call, (job.func,),
+                        priority=getattr(job.func, 'priority', 'medium'),
+                        module=getattr(job.func, '__module__', None))
                 else:
                     self._call(job.func)
-                job.next()
-            # If jobs were cleared during the call, don't put an old job
-            # into the new job queue.
-            if not self._cleared:
-                self._jobs.put(job)
+        finally:
+            with self._lock:
+                self._running = None
+                # It may have been cancelled while it ran
+                if not job.cancelled:
+                    job.next()
+                    self._push(job)
 
     def _call(self, func):
         """Wrapper for collecting errors from modules."""
         # Sopel.bot.call is way too specialized to be used instead.
         try:
-            func(self.bot)
+            result = func(self.bot)
+        except Exception:  # TODO: Be specific
+            self.bot.error()
+            return
+        if is_coroutine_function(func):
+            future = self.bot.run_coroutine(result)
+            future.add_done_callback(self._coroutine_done)
+
+    def _coroutine_done(self, future):
+        """Collect errors from ``async def`` jobs."""
+        try:
+            future.result()
         except Exception:  # TODO: Be specific
             self.bot.error()
 
 
+MISFIRE_CATCH_UP = 'catch_up'
+"""Make the runs a late job missed, up to :attr:`Job.max_catchup` of them."""
+MISFIRE_COALESCE = 'coalesce'
+"""Make one run for all of those a late job missed."""
+MISFIRE_SKIP = 'skip'
+"""Make no run for those a late job missed; wait for the next one."""
+
+
 class Job(object):
 
     """Hold information about when a function should be called next.
@@ -158,6 +583,12 @@ class Job(object):
     be executed next so it should only be called right after the function
     was called.
 
+    Each run is put off by a random delay of up to ``jitter`` seconds, so
+    that many jobs with the same interval don't all run at once. What
+    happens when a job is late by more than its interval (because the bot was
+    busy, or the computer asleep) depends on ``misfire``, which is one of
+    :data:`MISFIRE_CATCH_UP`, :data:`MISFIRE_COALESCE` and
+    :data:`MISFIRE_SKIP`.
     """
 
     max_catchup = 5
@@ -167,17 +598,48 @@ class Job(object):
     calling the same function too many times at once.
     """
 
-    def __init__(self, interval, func):
+    misfire_policies = (MISFIRE_CATCH_UP, MISFIRE_COALESCE, MISFIRE_SKIP)
+
+    def __init__(self, interval, func, jitter=0, misfire=MISFIRE_CATCH_UP):
         """Initialize Job.
 
         Args:
             interval: number of seconds between calls to func
             func: function to be called
+            jitter: most seconds each call may be randomly put off by
+            misfire: what to do about missed calls, see above
 
         """
-        self.next_time = time.time() + interval
+        if misfire not in self.misfire_policies:
+            raise ValueError('misfire must be one of {}'.format(
+                ', '.join(self.misfire_policies)))
         self.interval = interval
         self.func = func
+        self.jitter = jitter
+        self.misfire = misfire
+        self.cancelled = False
+        """Whether the job has been cancelled."""
+        self._scheduler = None
+        self._entry = None
+        self._due = time.time() + interval
+        self.next_time = self._due + self._jitter()
+
+    def _jitter(self):
+        if not self.jitter:
+            return 0
+        return random.uniform(0, self.jitter)
+
+    def cancel(self):
+        """Stop calling this job. Returns whether it was scheduled."""
+        if self._scheduler is None:
+            self.cancelled = True
+            return False
+        return self._scheduler.cancel(self)
+
+    def skip_misfire(self):
+        """Whether this run should be skipped, being too late."""
+        return (self.misfire == MISFIRE_SKIP and
+                time.time() - self._due >= self.interval)
 
     def next(self):
         """Update self.next_time with the assumption func was just called.
@@ -185,25 +647,28 @@ class Job(object):
         Returns: A modified job object.
 
         """
-        last_time = self.next_time
         current_time = time.time()
-        delta = last_time + self.interval - current_time
+        due = self._due + self.interval
 
-        if last_time > current_time + self.interval:
+        if self._due > current_time + self.interval:
             # Clock appears to have moved backwards. Reset
             # the timer to avoid waiting for the clock to
             # catch up to whatever time it was previously.
-            self.next_time = current_time + self.interval
-        elif delta < 0 and abs(delta) > self.interval * self.max_catchup:
-            # Execution of jobs is too far behind. Give up on
-            # trying to catch up and reset the time, so that
-            # will only be repeated a maximum of
-            # self.max_catchup times.
-            self.next_time = current_time - \
-                self.interval * self.max_catchup
-        else:
-            self.next_time = last_time + self.interval
-
+            due = current_time + self.interval
+        elif due < current_time:
+            if self.misfire != MISFIRE_CATCH_UP:
+                # Go on from the next run which is still to come
+                missed = (current_time - due) // self.interval + 1
+                due += missed * self.interval
+            elif current_time - due > self.interval * self.max_catchup:
+                # Execution of jobs is too far behind. Give up on
+                # trying to catch up and reset the time, so that
+                # will only be repeated a maximum of
+                # self.max_catchup times.
+                due = current_time - self.interval * self.max_catchup
+
+        self._due = due
+        self.next_time = due + self._jitter()
         return self
 
     def __cmp__(self, other):
@@ -224,7 +689,7 @@ class Job(object):
             <Job(2013-06-14 11:01:36.884000, 20s, <function upper at 0x02386BF0>)>
 
         """
-        iso_time = str(datetime.fromtimestamp(self.next_time))
+        iso_time = str(datetime.datetime.fromtimestamp(self.next_time))
         return "<Job(%s, %ss, %s)>" % \
             (iso_time, self.interval, self.func)
 
@@ -0,0 +1,253 @@
+# coding=utf-8
+"""Scheduling of the lines the bot sends to the server."""
+# Licensed under the Eiffel Forum License 2.
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import collections
+import threading
+import time
+
+from sopel.logger import get_logger
+from sopel.tools import Identifier
+
+LOGGER = get_logger(__name__)
+
+
+class OutboundQueue(object):
+
+    """Sends lines to the server without flooding it.
+
+    Lines are sent from a thread of the queue's own, at the pace allowed by a
+    token bucket: up to ``burst`` lines may be sent at once, after which one
+    more may be sent every ``1 / rate`` seconds. Adding a line never blocks.
+
+    There are two lanes. High priority lines (``PONG`` and the like) are always
+    sent first, in the order they were added. Other lines are queued per
+    target, and the targets take turns, so that a long reply to one channel
+    doesn't hold up the bot everywhere else. Lines without a target share a
+    queue of their own.
+
+    A line added with :meth:`put_last` (the bot's ``QUIT``) is only sent once
+    everything queued before it has been, and nothing but high priority lines
+    is accepted after it.
+
+    ``send`` is called with a list of lines when it's time to send them. All
+    of the lines which may be sent at that moment (up to ``batch_size``) are
+    passed at once, so that they can be written to the socket together.
+    """
+
+    def __init__(self, send, burst=4, rate=1.0, batch_size=50,
+                 name='sopel-outbound'):
+        self.send = send
+        self.burst = burst
+        self.rate = rate
+        self.batch_size = batch_size
+        self.name = name
+
+        self._lock = threading.Lock()
+        self._ready = threading.Condition(self._lock)
+        self._drained = threading.Condition(self._lock)
+        self._sending = False
+        self._high = collections.deque()
+        self._queues = {}
+        self._turns = collections.deque()
+        self._last = None
+        self._closing = False
+        self._tokens = float(burst)
+        self._refilled = time.time()
+        self._thread = None
+        self._stopped = False
+        self._history = {}
+
+    def put(self, line, target=None, high_priority=False):
+        """Queue ``line`` to be sent.
+
+        ``target`` is the channel or nick the line is addressed to, if any.
+        Returns ``False`` if the queue has been stopped, or if the line comes
+        after one added with :meth:`put_last`.
+        """
+        with self._lock:
+            if self._stopped or (self._closing and not high_priority):
+                return False
+            if high_priority:
+                self._high.append(line)
+            else:
+                if target is not None:
+                    target = Identifier(target)
+                if target not in self._queues:
+                    self._queues[target] = collections.deque()
+                    self._turns.append(target)
+                self._queues[target].append(line)
+            self._ready.notify()
+        return True
+
+    def put_last(self, line):
+        """Queue ``line`` to be sent after every line which is waiting.
+
+        Returns ``False`` if the queue has been stopped, or already has a last
+        line.
+        """
+        with self._lock:
+            if self._stopped or self._closing:
+                return False
+            self._closing = True
+            self._last = line
+            self._ready.notify()
+        return True
+
+    def queue_length(self, target=None):
+        """The number of lines waiting to be sent to ``target``.
+
+        With no ``target``, this is the number of lines which have none.
+        """
+        if target is not None:
+            target = Identifier(target)
+        with self._lock:
+            return len(self._queues.get(target, ()))
+
+    def queue_lengths(self):
+        """Return a dict of the number of lines waiting for each target.
+
+        Targets with nothing waiting are left out. High priority lines are
+        counted under ``'high'``.
+        """
+        with self._lock:
+            lengths = dict((target, len(queue))
+                           for target, queue in self._queues.items())
+            if self._high:
+                lengths['high'] = len(self._high)
+        return lengths
+
+    def __len__(self):
+        with self._lock:
+            return len(self._high) + sum(
+                len(queue) for queue in self._queues.values()) + (
+                self._last is not None)
+
+    def check_loop(self, target, text):
+        """Check whether sending ``text`` to ``target`` would be looping.
+
+        If the same text has been sent to the target 5 times in its last 8
+        messages, and the last of those was less than 2 minutes ago, ``'...'``
+        is returned instead; if ``'...'`` has been sent 3 times, ``None`` is
+        returned, and the message should be discarded. Otherwise, ``text`` is
+        returned as it is. The message is remembered unless it's discarded.
+        """
+        target = Identifier(target)
+        now = time.time()
+        with self._lock:
+            history = self._history.setdefault(target, [])
+            if history:
+                elapsed = now - history[-1][0]
+                messages = [m[1] for m in history[-8:]]
+                if messages.count(text) >= 5 and elapsed < 120:
+                    text = '...'
+                    if messages.count('...') >= 3:
+                        return None
+            history.append((now, text))
+            del history[:-10]
+        return text
+
+    def start(self):
+        """Start sending lines."""
+        with self._lock:
+            if self._thread is not None or self._stopped:
+                return
+            self._thread = threading.Thread(target=self._run, name=self.name)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def wait_empty(self, timeout=None):
+        """Wait until every line waiting has been sent, for up to ``timeout``.
+
+        Returns whether they all were.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self._lock:
+            while (self._waiting() or self._sending) and not self._stopped:
+                if deadline is None:
+                    self._drained.wait()
+                    continue
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self._drained.wait(remaining)
+            return not self._waiting()
+
+    def stop(self):
+        """Stop sending lines, and discard any which are still waiting.
+
+        This is meant for once the connection is closed; to have everything
+        sent before closing it, use :meth:`put_last`.
+        """
+        with self._lock:
+            self._stopped = True
+            self._last = None
+            self._high.clear()
+            self._queues.clear()
+            self._turns.clear()
+            self._ready.notify_all()
+            self._drained.notify_all()
+
+    def _take_token(self):
+        """Take a token, or return how long to wait until there is one."""
+        now = time.time()
+        self._tokens = min(self.burst,
+                           self._tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0
+        return (1 - self._tokens) / self.rate
+
+    def _waiting(self):
+        return bool(self._high or self._turns or self._last is not None)
+
+    def _pop(self):
+        if self._high:
+            return self._high.popleft()
+        if not self._turns:
+            line, self._last = self._last, None
+            return line
+        target = self._turns.popleft()
+        queue = self._queues[target]
+        line = queue.popleft()
+        if queue:
+            self._turns.append(target)
+        else:
+            del self._queues[target]
+        return line
+
+    def _next_lines(self):
+        """Wait for lines which may be sent, and return them."""
+        with self._lock:
+            while not self._stopped:
+                if not self._waiting():
+                    self._ready.wait()
+                    continue
+                wait = self._take_token()
+                if wait:
+                    self._ready.wait(wait)
+                    continue
+                lines = [self._pop()]
+                while (self._waiting() and
+                       len(lines) < self.batch_size and
+                       not self._take_token()):
+                    lines.append(self._pop())
+                self._sending = True
+                return lines
+        return None
+
+    def _run(self):
+        while True:
+            lines = self._next_lines()
+            if lines is None:
+                return
+            try:
+                self.send(lines)
+            except Exception:  # TODO: Be specific
+                LOGGER.exception('Error sending lines')
+            finally:
+                with self._lock:
+                    self._sending = False
+                    self._drained.notify_all()
@@ -0,0 +1,113 @@
+# coding=utf-8
+"""Rate limiting of the callables which users trigger."""
+# Licensed under the Eiffel Forum License 2.
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import collections
+import heapq
+import threading
+import time
+
+USER = 'user'
+"""Scope of a limit which applies to each nick separately (``func.rate``)."""
+CHANNEL = 'channel'
+"""Scope of a limit which applies to each channel (``func.channel_rate``)."""
+GLOBAL = 'global'
+"""Scope of a limit which applies everywhere (``func.global_rate``)."""
+
+Limit = collections.namedtuple('Limit', 'scope target func remaining')
+"""A limit in effect: ``func`` can't be used by or in ``target`` for
+``remaining`` more seconds. ``target`` is ``None`` for a global limit."""
+
+
+class RateLimiter(object):
+
+    """Remembers which callables are rate limited, for whom, and until when.
+
+    Only the limits which are still in effect are stored: an entry is dropped
+    as soon as its window ends, and callables without a rate for a scope
+    aren't stored for it at all. At most ``max_entries`` are kept; past that,
+    the entries closest to expiring are dropped early.
+    """
+
+    def __init__(self, max_entries=100000):
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._until = {}
+        self._expiry = []
+
+    def __len__(self):
+        with self._lock:
+            self._expire(time.time())
+            return len(self._until)
+
+    def check(self, func, nick, channel=None, now=None):
+        """Return the :class:`Limit` which stops ``nick`` using ``func``.
+
+        ``channel`` is ``None`` in private messages. The user limit is checked
+        first, then the global one, then the channel one; ``None`` is
+        returned if none of them are in effect.
+        """
+        now = time.time() if now is None else now
+        until = self._until
+        with self._lock:
+            for scope, target in ((USER, nick), (GLOBAL, None),
+                                  (CHANNEL, channel)):
+                if scope == CHANNEL and channel is None:
+                    break
+                expires = until.get((func, scope, target))
+                if expires is not None and expires > now:
+                    return Limit(scope, target, func, expires - now)
+        return None
+
+    def record(self, func, nick, channel=None, now=None):
+        """Record that ``nick`` used ``func``, in ``channel`` if any."""
+        now = time.time() if now is None else now
+        rates = ((USER, nick, func.rate), (GLOBAL, None, func.global_rate),
+                 (CHANNEL, channel, func.channel_rate))
+        with self._lock:
+            self._expire(now)
+            for scope, target, rate in rates:
+                if rate <= 0 or (scope == CHANNEL and channel is None):
+                    continue
+                key = (func, scope, target)
+                self._until[key] = now + rate
+                heapq.heappush(self._expiry, (now + rate, id(key), key))
+            while len(self._until) > self.max_entries:
+                self._drop_next()
+
+    def limits(self, target=None, now=None):
+        """Return a list of the :class:`Limit`\\s in effect.
+
+        If ``target`` is given, only the limits on that nick or channel are
+        included. The soonest to end come first.
+        """
+        now = time.time() if now is None else now
+        with self._lock:
+            self._expire(now)
+            found = [Limit(scope, key_target, func, expires - now)
+                     for (func, scope, key_target), expires
+                     in self._until.items()
+                     if target is None or key_target == target]
+        found.sort(key=lambda limit: limit.remaining)
+        return found
+
+    def clear(self, target=None):
+        """Lift all limits, or those on ``target`` (a nick or channel)."""
+        with self._lock:
+            if target is None:
+                self._until.clear()
+                del self._expiry[:]
+                return
+            for key in [key for key in self._until if key[2] == target]:
+                del self._until[key]
+
+    def _drop_next(self):
+        expires, _, key = heapq.heappop(self._expiry)
+        if self._until.get(key) == expires:
+            del self._until[key]
+
+    def _expire(self, now):
+        expiry = self._expiry
+        while expiry and expiry[0][0] <= now:
+            self._drop_next()
@@ -2,12 +2,21 @@
 from __future__ import unicode_literals, absolute_import, print_function, division
 
 import functools
+
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
 from sopel.tools import Identifier
 
 
 @functools.total_ordering
 class User(object):
     """A representation of a user Sopel is aware of."""
+    # A bot can see tens of thousands of users, so they don't get a __dict__
+    __slots__ = ('nick', 'user', 'host', 'channels', 'account', 'away')
+
     def __init__(self, nick, user, host):
         assert isinstance(nick, Identifier)
         self.nick = nick
@@ -45,6 +54,8 @@ class User(object):
 @functools.total_ordering
 class Channel(object):
     """A representation of a channel Sopel is in."""
+    __slots__ = ('name', 'users', 'privileges', 'topic')
+
     def __init__(self, name):
         assert isinstance(name, Identifier)
         self.name = name
@@ -57,7 +68,10 @@ class Channel(object):
         """The permissions of the users in the channel.
 
         This maps username ``Identifier``s to bitwise integer values. This can
-        be compared to appropriate constants from ``sopel.module``."""
+        be compared to appropriate constants from ``sopel.module``. Everyone
+        in the channel is in it, even before their ``User`` is known (from
+        ``NAMES``, ahead of ``WHO``). It's the only record of privileges that
+        Sopel keeps; :attr:`sopel.bot.Sopel.privileges` is a view of it."""
         self.topic = ''
         """The topic of the channel."""
 
@@ -70,7 +84,8 @@ class Channel(object):
     def add_user(self, user):
         assert isinstance(user, User)
         self.users[user.nick] = user
-        self.privileges[user.nick] = 0
+        # Keep what NAMES said, if it came first
+        self.privileges.setdefault(user.nick, 0)
         user.channels[self.name] = self
 
     def rename_user(self, old, new):
@@ -88,3 +103,27 @@ class Channel(object):
         if not isinstance(other, Channel):
             return NotImplemented
         return self.name < other.name
+
+
+class PrivilegesView(Mapping):
+    """A read-only view of the privileges in each of ``channels``.
+
+    ``channels`` is a dict of channel names to :class:`Channel`\\s, and each
+    channel's entry is its :attr:`Channel.privileges`, rather than a copy of
+    it. This is what :attr:`sopel.bot.Sopel.privileges` used to be."""
+    __slots__ = ('_channels',)
+
+    def __init__(self, channels):
+        self._channels = channels
+
+    def __getitem__(self, channel):
+        return self._channels[channel].privileges
+
+    def __contains__(self, channel):
+        return channel in self._channels
+
+    def __iter__(self):
+        return iter(list(self._channels))
+
+    def __len__(self):
+        return len(self._channels)
@@ -3,6 +3,7 @@ from __future__ import unicode_literals, absolute_import, print_function, divisi
 
 import re
 import sys
+import time
 import datetime
 
 import sopel.tools
@@ -12,10 +13,148 @@ if sys.version_info.major >= 3:
     basestring = str
 
 
+TAG_ESCAPES = {':': ';', 's': ' ', '\\': '\\', 'r': '\r', 'n': '\n'}
+"""What each character following a backslash in a tag value stands for.
+
+Any other escaped character stands for itself, and a backslash at the end of
+the value is dropped."""
+_tag_escape_regex = re.compile(r'\\(.?)', re.DOTALL)
+_server_time_regex = re.compile(
+    r'(\d{4})-(\d\d)-(\d\d)T(\d\d):(\d\d):(\d\d)(?:\.(\d{1,6})\d*)?Z$')
+
+
+def _unescape_char(match):
+    char = match.group(1)
+    return TAG_ESCAPES.get(char, char)
+
+
+def unescape_tag_value(value):
+    """Unescape an IRCv3 message tag value."""
+    if '\\' not in value:
+        return value
+    return _tag_escape_regex.sub(_unescape_char, value)
+
+
+def parse_tags(raw_tags):
+    """Parse the IRCv3 message tags of a line, without the leading ``@``.
+
+    Tags without a value are mapped to ``None``, and tags without a name are
+    left out.
+    """
+    tags = {}
+    for tag in raw_tags.split(';'):
+        key, sep, value = tag.partition('=')
+        if key:
+            tags[key] = unescape_tag_value(value) if sep else None
+    return tags
+
+
+def parse_server_time(value):
+    """Parse the value of a ``time`` tag into a naive UTC ``datetime``.
+
+    Returns ``None`` if the value isn't in the format required by the
+    ``server-time`` spec.
+    """
+    match = _server_time_regex.match(value)
+    if not match:
+        return None
+    fraction = match.group(7) or '0'
+    try:
+        return datetime.datetime(
+            *[int(part) for part in match.group(1, 2, 3, 4, 5, 6)],
+            microsecond=int(fraction.ljust(6, '0')))
+    except ValueError:
+        return None
+
+
+def _split_line(line):
+    """Split a line into its raw tags, hostmask, command and parameters.
+
+    Runs of spaces between parameters count as one, as the spec says they
+    should.
+    """
+    raw_tags = hostmask = None
+    if line.startswith('@'):
+        end = line.find(' ')
+        if end == -1:
+            return line[1:], None, '', []
+        raw_tags = line[1:end]
+        line = line[end + 1:].lstrip(' ')
+    if line.startswith(':'):
+        end = line.find(' ')
+        if end == -1:
+            return raw_tags, line[1:], '', []
+        hostmask = line[1:end]
+        line = line[end + 1:]
+    end = line.find(' :')
+    if end == -1:
+        params = line.split(' ')
+    else:
+        params = line[:end].split(' ')
+    if '' in params:
+        params = [param for param in params if param]
+    if end != -1:
+        params.append(line[end + 2:])
+    if not params:
+        return raw_tags, hostmask, '', params
+    return raw_tags, hostmask, params.pop(0), params
+
+
+class Line(object):
+    """A line from the server, split into its parts by :func:`parse_line`.
+
+    The message tags, and the ``time`` tag in particular, are only parsed when
+    they're first used.
+    """
+    __slots__ = ('line', 'raw_tags', 'hostmask', 'command', 'params', '_tags')
+
+    def __init__(self, line, raw_tags, hostmask, command, params):
+        self.line = line
+        """The line, as it was received."""
+        self.raw_tags = raw_tags
+        """The message tags, unparsed and without the ``@``; ``None`` if the
+        line has no tags."""
+        self.hostmask = hostmask
+        """The source of the line, without the ``:``; ``None`` if it has no
+        source."""
+        self.command = command
+        """The command (e.g. ``PRIVMSG``) or numeric of the line."""
+        self.params = params
+        """The list of parameters, with the trailing one (if any) last."""
+        self._tags = None
+
+    @property
+    def tags(self):
+        """The dict of the line's IRCv3 message tags, with values unescaped."""
+        if self._tags is None:
+            self._tags = parse_tags(self.raw_tags) if self.raw_tags else {}
+        return self._tags
+
+    @property
+    def time(self):
+        """The ``server-time`` of the line, or ``None`` if it has none."""
+        value = self.tags.get('time')
+        return parse_server_time(value) if value else None
+
+    def __repr__(self):
+        return '<Line %r>' % self.line
+
+
+def parse_line(line):
+    """Parse a line received from the server into a :class:`Line`.
+
+    Trailing ``\\r`` and ``\\n`` are ignored.
+    """
+    line = line.rstrip('\r\n')
+    return Line(line, *_split_line(line))
+
+
 class PreTrigger(object):
     """A parsed message from the server, which has not been matched against
     any rules."""
-    component_regex = re.compile(r'([^!]*)!?([^@]*)@?(.*)')
+    __slots__ = ('line', 'hostmask', 'event', 'args', 'nick', 'user', 'host',
+                 'sender', '_raw_tags', '_tags', '_intent', '_time',
+                 '_received', '_trigger_data')
     intent_regex = re.compile('\x01(\\S+) ?(.*)\x01')
 
     def __init__(self, own_nick, line):
@@ -23,56 +162,17 @@ class PreTrigger(object):
         line is the full line from the server."""
         line = line.strip('\r')
         self.line = line
+        self._raw_tags, self.hostmask, self.event, self.args = _split_line(line)
+        self._tags = self._time = self._trigger_data = None
+        self._received = time.time()
 
-        # Break off IRCv3 message tags, if present
-        self.tags = {}
-        if line.startswith('@'):
-            tagstring, line = line.split(' ', 1)
-            for tag in tagstring[1:].split(';'):
-                tag = tag.split('=', 1)
-                if len(tag) > 1:
-                    self.tags[tag[0]] = tag[1]
-                else:
-                    self.tags[tag[0]] = None
-
-        self.time = datetime.datetime.utcnow()
-        if 'time' in self.tags:
-            try:
-                self.time = datetime.datetime.strptime(self.tags['time'], '%Y-%m-%dT%H:%M:%S.%fZ')
-            except ValueError:
-                pass  # Server isn't conforming to spec, ignore the server-time
-
-        # Grabs hostmask from line.
-        # Example: line = ':Sopel!foo@bar PRIVMSG #sopel :foobar!'
-        #          print(hostmask)  # Sopel!foo@bar
-        # All lines start with ":" except PING.
-        if line.startswith(':'):
-            self.hostmask, line = line[1:].split(' ', 1)
-        else:
-            self.hostmask = None
-
-        # Parses the line into a list of arguments.
-        # Some events like MODE don't have a secondary string argument, i.e. no ' :' inside the line.
-        # Example 1:  line = ':nick!ident@domain PRIVMSG #sopel :foo bar!'
-        #             print(text)    # 'foo bar!'
-        #             print(argstr)  # ':nick!ident@domain PRIVMSG #sopel'
-        #             print(args)    # [':nick!ident@domain', 'PRIVMSG', '#sopel', 'foo bar!']
-        # Example 2:  line = 'irc.freenode.net MODE Sopel +i'
-        #             print(text)    # '+i'
-        #             print(args)    # ['irc.freenode.net', 'MODE', 'Sopel', '+i']
-        if ' :' in line:
-            argstr, text = line.split(' :', 1)
-            self.args = argstr.split(' ')
-            self.args.append(text)
+        # Example: hostmask = 'Sopel!foo@bar'
+        nick, sep, userhost = (self.hostmask or '').partition('!')
+        if sep:
+            self.user, _, self.host = userhost.partition('@')
         else:
-            self.args = line.split(' ')
-            self.text = self.args[-1]
-
-        self.event = self.args[0]
-        self.args = self.args[1:]
-        components = PreTrigger.component_regex.match(self.hostmask or '').groups()
-        self.nick, self.user, self.host = components
-        self.nick = sopel.tools.Identifier(self.nick)
+            self.user = self.host = ''
+        self.nick = sopel.tools.Identifier(nick)
 
         # If we have arguments, the first one is the sender
         # Unless it's a QUIT event
@@ -88,17 +188,95 @@ class PreTrigger(object):
         self.sender = target
 
         # Parse CTCP into a form consistent with IRCv3 intents
-        if self.event == 'PRIVMSG' or self.event == 'NOTICE':
+        self._intent = None
+        if ((self.event == 'PRIVMSG' or self.event == 'NOTICE') and
+                self.args and self.args[-1].startswith('\x01')):
             intent_match = PreTrigger.intent_regex.match(self.args[-1])
             if intent_match:
-                intent, message = intent_match.groups()
-                self.tags['intent'] = intent
+                self._intent, message = intent_match.groups()
                 self.args[-1] = message or ''
 
-        # Populate account from extended-join messages
-        if self.event == 'JOIN' and len(self.args) == 3:
+    @property
+    def tags(self):
+        """The dict of IRCv3 message tags on the line.
+
+        CTCP commands are added under ``intent``, and the account from an
+        extended ``JOIN`` under ``account``.
+        """
+        if self._tags is None:
+            tags = parse_tags(self._raw_tags) if self._raw_tags else {}
+            if self._intent is not None:
+                tags['intent'] = self._intent
             # Account is the second arg `...JOIN #Sopel account :realname`
-            self.tags['account'] = self.args[1]
+            if self.event == 'JOIN' and len(self.args) == 3:
+                tags['account'] = self.args[1]
+            self._tags = tags
+        return self._tags
+
+    @property
+    def time(self):
+        """When the server says it sent the line, or else when it arrived."""
+        if self._time is None:
+            value = self.tags.get('time')
+            # Server-time is ignored if the server isn't conforming to spec
+            self._time = ((value and parse_server_time(value)) or
+                          datetime.datetime.utcfromtimestamp(self._received))
+        return self._time
+
+
+class _TriggerData(object):
+    """What's known of the sender of a line, shared by its Triggers.
+
+    Each rule a line matches gets a :class:`Trigger` of its own, but these are
+    the same for all of them, so they're only worked out once, when first
+    needed.
+    """
+    __slots__ = ('config', 'given_account', 'is_privmsg', '_pretrigger',
+                 '_account', '_owner', '_admin')
+
+    def __init__(self, config, pretrigger, account):
+        self.config = config
+        self.given_account = account
+        sender = pretrigger.sender
+        self.is_privmsg = sender and sender.is_nick()
+        self._pretrigger = pretrigger
+        self._account = self._owner = self._admin = None
+
+    @property
+    def account(self):
+        if self._account is None:
+            self._account = (self._pretrigger.tags.get('account') or
+                             self.given_account)
+        return self._account
+
+    def _match_host_or_nick(self, pattern):
+        pattern = sopel.tools.get_hostmask_regex(pattern)
+        nick = self._pretrigger.nick
+        return bool(
+            pattern.match(nick) or
+            pattern.match('@'.join((nick, self._pretrigger.host)))
+        )
+
+    @property
+    def owner(self):
+        if self._owner is None:
+            core = self.config.core
+            if core.owner_account:
+                self._owner = core.owner_account == self.account
+            else:
+                self._owner = self._match_host_or_nick(core.owner)
+        return self._owner
+
+    @property
+    def admin(self):
+        if self._admin is None:
+            core = self.config.core
+            self._admin = (
+                self.owner or
+                self.account in core.admin_accounts or
+                any(self._match_host_or_nick(item) for item in core.admins)
+            )
+        return self._admin
 
 
 class Trigger(unicode):
@@ -120,7 +298,7 @@ class Trigger(unicode):
     raw = property(lambda self: self._pretrigger.line)
     """The entire message, as sent from the server. This includes the CTCP
     \\x01 bytes and command, if they were included."""
-    is_privmsg = property(lambda self: self._is_privmsg)
+    is_privmsg = property(lambda self: self._data.is_privmsg)
     """True if the trigger is from a user, False if it's from a channel."""
     hostmask = property(lambda self: self._pretrigger.hostmask)
     """Hostmask of the person who sent the message as <nick>!<user>@<host>"""
@@ -158,12 +336,12 @@ class Trigger(unicode):
     """
     tags = property(lambda self: self._pretrigger.tags)
     """A map of the IRCv3 message tags on the message."""
-    admin = property(lambda self: self._admin)
+    admin = property(lambda self: self._data.admin)
     """True if the nick which triggered the command is one of the bot's admins.
     """
-    owner = property(lambda self: self._owner)
+    owner = property(lambda self: self._data.owner)
     """True if the nick which triggered the command is the bot's owner."""
-    account = property(lambda self: self.tags.get('account') or self._account)
+    account = property(lambda self: self._data.account)
     """The account name of the user sending the message.
 
     This is only available if either the account-tag or the account-notify and
@@ -173,26 +351,15 @@ class Trigger(unicode):
 
     def __new__(cls, config, message, match, account=None):
         self = unicode.__new__(cls, message.args[-1] if message.args else '')
-        self._account = account
         self._pretrigger = message
         self._match = match
-        self._is_privmsg = message.sender and message.sender.is_nick()
-
-        def match_host_or_nick(pattern):
-            pattern = sopel.tools.get_hostmask_regex(pattern)
-            return bool(
-                pattern.match(self.nick) or
-                pattern.match('@'.join((self.nick, self.host)))
-            )
 
-        if config.core.owner_account:
-            self._owner = config.core.owner_account == self.account
-        else:
-            self._owner = match_host_or_nick(config.core.owner)
-        self._admin = (
-            self._owner or
-            self.account in config.core.admin_accounts or
-            any(match_host_or_nick(item) for item in config.core.admins)
-        )
+        # Reuse the data of another Trigger for the same line, if any
+        data = message._trigger_data
+        if (data is None or data.config is not config or
+                data.given_account != account):
+            data = _TriggerData(config, message, account)
+            message._trigger_data = data
+        self._data = data
 
         return self
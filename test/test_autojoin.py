@@ -0,0 +1,93 @@
+# coding=utf-8
+"""Tests for sopel.tools.autojoin"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import threading
+
+from sopel.tools.autojoin import JoinScheduler
+
+
+def test_paced():
+    scheduler = JoinScheduler(None, rate=2, burst=3)
+    scheduler.add(['#c{}'.format(i) for i in range(7)], now=0)
+    # The bucket starts full
+    scheduler._refilled = 0
+    channels, wait = scheduler._take(0)
+    assert channels == ['#c0', '#c1', '#c2']
+    assert wait == 0.5
+    channels, wait = scheduler._take(1)
+    assert channels == ['#c3', '#c4']
+    channels, wait = scheduler._take(5)
+    assert channels == ['#c5', '#c6']
+    # Nothing left to do but wait for the first JOIN to time out
+    assert wait == 55
+    assert scheduler.stats()['waiting'] == 7
+
+
+def test_unlimited():
+    scheduler = JoinScheduler(None, rate=0)
+    scheduler.add(['#a', ('#b', 'key')], now=0)
+    channels, wait = scheduler._take(0)
+    assert channels == ['#a', ('#b', 'key')]
+
+
+def test_backoff():
+    scheduler = JoinScheduler(None, rate=0, retries=3, backoff=5)
+    scheduler.add([('#a', 'key')], now=0)
+    assert scheduler._take(0)[0] == [('#a', 'key')]
+    for attempt, delay in enumerate((5, 10, 20)):
+        assert scheduler.failed('#A', now=100)
+        assert scheduler._take(100 + delay - 1) == ([], 1)
+        # The key is kept for the retries
+        assert scheduler._take(100 + delay)[0] == [('#a', 'key')]
+    assert not scheduler.failed('#a', now=200)
+    # Not one of its channels
+    assert not scheduler.failed('#other', now=200)
+    assert scheduler._take(1000) == ([], None)
+    stats = scheduler.stats()
+    assert stats['failed'] == 1
+    assert stats['retries'] == 3
+    assert stats['done']
+
+
+def test_timeout_and_joined():
+    scheduler = JoinScheduler(None, rate=0, timeout=30, backoff=5)
+    scheduler.add(['#a', '#b'], now=0)
+    scheduler._take(0)
+    scheduler.joined('#a')
+    # No reply for #b, so it's tried again
+    assert scheduler._take(31) == ([], 5)
+    assert scheduler._take(36)[0] == ['#b']
+    scheduler.joined('#B')
+    stats = scheduler.stats()
+    assert stats['joined'] == 2
+    assert stats['retries'] == 1
+    assert stats['done']
+
+
+def test_throttled():
+    scheduler = JoinScheduler(None, rate=1, burst=2, backoff=10)
+    scheduler.add(['#a', '#b', '#c'], now=0)
+    scheduler._refilled = 0
+    assert scheduler._take(0)[0] == ['#a', '#b']
+    scheduler.throttled(now=0)
+    assert scheduler._take(5) == ([], 5)
+    assert scheduler._take(10) == ([], 1)
+    assert scheduler._take(11)[0] == ['#c']
+
+
+def test_thread():
+    joined = []
+    done = threading.Event()
+
+    def join(channels):
+        joined.extend(channels)
+        if len(joined) == 5:
+            done.set()
+
+    scheduler = JoinScheduler(join, rate=100, burst=2)
+    scheduler.start()
+    scheduler.add(['#c{}'.format(i) for i in range(5)])
+    assert done.wait(5)
+    scheduler.stop()
+    assert joined == ['#c{}'.format(i) for i in range(5)]
@@ -0,0 +1,223 @@
+# coding=utf-8
+"""Tests for core ``sopel.bot`` functionality"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import collections
+
+import pytest
+
+from sopel import bot, loader, module
+from sopel.test_tools import MockConfig
+from sopel.tools import Identifier, SopelMemory
+from sopel.tools.jobs import JobScheduler, MISFIRE_CATCH_UP, MISFIRE_SKIP
+
+
+def _callables(config, *funcs):
+    callables = {
+        'high': collections.defaultdict(list),
+        'medium': collections.defaultdict(list),
+        'low': collections.defaultdict(list)
+    }
+    for func in funcs:
+        loader.clean_callable(func, config)
+        for rule in func.rule:
+            callables[func.priority][rule].append(func)
+    return callables
+
+
+@pytest.fixture
+def config():
+    return MockConfig()
+
+
+def _funcs(candidates):
+    return [func.__name__ for _, funcs in candidates for func in funcs]
+
+
+def test_dispatch_index_commands(config):
+    @module.commands('hello', 'hi')
+    def hello(bot, trigger):
+        pass
+
+    @module.commands('bye')
+    def bye(bot, trigger):
+        pass
+
+    index = bot._DispatchIndex(_callables(config, hello, bye), '\\.')
+    assert _funcs(index.candidates('PRIVMSG', '.hello world')) == ['hello']
+    assert _funcs(index.candidates('PRIVMSG', '.HI')) == ['hello']
+    assert _funcs(index.candidates('PRIVMSG', '.bye')) == ['bye']
+    assert _funcs(index.candidates('PRIVMSG', 'hello')) == []
+    assert _funcs(index.candidates('PRIVMSG', '.')) == []
+    assert _funcs(index.candidates('NOTICE', '.hello')) == []
+
+
+def test_dispatch_index_keeps_order(config):
+    @module.rule('.*')
+    @module.priority('low')
+    def low(bot, trigger):
+        pass
+
+    @module.commands('hello')
+    @module.priority('medium')
+    def medium(bot, trigger):
+        pass
+
+    @module.rule('(.*)')
+    @module.priority('high')
+    def high(bot, trigger):
+        pass
+
+    index = bot._DispatchIndex(_callables(config, low, medium, high), '\\.')
+    assert _funcs(index.candidates('PRIVMSG', '.hello')) == [
+        'high', 'medium', 'low']
+    assert _funcs(index.candidates('PRIVMSG', 'hello')) == ['high', 'low']
+
+
+def test_dispatch_index_events(config):
+    @module.rule('.*')
+    @module.event('JOIN', 'PART')
+    def join_part(bot, trigger):
+        pass
+
+    @module.rule('.*')
+    def privmsg(bot, trigger):
+        pass
+
+    index = bot._DispatchIndex(_callables(config, join_part, privmsg), '\\.')
+    assert _funcs(index.candidates('JOIN', '#sopel')) == ['join_part']
+    assert _funcs(index.candidates('PART', '#sopel')) == ['join_part']
+    assert _funcs(index.candidates('PRIVMSG', 'hi')) == ['privmsg']
+    assert _funcs(index.candidates('QUIT', 'bye')) == []
+
+
+def test_dispatch_index_regex_commands_are_scanned(config):
+    @module.commands('hel+o')
+    def hello(bot, trigger):
+        pass
+
+    index = bot._DispatchIndex(_callables(config, hello), '\\.')
+    assert _funcs(index.candidates('PRIVMSG', 'anything')) == ['hello']
+
+
+def test_dispatch_index_variable_width_prefix(config):
+    config.core.prefix = '\\.|\\.\\.'
+
+    @module.commands('hello')
+    def hello(bot, trigger):
+        pass
+
+    index = bot._DispatchIndex(_callables(config, hello), config.core.prefix)
+    assert index.prefix_regexp is None
+    candidates = index.candidates('PRIVMSG', '..hello')
+    assert _funcs(candidates) == ['hello']
+    assert candidates[0][0].match('..hello')
+
+
+def test_combined_rules(config):
+    @module.rule(r'(?i)(hi|hello),? $nickname[ \t]*$')
+    def greet(bot, trigger):
+        pass
+
+    @module.rule(r'(?u).*(https?://\S+).*')
+    def url(bot, trigger):
+        pass
+
+    @module.rule(r"""(?:
+        (\S+)           # The nick
+        [:,]\s+)?
+        s/(.*)/(.*)/    # The substitution
+        """)
+    def findandreplace(bot, trigger):
+        pass
+
+    @module.rule(r'(a)\1')
+    def backref(bot, trigger):
+        pass
+
+    callables = _callables(config, greet, url, findandreplace, backref)
+    index = bot._DispatchIndex(callables, '\\.')
+    rules = index.rules['PRIVMSG']
+    assert len(rules.combined) == 1
+    assert [entry[2][0].__name__ for entry in rules.single] == ['backref']
+
+    assert _funcs(index.candidates('PRIVMSG', 'HELLO Sopel')) == [
+        'greet', 'backref']
+    assert _funcs(index.candidates('PRIVMSG', 'see http://x.com')) == [
+        'url', 'backref']
+    assert _funcs(index.candidates('PRIVMSG', 'foo: s/a/b/')) == [
+        'findandreplace', 'backref']
+    assert _funcs(index.candidates('PRIVMSG', 'nothing here')) == ['backref']
+
+
+def test_combined_rules_match_like_single_rules(config):
+    patterns = [r'.*', r'(.*)', r'$nick(help|doc)', r'(?i)YES$', r'\d+']
+    funcs = []
+    for i, pattern in enumerate(patterns):
+        func = module.rule(pattern)(lambda bot, trigger: None)
+        func.__name__ = str('rule{}'.format(i))
+        funcs.append(func)
+    callables = _callables(config, *funcs)
+    index = bot._DispatchIndex(callables, '\\.')
+    assert len(index.rules['PRIVMSG'].combined) == 1
+
+    for text in ['', 'Sopel: help', 'yes', '123 go', 'sopel, doc me']:
+        expected = [func.__name__ for func in funcs
+                    if func.rule[0].match(text)]
+        assert _funcs(index.candidates('PRIVMSG', text)) == expected
+
+
+def test_blocklist():
+    blocklist = bot._Blocklist(
+        [' spam.* ', '', 'Troll', '(?i)shout', r'(\w)\1', '[unclosed', 'a|b'],
+        normalize=lambda nick: Identifier(nick).lower())
+    assert len(blocklist) == 6
+    assert blocklist.matches('SPAMMER')
+    assert blocklist.matches('troll')
+    assert blocklist.matches(Identifier('Troll'))
+    assert not blocklist.matches('trolls')
+    assert blocklist.matches('shout')
+    assert blocklist.matches('xx')
+    assert not blocklist.matches('xy')
+    assert blocklist.matches('[UNCLOSED')
+    assert blocklist.matches('b')
+    assert not blocklist.matches('bc')
+    # Only the last alternative is anchored at the end, as it always was
+    assert blocklist.matches('ab')
+    assert blocklist.matches('apple')
+    assert not blocklist.matches('Friend')
+
+
+def test_blocklist_update():
+    blocklist = bot._Blocklist(['foo'])
+    assert blocklist.matches('foo')
+    blocklist.update(['bar'])
+    assert not blocklist.matches('foo')
+    assert blocklist.matches('bar')
+    blocklist.update([])
+    assert not blocklist
+    assert not blocklist.matches('bar')
+
+
+def test_register_interval_options():
+    @module.interval(60)
+    @module.jitter(10)
+    @module.misfire(MISFIRE_SKIP)
+    def spread(bot):
+        pass
+
+    @module.interval(5)
+    def plain(bot):
+        pass
+
+    # Only what register() uses, without connecting or loading anything
+    sopel = bot.Sopel.__new__(bot.Sopel)
+    sopel.shutdown_methods = []
+    sopel.memory = SopelMemory()
+    sopel.scheduler = JobScheduler(sopel)
+    sopel.register([], [spread, plain], [], [])
+    jobs = dict((job.func, job) for job in sopel.scheduler.jobs())
+    assert jobs[spread].jitter == 10
+    assert jobs[spread].misfire == MISFIRE_SKIP
+    assert jobs[plain].jitter == 0
+    assert jobs[plain].misfire == MISFIRE_CATCH_UP
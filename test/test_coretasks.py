@@ -0,0 +1,255 @@
+# coding=utf-8
+"""Tests for the state tracking in ``sopel.coretasks``"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import re
+import time
+
+import pytest
+
+from sopel import coretasks, module, tools
+from sopel.bot import _Blocklist
+from sopel.test_tools import MockConfig
+from sopel.tools import Identifier
+from sopel.tools.autojoin import JoinScheduler
+from sopel.tools.isupport import ISupport
+from sopel.tools.target import PrivilegesView
+from sopel.trigger import PreTrigger, Trigger
+
+
+class MockBot(object):
+    def __init__(self):
+        self.nick = Identifier('Sopel')
+        self.config = MockConfig()
+        self.memory = tools.SopelMemory()
+        self.channels = tools.SopelMemory()
+        self.privileges = PrivilegesView(self.channels)
+        self.users = tools.SopelMemory()
+        self.enabled_capabilities = set()
+        self.server_capabilities = {}
+        self._cap_reqs = {}
+        self.isupport = ISupport()
+        self.autojoin = JoinScheduler(self.join)
+        self._nick_blocklist = _Blocklist(
+            normalize=lambda nick: Identifier(nick).lower())
+        self.written = []
+
+    def write(self, args, text=None):
+        self.written.append(' '.join(args))
+
+    def join(self, channels):
+        for args in self.isupport.batch_joins(channels):
+            self.write(['JOIN'] + args)
+
+    def on_message(self, func, line):
+        pretrigger = PreTrigger(self.nick, line)
+        text = pretrigger.args[-1] if pretrigger.args else ''
+        match = re.match('.*', text)
+        func(self, Trigger(self.config, pretrigger, match))
+
+
+@pytest.fixture
+def bot():
+    return MockBot()
+
+
+def _join(bot, channel):
+    bot.on_message(coretasks.track_join,
+                   ':Sopel!sopel@example.com JOIN {}'.format(channel))
+
+
+def test_names_applied_at_end(bot):
+    _join(bot, '#Sopel')
+    bot.on_message(coretasks.handle_names,
+                   ':irc.example.net 353 Sopel = #Sopel :Sopel @Alice +Bob')
+    bot.on_message(coretasks.handle_names,
+                   ':irc.example.net 353 Sopel = #Sopel :@+Carol Dave')
+    # Nothing is recorded until the reply is complete
+    assert Identifier('Alice') not in bot.privileges[Identifier('#Sopel')]
+    bot.on_message(coretasks.end_names,
+                   ':irc.example.net 366 Sopel #Sopel :End of /NAMES list.')
+
+    privileges = bot.privileges[Identifier('#Sopel')]
+    assert privileges[Identifier('alice')] == module.OP
+    assert privileges[Identifier('bob')] == module.VOICE
+    assert privileges[Identifier('carol')] == module.OP | module.VOICE
+    assert privileges[Identifier('dave')] == 0
+    assert not coretasks._channel_sync(bot).names
+
+
+def test_names_other_channel_ignored(bot):
+    bot.on_message(coretasks.handle_names,
+                   ':irc.example.net 353 Sopel = &Other :@Alice')
+    bot.on_message(coretasks.end_names,
+                   ':irc.example.net 366 Sopel &Other :End of /NAMES list.')
+    assert Identifier('&Other') not in bot.channels
+    assert not coretasks._channel_sync(bot).names
+
+
+def test_names_isupport_prefix(bot):
+    bot.on_message(coretasks.handle_isupport,
+                   ':irc.example.net 005 Sopel PREFIX=(Yov)!@+ '
+                   ':are supported by this server')
+    _join(bot, '#Sopel')
+    bot.on_message(coretasks.handle_names,
+                   ':irc.example.net 353 Sopel = #Sopel '
+                   ':!Alice @bob!bob@example.com')
+    bot.on_message(coretasks.end_names,
+                   ':irc.example.net 366 Sopel #Sopel :End of /NAMES list.')
+    privileges = bot.privileges[Identifier('#Sopel')]
+    # Y has no privilege value in Sopel, but is still taken off the nick
+    assert privileges[Identifier('Alice')] == 0
+    assert privileges[Identifier('Bob')] == module.OP
+
+    bot.on_message(coretasks.track_modes,
+                   ':ChanServ!cs@example.com MODE #Sopel +v-o Alice Bob')
+    assert privileges[Identifier('Alice')] == module.VOICE
+    assert privileges[Identifier('Bob')] == 0
+
+
+def test_modes_params(bot):
+    _join(bot, '#Sopel')
+    bot.on_message(coretasks.handle_names,
+                   ':irc.example.net 353 Sopel = #Sopel :Alice Bob Carol')
+    bot.on_message(coretasks.end_names,
+                   ':irc.example.net 366 Sopel #Sopel :End of /NAMES list.')
+    # The ban mask, key and limit aren't nicks, and the -l takes no param
+    bot.on_message(coretasks.track_modes,
+                   ':Alice!alice@example.com MODE #Sopel '
+                   '+bokl-lv *!*@spam Bob secret 10 Carol')
+    privileges = bot.privileges[Identifier('#Sopel')]
+    assert privileges[Identifier('Bob')] == module.OP
+    assert privileges[Identifier('Carol')] == 0
+    assert Identifier('secret') not in privileges
+    assert Identifier('*!*@spam') not in privileges
+
+
+def test_isupport_chantypes(bot):
+    try:
+        bot.on_message(coretasks.handle_isupport,
+                       ':irc.example.net 005 Sopel CHANTYPES=# MODES=4 '
+                       ':are supported by this server')
+        assert bot.isupport.modes == 4
+        assert Identifier('&Sopel').is_nick()
+        assert not Identifier('#Sopel').is_nick()
+    finally:
+        Identifier.chantypes = tools._channel_prefixes
+
+
+def test_isupport_casemapping(bot):
+    _join(bot, '#Chan[1]')
+    bot.on_message(coretasks.handle_names,
+                   ':irc.example.net 353 Sopel = #chan{1} :@Foo[away] Bar')
+    bot.on_message(coretasks.end_names,
+                   ':irc.example.net 366 Sopel #chan{1} :End of /NAMES list.')
+    bot._nick_blocklist.update(['Spam^bot'])
+    try:
+        bot.on_message(coretasks.handle_isupport,
+                       ':irc.example.net 005 Sopel CASEMAPPING=ascii '
+                       ':are supported by this server')
+        channel = bot.channels[Identifier('#chan[1]')]
+        assert Identifier('#chan{1}') not in bot.channels
+        assert channel.name == Identifier('#Chan[1]')
+        assert channel.privileges[Identifier('foo[away]')] == module.OP
+        assert Identifier('foo{away}') not in channel.privileges
+        assert bot._nick_blocklist.matches('spam^bot')
+        assert not bot._nick_blocklist.matches('spam~bot')
+    finally:
+        Identifier.set_casemapping('rfc1459')
+
+
+def test_who_paced(bot):
+    channels = ['#chan{}'.format(i) for i in range(5)]
+    for channel in channels:
+        _join(bot, channel)
+    whos = [line for line in bot.written if line.startswith('WHO')]
+    assert whos == ['WHO #chan0', 'WHO #chan1']
+
+    bot.on_message(coretasks.recv_who,
+                   ':irc.example.net 352 Sopel #chan0 alice example.com '
+                   'irc.example.net Alice H :0 Alice')
+    # Nothing is recorded until the reply is complete
+    assert Identifier('Alice') not in bot.users
+    bot.on_message(coretasks.end_who,
+                   ':irc.example.net 315 Sopel #chan0 :End of /WHO list.')
+    assert bot.users[Identifier('Alice')].host == 'example.com'
+    assert Identifier('Alice') in bot.channels[Identifier('#chan0')].users
+    assert bot.written[-1] == 'WHO #chan2'
+
+    # A channel parted before its turn is skipped
+    bot.on_message(coretasks.track_part,
+                   ':Sopel!sopel@example.com PART #chan3')
+    bot.on_message(coretasks.end_who,
+                   ':irc.example.net 315 Sopel #chan1 :End of /WHO list.')
+    assert bot.written[-1] == 'WHO #chan4'
+
+
+def test_who_expired(bot, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(coretasks.time, 'time', lambda: now[0])
+    for channel in ('#chan0', '#chan1', '#chan2'):
+        _join(bot, channel)
+    coretasks.expire_who(bot)
+    assert bot.written[-1] == 'TOPIC #chan2'
+    # Neither is ever answered, and nothing else happens
+    now[0] += coretasks.WHO_TIMEOUT + 1
+    coretasks.expire_who(bot)
+    assert bot.written[-1] == 'WHO #chan2'
+    assert list(coretasks._channel_sync(bot).who_pending) == ['#chan2']
+
+
+def test_whox_tokens_released(bot):
+    bot.enabled_capabilities.add('away-notify')
+    _join(bot, '#Sopel')
+    token = bot.written[-1].rpartition(',')[2]
+    assert coretasks.who_reqs[token] == '#Sopel'
+    bot.on_message(coretasks.recv_whox,
+                   ':irc.example.net 354 Sopel {} #Sopel alice example.com '
+                   'Alice G alice'.format(token))
+    bot.on_message(coretasks.end_who,
+                   ':irc.example.net 315 Sopel #Sopel :End of /WHO list.')
+    user = bot.users[Identifier('Alice')]
+    assert user.account == 'alice'
+    assert user.away
+    assert token not in coretasks.who_reqs
+
+
+def test_autojoin_replies(bot):
+    bot.autojoin.add(['#a', '#b', '#c', '#d', '#e'])
+    channels, _ = bot.autojoin._take(time.time())
+    assert channels == ['#a', '#b', '#c', '#d', '#e']
+    _join(bot, '#a')
+    bot.on_message(coretasks.retry_join,
+                   ':irc.example.net 477 Sopel #b :Cannot join channel (+r)')
+    bot.on_message(coretasks.fail_join,
+                   ':irc.example.net 474 Sopel #c :Cannot join channel (+b)')
+    bot.on_message(coretasks.forward_join,
+                   ':irc.example.net 470 Sopel #d ##overflow '
+                   ':Forwarding to another channel')
+    _join(bot, '##overflow')
+    stats = bot.autojoin.stats()
+    assert stats['joined'] == 2
+    assert stats['failed'] == 1
+    assert stats['retries'] == 1
+    assert stats['queued'] == 1
+    assert stats['waiting'] == 1
+
+    bot.on_message(coretasks.throttle_join,
+                   ':irc.example.net 263 Sopel JOIN :Please wait a while')
+    stats = bot.autojoin.stats()
+    assert stats['queued'] == 2
+    assert stats['waiting'] == 0
+
+
+def test_cap_ls_requests(bot, monkeypatch):
+    monkeypatch.setattr(coretasks, 'batched_caps', {})
+    bot.on_message(coretasks.recieve_cap_ls_reply,
+                   ':irc.example.net CAP * LS * :multi-prefix sasl')
+    assert bot.written == []
+    bot.on_message(coretasks.recieve_cap_ls_reply,
+                   ':irc.example.net CAP * LS :away-notify')
+    assert bot.server_capabilities == {
+        'multi-prefix': None, 'sasl': None, 'away-notify': None}
+    assert 'CAP REQ multi-prefix' in bot.written
+    assert 'CAP REQ away-notify' in bot.written
+    assert bot.written[-1] == 'CAP END'
@@ -0,0 +1,84 @@
+# coding=utf-8
+"""Tests for running async def callables and jobs"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import asyncio
+import threading
+
+import pytest
+
+from sopel.tools.jobs import CoroutineRunner, JobScheduler, is_coroutine_function
+
+
+@pytest.fixture
+def runner():
+    runner = CoroutineRunner()
+    yield runner
+    runner.stop()
+
+
+class MockBot(object):
+    def __init__(self, runner):
+        self.runner = runner
+        self.errors = []
+        self.calls = []
+
+    def run_coroutine(self, coro):
+        return self.runner.submit(coro)
+
+    def error(self):
+        self.errors.append(threading.current_thread().name)
+
+
+def test_is_coroutine_function():
+    async def coroutine(bot):
+        pass
+
+    def function(bot):
+        pass
+
+    assert is_coroutine_function(coroutine)
+    assert not is_coroutine_function(function)
+
+
+def test_runner_uses_own_loop(runner):
+    async def where():
+        await asyncio.sleep(0)
+        return threading.current_thread().name
+
+    assert runner.submit(where()).result(5) == 'sopel-coroutines'
+
+
+def test_runner_uses_running_loop(runner):
+    async def where():
+        return threading.current_thread().name
+
+    async def main():
+        loop = asyncio.get_event_loop()
+        future = runner.submit(where(), loop)
+        return await asyncio.wrap_future(future)
+
+    assert asyncio.new_event_loop().run_until_complete(main()) == \
+        threading.current_thread().name
+
+
+def test_scheduler_runs_async_jobs(runner):
+    bot = MockBot(runner)
+    done = threading.Event()
+
+    async def job(bot):
+        await asyncio.sleep(0)
+        bot.calls.append(threading.current_thread().name)
+        done.set()
+
+    async def failing_job(bot):
+        raise ValueError('oops')
+
+    scheduler = JobScheduler(bot)
+    scheduler._call(job)
+    assert done.wait(5)
+    assert bot.calls == ['sopel-coroutines']
+
+    scheduler._call(failing_job)
+    runner.submit(asyncio.sleep(0.01)).result(5)
+    assert bot.errors == ['sopel-coroutines']
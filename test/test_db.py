@@ -11,10 +11,14 @@ import os
 import sqlite3
 import sys
 import tempfile
+import threading
 
 import pytest
 
-from sopel.db import SopelDB
+from sopel import db as db_module
+from sopel.db import (
+    MIGRATIONS, SopelDB, SQLiteBackend, _convert_placeholders
+)
 from sopel.test_tools import MockConfig
 from sopel.tools import Identifier
 
@@ -31,17 +35,23 @@ else:
     iterkeys = dict.iterkeys
 
 
-@pytest.fixture
-def db():
+@pytest.fixture(params=['sqlite3', 'sqlalchemy'])
+def db(request):
     config = MockConfig()
     config.core.db_filename = db_filename
+    if request.param == 'sqlalchemy':
+        pytest.importorskip('sqlalchemy')
+        config.core.db_url = 'sqlite:///' + db_filename
+        # It's off by default with db_url
+        config.core.db_cache_size = 10000
     db = SopelDB(config)
     # TODO add tests to ensure db creation works properly, too.
     return db
 
 
 def teardown_function(function):
-    os.remove(db_filename)
+    if os.path.exists(db_filename):
+        os.remove(db_filename)
 
 
 def test_get_nick_id(db):
@@ -130,6 +140,86 @@ def test_set_nick_value(db):
     check()
 
 
+def test_set_nick_values(db):
+    nick = 'Embolalia'
+    data = {
+        'key': 'value',
+        'number_key': 1234,
+        'unicode': 'EmbölaliÅ',
+    }
+    db.set_nick_values(nick, data)
+
+    conn = sqlite3.connect(db_filename)
+    nick_id = db.get_nick_id(nick)
+    for key, value in iteritems(data):
+        found_value = conn.execute(
+            'SELECT value FROM nick_values WHERE nick_id = ? AND key = ?',
+            [nick_id, key]
+        ).fetchone()[0]
+        assert json.loads(unicode(found_value)) == value
+
+
+def test_transaction(db):
+    conn = sqlite3.connect(db_filename)
+    count = 'SELECT COUNT(*) FROM nick_values'
+
+    with db.transaction():
+        db.set_nick_value('Embolalia', 'key', 'value')
+        with db.transaction():
+            db.set_nick_value('Embolalia', 'other', 'value')
+        # Not committed until the outermost transaction ends
+        assert conn.execute(count).fetchone()[0] == 0
+    assert conn.execute(count).fetchone()[0] == 2
+
+    with pytest.raises(KeyError):
+        with db.transaction():
+            db.set_nick_value('Embolalia', 'key', 'changed')
+            db.set_nick_value('Eve', 'key', 'value')
+            raise KeyError
+    assert db.get_nick_value('Embolalia', 'key') == 'value'
+    assert db.get_nick_value('Eve', 'key') is None
+    with pytest.raises(ValueError):
+        db.get_nick_id('Eve', create=False)
+
+
+def test_connection_per_thread(db):
+    if not isinstance(db._backend, SQLiteBackend):
+        pytest.skip('Only SQLiteBackend keeps connections open')
+    connections = []
+
+    def record():
+        connections.append(db._backend.connection())
+    record()
+    record()
+    thread = threading.Thread(target=record)
+    thread.start()
+    thread.join()
+    assert connections[0] is connections[1]
+    assert connections[0] is not connections[2]
+    assert db.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+
+    db.close()
+    assert db._backend.connection() is not connections[0]
+    assert db.get_nick_value('Embolalia', 'key') is None
+
+
+def test_connections_of_ended_threads_closed(db):
+    if not isinstance(db._backend, SQLiteBackend):
+        pytest.skip('Only SQLiteBackend keeps connections open')
+    db._backend.connection()
+    connections = []
+    for _ in range(20):
+        thread = threading.Thread(
+            target=lambda: connections.append(db._backend.connection()))
+        thread.start()
+        thread.join()
+    # Each new connection closes those of the threads which have ended,
+    # which leaves this thread's and the last one's
+    assert len(db._backend._connections) == 2
+    with pytest.raises(sqlite3.ProgrammingError):
+        connections[0].execute('SELECT 1')
+
+
 def test_get_nick_value(db):
     conn = sqlite3.connect(db_filename)
     cursor = conn.cursor()
@@ -254,3 +344,308 @@ def test_get_preferred_value(db):
     names = ['asdf', '#asdf']
     assert db.get_preferred_value(names, 'qwer') == 'poiu'
     assert db.get_preferred_value(names, 'lkjh') == '1234'
+
+
+def test_slugs_ignore_casemapping(db):
+    db.set_nick_value('Foo[1]', 'qwer', 'poiu')
+    db.set_channel_value('#Chan{1}', 'qwer', '/.,m')
+    Identifier.set_casemapping('ascii')
+    try:
+        assert db.get_nick_value('foo[1]', 'qwer') == 'poiu'
+        assert db.get_nick_value('foo{1}', 'qwer') == 'poiu'
+        assert db.get_channel_value('#chan[1]', 'qwer') == '/.,m'
+    finally:
+        Identifier.set_casemapping('rfc1459')
+    conn = sqlite3.connect(db_filename)
+    assert conn.execute('SELECT slug FROM nicknames').fetchall() == [
+        ('foo[1]',)]
+
+
+def test_value_cache(db):
+    conn = sqlite3.connect(db_filename)
+    db.set_nick_value('Embolalia', 'key', 'value')
+    db.set_channel_value('#asdf', 'key', 'value')
+    conn.execute("UPDATE nick_values SET value = '\"raw\"'")
+    conn.execute("UPDATE channel_values SET value = '\"raw\"'")
+    conn.commit()
+    # Served from the cache, without reading the database
+    assert db.get_nick_value('embolalia', 'key') == 'value'
+    assert db.get_channel_value('#ASDF', 'key') == 'value'
+    # Unchanged, so not written either
+    db.set_nick_value('Embolalia', 'key', 'value')
+    assert conn.execute('SELECT value FROM nick_values').fetchone()[0] == '"raw"'
+
+    db.clear_cache()
+    assert db.get_nick_value('Embolalia', 'key') == 'raw'
+    assert db.get_channel_value('#asdf', 'key') == 'raw'
+
+
+def test_shared_database_cache():
+    pytest.importorskip('sqlalchemy')
+    config = MockConfig()
+    config.core.db_url = 'sqlite:///' + db_filename
+    first = SopelDB(config)
+    second = SopelDB(config)
+    assert second.get_nick_value('Embolalia', 'tz') is None
+    first.set_nick_value('Embolalia', 'tz', 'Europe/Paris')
+    assert second.get_nick_value('Embolalia', 'tz') == 'Europe/Paris'
+    first.close()
+    second.close()
+
+
+def test_value_cache_ttl(db, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(db_module.time, 'time', lambda: now[0])
+    db._cache.ttl = db._nick_ids.ttl = 30
+    conn = sqlite3.connect(db_filename)
+    db.set_nick_value('Embolalia', 'key', 'value')
+    conn.execute("UPDATE nick_values SET value = '\"raw\"'")
+    conn.commit()
+    now[0] += 30
+    assert db.get_nick_value('Embolalia', 'key') == 'value'
+    now[0] += 1
+    assert db.get_nick_value('Embolalia', 'key') == 'raw'
+
+
+def test_value_cache_after_rollback(db):
+    db.set_nick_value('Embolalia', 'key', 'value')
+    with pytest.raises(KeyError):
+        with db.transaction():
+            db.set_nick_value('Embolalia', 'key', 'changed')
+            assert db.get_nick_value('Embolalia', 'key') == 'changed'
+            raise KeyError
+    assert db.get_nick_value('Embolalia', 'key') == 'value'
+
+
+def test_value_cache_merge(db):
+    db.set_nick_value('Embolalia', 'foo', 'bar')
+    db.set_nick_value('Embo', 'foo', 'baz')
+    db.set_nick_value('Embo', 'spam', 'eggs')
+    db.merge_nick_groups('Embolalia', 'Embo')
+    assert db.get_nick_value('Embo', 'foo') == 'bar'
+    assert db.get_nick_value('Embolalia', 'spam') == 'eggs'
+
+    db.delete_nick_group('Embo')
+    assert db.get_nick_value('Embolalia', 'foo') is None
+
+
+def test_write_behind(db):
+    config = MockConfig()
+    config.core.db_filename = db_filename
+    config.core.db_cache_mode = 'write-behind'
+    config.core.db_flush_interval = 60
+    db.close()
+    db = SopelDB(config)
+    conn = sqlite3.connect(db_filename)
+    count = 'SELECT COUNT(*) FROM nick_values'
+
+    db.set_nick_values('Embolalia', {'key': 'value', 'other': 1234})
+    db.set_channel_value('#asdf', 'key', 'value')
+    assert db.get_nick_value('Embolalia', 'other') == 1234
+    assert db.get_channel_value('#asdf', 'key') == 'value'
+    assert conn.execute(count).fetchone()[0] == 0
+
+    db.flush()
+    assert conn.execute(count).fetchone()[0] == 2
+    assert conn.execute(
+        'SELECT value FROM channel_values').fetchone()[0] == '"value"'
+
+    # Pending changes aren't lost to a merge or when closing
+    db.set_nick_value('Embo', 'spam', 'eggs')
+    db.merge_nick_groups('Embolalia', 'Embo')
+    db.set_nick_value('Embolalia', 'key', 'changed')
+    db.close()
+    assert conn.execute(count).fetchone()[0] == 3
+    assert conn.execute(
+        "SELECT value FROM nick_values WHERE key = 'key'"
+    ).fetchone()[0] == '"changed"'
+
+
+def test_nick_id_cache(db):
+    conn = sqlite3.connect(db_filename)
+    nick_id = db.get_nick_id(Identifier('Embolalia'))
+    conn.execute('DELETE FROM nicknames')
+    conn.commit()
+    # Served from the cache, without reading the database
+    assert db.get_nick_id(Identifier('embolalia')) == nick_id
+    db.clear_cache()
+    with pytest.raises(ValueError):
+        db.get_nick_id(Identifier('Embolalia'), create=False)
+
+    # Unknown nicks are cached as such, until they're created
+    nick_id = db.get_nick_id(Identifier('Embolalia'))
+    with pytest.raises(ValueError):
+        db.get_nick_id(Identifier('Embo'), create=False)
+    version = db._cache_version
+    db.alias_nick('Embolalia', 'Embo')
+    # Only that nick's entry is replaced, and other reads may still fill
+    assert db._cache_version == version
+    assert db._nick_ids.get('embo') == nick_id
+    assert db.get_nick_id(Identifier('Embo'), create=False) == nick_id
+    db.unalias_nick('Embo')
+    with pytest.raises(ValueError):
+        db.get_nick_id(Identifier('Embo'), create=False)
+
+    other_id = db.get_nick_id(Identifier('Eve'))
+    db.alias_nick('Eve', 'Mallory')
+    db.merge_nick_groups('Embolalia', 'Eve')
+    assert db.get_nick_id(Identifier('Mallory'), create=False) == nick_id
+    assert other_id != nick_id
+
+    db.delete_nick_group('Embolalia')
+    for nick in ('Embolalia', 'Eve', 'Mallory'):
+        with pytest.raises(ValueError):
+            db.get_nick_id(Identifier(nick), create=False)
+
+
+def test_convert_placeholders():
+    sql = "SELECT * FROM t WHERE a = ? AND b LIKE '%?' AND \"c?\" = ?"
+    assert _convert_placeholders(sql, 'qmark') == sql
+    assert _convert_placeholders(sql, 'format') == (
+        "SELECT * FROM t WHERE a = %s AND b LIKE '%%?' AND \"c?\" = %s")
+    assert _convert_placeholders(sql, 'numeric') == (
+        "SELECT * FROM t WHERE a = :1 AND b LIKE '%?' AND \"c?\" = :2")
+    assert _convert_placeholders(sql, 'named') == (
+        "SELECT * FROM t WHERE a = :p1 AND b LIKE '%?' AND \"c?\" = :p2")
+
+
+def test_sqlalchemy_in_memory():
+    pytest.importorskip('sqlalchemy')
+    config = MockConfig()
+    config.core.db_url = 'sqlite://'
+    memory_db = SopelDB(config)
+    assert memory_db.filename is None
+    assert memory_db.get_uri() == 'sqlite://'
+
+    memory_db.set_nick_value('Embolalia', 'key', 'value')
+    memory_db.alias_nick('Embolalia', 'Embo')
+    with pytest.raises(ValueError):
+        memory_db.alias_nick('Embolalia', 'Embo')
+    memory_db.clear_cache()
+    assert memory_db.get_nick_value('Embo', 'key') == 'value'
+    rows = memory_db.execute('SELECT slug FROM nicknames ORDER BY slug')
+    assert [row[0] for row in rows] == ['embo', 'embolalia']
+
+
+def test_migrate_legacy_schema():
+    conn = sqlite3.connect(db_filename)
+    conn.execute('CREATE TABLE nick_ids '
+                 '(nick_id INTEGER PRIMARY KEY AUTOINCREMENT)')
+    conn.execute('CREATE TABLE nicknames (nick_id INTEGER REFERENCES '
+                 'nick_ids, slug STRING PRIMARY KEY, canonical string)')
+    conn.execute('CREATE TABLE nick_values (nick_id INTEGER REFERENCES '
+                 'nick_ids(nick_id), key STRING, value STRING, '
+                 'PRIMARY KEY (nick_id, key))')
+    conn.execute('CREATE TABLE channel_values (channel STRING, key STRING, '
+                 'value STRING, PRIMARY KEY (channel, key))')
+    conn.execute('INSERT INTO nick_ids VALUES (1)')
+    conn.execute("INSERT INTO nicknames VALUES (1, 'embolalia', 'Embolalia')")
+    conn.execute("INSERT INTO nick_values VALUES (1, '42', '1234')")
+    conn.execute("INSERT INTO channel_values VALUES ('#asdf', 'key', "
+                 "'\"value\"')")
+    conn.commit()
+    assert conn.execute(
+        'SELECT typeof(key), typeof(value) FROM nick_values'
+    ).fetchone() == ('integer', 'integer')
+
+    config = MockConfig()
+    config.core.db_filename = db_filename
+    db = SopelDB(config)
+    assert db.get_nick_value('Embolalia', '42') == 1234
+    assert db.get_channel_value('#asdf', 'key') == 'value'
+    assert conn.execute(
+        'SELECT typeof(key), typeof(value) FROM nick_values'
+    ).fetchone() == ('text', 'text')
+    assert conn.execute(
+        'SELECT version FROM schema_version').fetchone()[0] == len(MIGRATIONS)
+    indexes = [row[0] for row in conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'index'")]
+    assert 'nick_values_key' in indexes
+    assert 'channel_values_key' in indexes
+
+    # Nothing more to do the next time
+    db.close()
+    db = SopelDB(config)
+    assert db.get_nick_value('Embolalia', '42') == 1234
+
+
+def test_msgpack_values():
+    pytest.importorskip('msgpack')
+    config = MockConfig()
+    config.core.db_filename = db_filename
+    db = SopelDB(config)
+    db.set_nick_value('Embolalia', 'old', ['json', 1])
+    db.set_nick_value('Embolalia', 'changed', 'json')
+    db.close()
+
+    config.core.db_value_encoding = 'msgpack'
+    db = SopelDB(config)
+    conn = sqlite3.connect(db_filename)
+    typeof = 'SELECT typeof(value) FROM nick_values WHERE key = ?'
+    assert db.get_nick_value('Embolalia', 'old') == ['json', 1]
+    db.set_nick_value('Embolalia', 'changed', 'msgpack')
+    db.set_nick_value('Embolalia', 'new', {'é': [1, 2.5, None]})
+    db.set_channel_value('#asdf', 'key', 'value')
+    assert conn.execute(typeof, ['old']).fetchone()[0] == 'text'
+    assert conn.execute(typeof, ['changed']).fetchone()[0] == 'blob'
+
+    db.clear_cache()
+    assert db.get_nick_value('Embolalia', 'changed') == 'msgpack'
+    assert db.get_nick_value('Embolalia', 'new') == {'é': [1, 2.5, None]}
+    assert db.get_channel_value('#asdf', 'key') == 'value'
+    # Unchanged, so not written again
+    conn.execute("UPDATE nick_values SET value = 'raw' WHERE key = 'new'")
+    conn.commit()
+    db.set_nick_value('Embolalia', 'new', {'é': [1, 2.5, None]})
+    assert conn.execute(typeof, ['new']).fetchone()[0] == 'text'
+
+
+def test_get_nick_values(db):
+    db.set_nick_values('Embolalia', {'foo': 'bar', 'number': 1234})
+    db.clear_cache()
+    assert db.get_nick_values('embolalia', ['foo', 'number', 'unset']) == {
+        'foo': 'bar', 'number': 1234, 'unset': None}
+    assert db.get_nick_values('Eve', ['foo']) == {'foo': None}
+
+
+def test_get_many(db):
+    db.set_nick_value('Embolalia', 'timezone', 'Europe/Paris')
+    db.alias_nick('Embolalia', 'Embo')
+    db.set_nick_value('Eve', 'timezone', 'UTC')
+    db.get_nick_id(Identifier('Mallory'))
+    db.page_size = 2
+    db.clear_cache()
+    values = db.get_many(['Embo', 'embolalia', 'Eve', 'Mallory', 'Unknown'],
+                         'timezone')
+    assert values == {
+        Identifier('Embolalia'): 'Europe/Paris',
+        Identifier('Embo'): 'Europe/Paris',
+        Identifier('Eve'): 'UTC',
+        Identifier('Mallory'): None,
+        Identifier('Unknown'): None,
+    }
+
+
+def test_iter_nick_values(db):
+    for i in range(7):
+        db.set_nick_value('Nick{}'.format(i), 'timezone', 'UTC+{}'.format(i))
+    db.set_nick_value('Nick0', 'other', 'value')
+    db.alias_nick('Nick0', 'Alias')
+
+    values = list(db.iter_nick_values('timezone', page_size=3))
+    assert values == [(Identifier('Alias'), 'UTC+0')] + [
+        (Identifier('Nick{}'.format(i)), 'UTC+{}'.format(i))
+        for i in range(7)]
+    assert isinstance(values[0][0], Identifier)
+    assert list(db.iter_nick_values('unset')) == []
+
+
+def test_iter_channel_values(db):
+    for i in range(5):
+        db.set_channel_value('#Chan{}'.format(i), 'safety', i % 2 == 0)
+    db.set_channel_value('#other', 'unrelated', True)
+    values = list(db.iter_channel_values('safety', page_size=2))
+    assert values == [('#chan{}'.format(i), i % 2 == 0) for i in range(5)]
+    strict = [channel for channel, value in db.iter_channel_values('safety')
+              if value]
+    assert strict == ['#chan0', '#chan2', '#chan4']
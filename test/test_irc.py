@@ -8,10 +8,12 @@ import asynchat
 import os
 import shutil
 import socket
+import sys
 import tempfile
+import threading
 import asyncore
 
-from sopel import irc
+from sopel import backends, irc
 from sopel.tools import Identifier
 import sopel.config as conf
 
@@ -144,3 +146,133 @@ def test_bot_connect(bot):
 
     # Do main run
     test_bot.run(HOST, s.address[1])
+
+
+def start_threaded_server(handler):
+    """Serve one connection on a thread, calling ``handler`` with each line.
+
+    ``handler`` returns the reply to send, ``None`` for no reply, or
+    ``SERVER_QUIT`` to hang up. The lines received are returned.
+    """
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.bind((HOST, 0))
+    listener.listen(1)
+    received = []
+
+    def serve():
+        conn, _ = listener.accept()
+        listener.close()
+        reader = conn.makefile('rb')
+        for line in reader:
+            line = line.decode('utf-8').rstrip('\r\n')
+            received.append(line)
+            response = handler(line)
+            if response == SERVER_QUIT:
+                break
+            if response is not None:
+                conn.sendall(':fake.server {}\r\n'.format(response).encode())
+        reader.close()
+        conn.close()
+
+    thread = threading.Thread(target=serve)
+    thread.daemon = True
+    thread.start()
+    return listener.getsockname()[1], received
+
+
+asyncio_only = pytest.mark.skipif(
+    'asyncio' not in backends.available_backends(),
+    reason='the asyncio backend needs Python 3.5+')
+
+
+@asyncio_only
+def test_asyncio_bot_connect(bot):
+    test_bot = bot(
+        '[core]\n'
+        'owner=Baz\n'
+        'nick=Foo\n'
+        'user=Bar\n'
+        'name=Sopel\n'
+        'host=127.0.0.1\n'
+        'timeout=10\n'
+        'backend=asyncio\n'
+    )
+    events = []
+    test_bot.dispatch = lambda pretrigger: events.append(pretrigger.event)
+
+    def replies(msg):
+        if msg.startswith('NICK'):
+            return '001 Foo :Hello'
+        elif msg.startswith('USER'):
+            return 'PING :fake.server'
+        elif msg.startswith('PONG'):
+            return SERVER_QUIT
+
+    port, received = start_threaded_server(replies)
+    test_bot.run(HOST, port)
+
+    assert received == ['CAP LS 302', 'NICK Foo', 'USER Bar +iw Foo :Sopel',
+                        'PONG fake.server']
+    assert events == ['001', 'PING']
+
+
+@asyncio_only
+def test_asyncio_ping_timeout(bot):
+    test_bot = bot(
+        '[core]\n'
+        'owner=Baz\n'
+        'nick=Foo\n'
+        'host=127.0.0.1\n'
+        'timeout=1\n'
+        'backend=asyncio\n'
+    )
+    port, received = start_threaded_server(lambda msg: None)
+    test_bot.run(HOST, port)
+
+    assert 'PING 127.0.0.1' in received
+
+
+def test_get_backend():
+    with pytest.raises(ValueError):
+        backends.get_backend('carrier-pigeon')
+    for name in backends.available_backends():
+        assert issubclass(backends.get_backend(name), backends.AbstractBackend)
+
+
+def _decode(data):
+    try:
+        return bytes(data).decode('utf-8')
+    except UnicodeDecodeError:
+        return None
+
+
+def test_line_buffer():
+    buffer = backends.LineBuffer(_decode)
+    assert buffer.feed(b'PING :a\r\nPI') == ['PING :a\r']
+    assert buffer.feed(b'NG') == []
+    assert len(buffer) == 4
+    assert buffer.pending() == 'PING'
+    assert buffer.feed(b' :b\r\n:x PRIVMSG #c :\xc3\xa9\n\xff\n\n') == [
+        'PING :b\r', ':x PRIVMSG #c :\xe9', '']
+    assert len(buffer) == 0
+
+
+def test_line_buffer_discards_long_lines():
+    buffer = backends.LineBuffer(_decode, max_length=10)
+    assert buffer.feed(b'0123456789') == []
+    assert buffer.feed(b'abc') == []
+    assert len(buffer) == 0
+    assert buffer.feed(b'def\nok\n') == ['ok']
+
+
+def test_encoding_fallbacks(bot):
+    test_bot = bot(
+        '[core]\n'
+        'owner=Baz\n'
+        'encoding_fallbacks=cp1252\n'
+    )
+    backend = backends.AbstractBackend(test_bot)
+    assert backend.encodings == ['utf-8', 'cp1252']
+    assert backend.decode(b'caf\xc3\xa9') == 'caf\xe9'
+    assert backend.decode(b'caf\xe9') == 'caf\xe9'
+    assert backend.decode(b'\x81') is None
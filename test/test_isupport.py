@@ -0,0 +1,96 @@
+# coding=utf-8
+"""Tests for sopel.tools.isupport"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import pytest
+
+from sopel.tools.isupport import ISupport
+
+
+@pytest.fixture
+def isupport():
+    isupport = ISupport()
+    isupport.update([
+        'CASEMAPPING=ascii', 'CHANMODES=beI,k,l,imnpstz', 'CHANTYPES=#',
+        'MODES=4', 'NETWORK=Example\\x20Net', 'PREFIX=(ov)@+', 'SAFELIST',
+        'TARGMAX=JOIN:,KICK:1,NOTICE:4,PRIVMSG:4',
+    ])
+    return isupport
+
+
+def test_defaults():
+    isupport = ISupport()
+    assert 'PREFIX' not in isupport
+    assert isupport.prefix == ('qaohv', '~&@%+')
+    assert isupport.linelen == 512
+    assert isupport.modes == 3
+    assert isupport.max_targets('PRIVMSG') == 1
+    assert isupport.max_targets('JOIN') is None
+
+
+def test_update(isupport):
+    assert isupport['NETWORK'] == 'Example Net'
+    assert isupport['SAFELIST'] == ''
+    assert isupport.casemapping == 'ascii'
+    assert isupport.chantypes == '#'
+    assert isupport.chanmodes == ('beI', 'k', 'l', 'imnpstz')
+    assert isupport.prefix == ('ov', '@+')
+    assert isupport.targmax == {
+        'JOIN': None, 'KICK': 1, 'NOTICE': 4, 'PRIVMSG': 4}
+
+    isupport.update(['-SAFELIST', 'MODES=', 'PREFIX='])
+    assert 'SAFELIST' not in isupport
+    assert isupport.get('SAFELIST') is None
+    assert isupport.modes is None
+    assert isupport.prefix == ('', '')
+
+
+def test_maxtargets():
+    isupport = ISupport()
+    isupport.update(['MAXTARGETS=3'])
+    assert isupport.max_targets('PRIVMSG') == 3
+    assert isupport.max_targets('KICK') == 1
+
+
+def test_malformed_limits():
+    isupport = ISupport()
+    isupport.update(['MAXTARGETS=abc', 'TARGMAX=PRIVMSG:x,KICK:2'])
+    assert isupport.maxtargets is None
+    assert isupport.targmax == {'PRIVMSG': None, 'KICK': 2}
+    assert isupport.max_targets('PRIVMSG') is None
+    assert isupport.max_targets('NOTICE') == 1
+    targets = ['#chan{}'.format(i) for i in range(3)]
+    assert list(isupport.batch_targets('PRIVMSG', targets)) == [targets]
+
+
+def test_batch_targets(isupport):
+    targets = ['#chan{}'.format(i) for i in range(10)]
+    assert list(isupport.batch_targets('PRIVMSG', targets)) == [
+        targets[0:4], targets[4:8], targets[8:10]]
+    assert list(isupport.batch_targets('KICK', targets[:2])) == [
+        targets[0:1], targets[1:2]]
+    # Each of these is 7 bytes, with its comma
+    assert list(isupport.batch_targets('JOIN', targets, length=21)) == [
+        targets[0:3], targets[3:6], targets[6:9], targets[9:10]]
+
+
+def test_batch_joins(isupport):
+    channels = ['#a', ('#b', 'key'), ('#c', None), ('#d', 'other')]
+    assert list(isupport.batch_joins(channels)) == [
+        ['#b,#d,#a,#c', 'key,other']]
+    isupport.update(['TARGMAX=JOIN:3'])
+    assert list(isupport.batch_joins(channels)) == [
+        ['#b,#d,#a', 'key,other'], ['#c']]
+
+    isupport.update(['TARGMAX=', 'LINELEN=100'])
+    channels = ['#{:09d}'.format(i) for i in range(20)]
+    lines = list(isupport.batch_joins(channels))
+    assert [len(args[0].split(',')) for args in lines] == [8, 8, 4]
+    assert all(len('JOIN {}\r\n'.format(args[0])) <= 100 for args in lines)
+
+
+def test_batch_modes(isupport):
+    changes = [('+o', 'Alice'), ('+o', 'Bob'), ('-v', 'Carol'),
+               ('+m', None), ('+v', 'Dave'), ('-o', 'Eve')]
+    assert list(isupport.batch_modes(changes)) == [
+        ['+oo-v+mv', 'Alice', 'Bob', 'Carol', 'Dave'], ['-o', 'Eve']]
@@ -0,0 +1,255 @@
+# coding=utf-8
+"""Tests for the job scheduler and worker pool"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import threading
+import time
+
+import pytest
+
+from sopel.tools import jobs
+from sopel.tools.jobs import Job, JobScheduler, WorkerPool
+
+
+@pytest.fixture
+def gate():
+    """An event for holding up worker threads until a test is ready."""
+    event = threading.Event()
+    yield event
+    event.set()
+
+
+def _run_all(pool):
+    """Wait until everything submitted to ``pool`` has run."""
+    done = threading.Event()
+    pool.submit(done.set, priority='low')
+    assert done.wait(5)
+
+
+def test_worker_pool_runs_calls():
+    pool = WorkerPool(2)
+    results = []
+    for i in range(10):
+        pool.submit(results.append, (i,))
+    _run_all(pool)
+    assert sorted(results) == list(range(10))
+    stats = pool.stats()
+    assert stats['submitted'] == 11
+    assert stats['threads'] <= 2
+    pool.stop()
+
+
+def test_worker_pool_priority(gate):
+    pool = WorkerPool(1)
+    results = []
+    pool.submit(gate.wait)
+    pool.submit(results.append, ('low',), priority='low')
+    pool.submit(results.append, ('medium',))
+    pool.submit(results.append, ('high',), priority='high')
+    gate.set()
+    _run_all(pool)
+    assert results == ['high', 'medium', 'low']
+    pool.stop()
+
+
+def test_worker_pool_drop(gate):
+    pool = WorkerPool(1, queue_size=1, overflow='drop')
+    assert pool.submit(gate.wait)
+    _wait_for_running(pool)
+    assert pool.submit(lambda: None)
+    assert not pool.submit(lambda: None, priority='high')
+    assert pool.queue_depth == 1
+    assert pool.stats()['dropped'] == 1
+    pool.stop()
+
+
+def test_worker_pool_shed(gate):
+    pool = WorkerPool(1, queue_size=1, overflow='shed')
+    results = []
+    pool.submit(gate.wait)
+    _wait_for_running(pool)
+    assert pool.submit(results.append, ('low',), priority='low')
+    assert pool.submit(results.append, ('high',), priority='high')
+    assert not pool.submit(results.append, ('medium',))
+    stats = pool.stats()
+    assert stats['shed'] == 1
+    assert stats['dropped'] == 1
+    pool.queue_size = 2
+    gate.set()
+    _run_all(pool)
+    assert results == ['high']
+    pool.stop()
+
+
+def test_worker_pool_module_limits(gate):
+    pool = WorkerPool(4, overflow='drop', module_limits={'url': 1})
+    assert pool.submit(gate.wait, module='url')
+    assert not pool.submit(lambda: None, module='url')
+    assert pool.submit(lambda: None, module='seen')
+    assert pool.stats()['modules'].get('url') == 1
+    gate.set()
+    _run_all(pool)
+    assert pool.stats()['modules'] == {}
+    assert pool.submit(lambda: None, module='url')
+    pool.stop()
+
+
+def test_worker_pool_block(gate):
+    pool = WorkerPool(1, queue_size=1, overflow='block')
+    results = []
+    pool.submit(gate.wait)
+    _wait_for_running(pool)
+    pool.submit(results.append, (1,))
+
+    submitter = threading.Thread(target=pool.submit,
+                                 args=(results.append, (2,)))
+    submitter.start()
+    submitter.join(0.1)
+    assert submitter.is_alive()
+    gate.set()
+    submitter.join(5)
+    assert not submitter.is_alive()
+    _run_all(pool)
+    assert results == [1, 2]
+    pool.stop()
+
+
+def test_parse_module_limits():
+    assert WorkerPool.parse_module_limits(['url=4', ' seen = 1']) == {
+        'url': 4, 'seen': 1}
+    with pytest.raises(ValueError):
+        WorkerPool.parse_module_limits(['url'])
+
+
+def _wait_for_running(pool):
+    for _ in range(500):
+        if pool.stats()['running']:
+            return
+        threading.Event().wait(0.01)
+    raise AssertionError('Worker never started')
+
+
+class MockBot(object):
+    def __init__(self):
+        self.errors = 0
+
+    def error(self):
+        self.errors += 1
+
+
+def _inline(func):
+    """Mark ``func`` to be called in the scheduler's thread."""
+    func.thread = False
+    return func
+
+
+@pytest.fixture
+def scheduler():
+    scheduler = JobScheduler(MockBot())
+    scheduler.daemon = True
+    scheduler.start()
+    yield scheduler
+    scheduler.stop()
+    scheduler.join(5)
+
+
+def test_scheduler_wakes_for_earlier_job(scheduler):
+    called = threading.Event()
+    scheduler.add_job(Job(3600, _inline(lambda bot: None)))
+    # Let the thread go to sleep until the first job
+    time.sleep(0.05)
+    start = time.time()
+    scheduler.add_job(Job(0.05, _inline(lambda bot: called.set())))
+    assert called.wait(5)
+    assert time.time() - start < 1
+
+
+def test_scheduler_cancel(scheduler):
+    calls = []
+    job = scheduler.add_job(Job(0.01, _inline(lambda bot: calls.append(bot))))
+    time.sleep(0.1)
+    assert job.cancel()
+    assert not job.cancel()
+    count = len(calls)
+    assert count
+    time.sleep(0.1)
+    assert len(calls) == count
+    assert scheduler.jobs() == []
+
+
+def test_scheduler_remove_jobs():
+    scheduler = JobScheduler(MockBot())
+
+    def func(bot):
+        pass
+
+    other = _inline(lambda bot: None)
+    other.__module__ = 'other'
+    scheduler.add_job(Job(10, func))
+    scheduler.add_job(Job(20, func))
+    kept = scheduler.add_job(Job(5, other))
+    assert scheduler.remove_jobs(func=func) == 2
+    assert scheduler.jobs() == [kept]
+    assert scheduler.remove_jobs(module='other') == 1
+    assert kept.cancelled
+    scheduler.clear_jobs()
+    assert scheduler.jobs() == []
+
+
+def test_scheduler_cancel_and_add_again(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(jobs.time, 'time', lambda: now[0])
+    scheduler = JobScheduler(MockBot())
+    calls = []
+
+    def func(bot):
+        calls.append(now[0])
+        if len(calls) == 1:
+            # While it's running
+            job.cancel()
+            scheduler.add_job(job)
+
+    job = scheduler.add_job(Job(10, _inline(func)))
+    job.cancel()
+    scheduler.add_job(job)
+    live = [entry for entry in scheduler._heap if entry[2] is not None]
+    assert live == [[1010, 1, job]]
+
+    for _ in range(3):
+        now[0] = job.next_time
+        scheduler._do_next_job()
+        live = [entry for entry in scheduler._heap if entry[2] is not None]
+        assert len(live) == 1
+    assert calls == [1010, 1020, 1030]
+
+
+def test_job_misfire_policies(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(jobs.time, 'time', lambda: now[0])
+    catch_up = Job(10, None)
+    coalesce = Job(10, None, misfire=jobs.MISFIRE_COALESCE)
+    skip = Job(10, None, misfire=jobs.MISFIRE_SKIP)
+    assert catch_up.next_time == 1010
+
+    # 1000 seconds late
+    now[0] = 2010.0
+    assert skip.skip_misfire()
+    assert not catch_up.skip_misfire()
+    for job in (catch_up, coalesce, skip):
+        job.next()
+    assert catch_up.next_time == 2010 - 10 * Job.max_catchup
+    assert coalesce.next_time == 2020
+    assert skip.next_time == 2020
+
+    with pytest.raises(ValueError):
+        Job(10, None, misfire='sometimes')
+
+
+def test_job_jitter(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(jobs.time, 'time', lambda: now[0])
+    job = Job(60, None, jitter=5)
+    for i in range(1, 20):
+        assert 1000 + 60 * i <= job.next_time <= 1000 + 60 * i + 5
+        now[0] = job.next_time
+        job.next()
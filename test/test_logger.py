@@ -0,0 +1,58 @@
+# coding=utf-8
+"""Tests for the raw log writer"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import gzip
+import io
+import os
+
+from sopel.logger import RawLogWriter
+
+
+def _read(filename):
+    with io.open(filename, encoding='utf-8', newline='') as f:
+        return [line.split('\t', 1) for line in f.read().split('\n')[:-1]]
+
+
+def test_raw_log_writer(tmpdir):
+    filename = os.path.join(str(tmpdir), 'raw.log')
+    writer = RawLogWriter(filename, flush_lines=2)
+    writer.write(':server PING :x\r\n', '<<')
+    writer.write('PONG :x\r\n', '>>')
+    writer.write('QUIT\r\n', '>>')
+    writer.close()
+    writer.write('ignored', '>>')
+
+    lines = _read(filename)
+    assert [line[1] for line in lines] == [
+        ':server PING :x\r', 'PONG :x\r', 'QUIT\r']
+    assert [line[0][:2] for line in lines] == ['<<', '>>', '>>']
+
+
+def test_raw_log_writer_drops_oldest(tmpdir):
+    filename = os.path.join(str(tmpdir), 'raw.log')
+    writer = RawLogWriter(filename, buffer_lines=3, flush_lines=100,
+                          flush_interval=60)
+    writer._thread = True  # Hold off the writer thread until closing
+    for i in range(5):
+        writer.write('line %d' % i, '>>')
+    writer._thread = None
+    writer.write('line 5', '>>')
+    writer.close()
+
+    lines = _read(filename)
+    assert lines[0][0].startswith('!!')
+    assert lines[0][1] == '3 lines were dropped from the raw log'
+    assert [line[1] for line in lines[1:]] == ['line 3', 'line 4', 'line 5']
+
+
+def test_raw_log_writer_rotates(tmpdir):
+    filename = os.path.join(str(tmpdir), 'raw.log')
+    writer = RawLogWriter(filename, max_bytes=100, backup_count=2,
+                          compress=True, flush_lines=1)
+    for i in range(4):
+        writer._flush([('>>', 0, 'x' * 100)], 0)
+
+    assert sorted(os.listdir(str(tmpdir))) == ['raw.log.1.gz', 'raw.log.2.gz']
+    with gzip.open(filename + '.1.gz') as f:
+        assert f.read().count(b'\n') == 1
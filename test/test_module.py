@@ -68,6 +68,20 @@ def test_interval():
     assert mock.interval == [5]
 
 
+def test_jitter():
+    @module.jitter(10)
+    def mock(bot):
+        return True
+    assert mock.jitter == 10
+
+
+def test_misfire():
+    @module.misfire('skip')
+    def mock(bot):
+        return True
+    assert mock.misfire == 'skip'
+
+
 def test_rule():
     @module.rule('.*')
     def mock(bot, trigger, match):
@@ -0,0 +1,124 @@
+# coding=utf-8
+"""Tests for the outbound line scheduler"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import threading
+import time
+
+from sopel.tools.outbound import OutboundQueue
+
+
+class Recorder(object):
+    """Collects sent lines, and signals once ``count`` have been sent."""
+    def __init__(self, count):
+        self.lines = []
+        self.batches = []
+        self.count = count
+        self.done = threading.Event()
+
+    def __call__(self, lines):
+        self.batches.append(lines)
+        self.lines.extend(lines)
+        if len(self.lines) >= self.count:
+            self.done.set()
+
+
+def test_round_robin_and_priority():
+    sent = Recorder(7)
+    queue = OutboundQueue(sent, burst=10, rate=1000)
+    queue.put('a1', '#a')
+    queue.put('a2', '#A')
+    queue.put('a3', '#a')
+    queue.put('b1', '#b')
+    queue.put('x1')
+    queue.put('b2', '#b')
+    queue.put('pong', high_priority=True)
+    assert queue.queue_length('#a') == 3
+    assert queue.queue_length('#b') == 2
+    assert queue.queue_length() == 1
+    assert queue.queue_lengths() == {'#a': 3, '#b': 2, None: 1, 'high': 1}
+    assert len(queue) == 7
+
+    queue.start()
+    assert sent.done.wait(5)
+    assert sent.lines == ['pong', 'a1', 'b1', 'x1', 'a2', 'b2', 'a3']
+    # There were enough tokens to send everything at once
+    assert len(sent.batches) == 1
+    assert queue.queue_lengths() == {}
+    queue.stop()
+
+
+def test_token_bucket():
+    sent = Recorder(5)
+    queue = OutboundQueue(sent, burst=2, rate=20)
+    start = time.time()
+    for i in range(5):
+        queue.put(str(i), '#a')
+    queue.start()
+    assert sent.done.wait(5)
+    # Two lines go out at once, then one every 50ms
+    assert time.time() - start >= 0.14
+    assert sent.batches[0] == ['0', '1']
+    queue.stop()
+
+
+def test_stop_discards():
+    sent = Recorder(1)
+    queue = OutboundQueue(sent)
+    queue.put('line', '#a')
+    queue.stop()
+    assert len(queue) == 0
+    assert not queue.put('line', '#a')
+    queue.start()
+    assert not sent.done.wait(0.1)
+
+
+def test_put_last():
+    sent = Recorder(4)
+    queue = OutboundQueue(sent, burst=10, rate=1000)
+    queue.put('a1', '#a')
+    queue.put('b1', '#b')
+    assert queue.put_last('quit')
+    assert not queue.put_last('quit again')
+    assert queue.put('pong', high_priority=True)
+    # Too late for this one
+    assert not queue.put('a2', '#a')
+    assert len(queue) == 4
+    queue.start()
+    assert sent.done.wait(5)
+    assert sent.lines == ['pong', 'a1', 'b1', 'quit']
+    queue.stop()
+
+
+def test_wait_empty():
+    sent = Recorder(3)
+    queue = OutboundQueue(sent, burst=1, rate=20)
+    for i in range(3):
+        queue.put(str(i), '#a')
+    assert not queue.wait_empty(0.01)
+    queue.start()
+    assert queue.wait_empty(5)
+    assert sent.lines == ['0', '1', '2']
+    assert queue.wait_empty(0)
+    queue.stop()
+
+
+def test_check_loop():
+    queue = OutboundQueue(lambda lines: None)
+    results = [queue.check_loop('#a', 'spam') for _ in range(12)]
+    assert results[:5] == ['spam'] * 5
+    assert results[5:8] == ['...'] * 3
+    assert results[8:] == [None] * 4
+    assert queue.check_loop('#b', 'spam') == 'spam'
+    assert queue.check_loop('#A', 'eggs') == 'eggs'
+
+
+def test_batch_size():
+    sent = Recorder(5)
+    queue = OutboundQueue(sent, burst=10, rate=1000, batch_size=2)
+    for i in range(5):
+        queue.put(str(i), '#a')
+    queue.start()
+    assert sent.done.wait(5)
+    assert sent.batches == [['0', '1'], ['2', '3'], ['4']]
+    queue.stop()
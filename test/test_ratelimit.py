@@ -0,0 +1,74 @@
+# coding=utf-8
+"""Tests for sopel.tools.ratelimit"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+from sopel.tools import Identifier
+from sopel.tools.ratelimit import RateLimiter, USER, CHANNEL, GLOBAL
+
+
+def limited(rate=0, channel_rate=0, global_rate=0):
+    def func(bot, trigger):
+        pass
+    func.rate = rate
+    func.channel_rate = channel_rate
+    func.global_rate = global_rate
+    return func
+
+
+def test_user_limit():
+    limiter = RateLimiter()
+    func = limited(rate=10)
+    nick = Identifier('Foo')
+    assert limiter.check(func, nick, '#chan', now=100) is None
+    limiter.record(func, nick, '#chan', now=100)
+
+    limit = limiter.check(func, Identifier('FOO'), '#other', now=105)
+    assert limit.scope == USER
+    assert limit.target == nick
+    assert limit.remaining == 5
+    assert limiter.check(func, Identifier('Bar'), '#chan', now=105) is None
+    assert limiter.check(func, nick, '#chan', now=110) is None
+
+
+def test_channel_and_global_limits():
+    limiter = RateLimiter()
+    func = limited(channel_rate=10, global_rate=5)
+    limiter.record(func, Identifier('Foo'), Identifier('#chan'), now=100)
+
+    limit = limiter.check(func, Identifier('Bar'), Identifier('#chan'), now=102)
+    assert limit.scope == GLOBAL
+    assert limit.target is None
+    limit = limiter.check(func, Identifier('Bar'), Identifier('#CHAN'), now=107)
+    assert limit.scope == CHANNEL
+    assert limiter.check(func, Identifier('Bar'), Identifier('#other'),
+                         now=107) is None
+    assert limiter.check(func, Identifier('Bar'), None, now=107) is None
+
+
+def test_expiry_and_introspection():
+    limiter = RateLimiter()
+    short, slow = limited(rate=5), limited(rate=50, channel_rate=20)
+    limiter.record(short, Identifier('Foo'), None, now=100)
+    limiter.record(slow, Identifier('Bar'), Identifier('#chan'), now=100)
+    limiter.record(limited(), Identifier('Baz'), None, now=100)
+
+    assert [(limit.func, limit.scope) for limit in limiter.limits(now=101)] == [
+        (short, USER), (slow, CHANNEL), (slow, USER)]
+    assert [limit.func for limit in limiter.limits('foo', now=101)] == [short]
+
+    assert [limit.scope for limit in limiter.limits(now=110)] == [CHANNEL, USER]
+    assert len(limiter._until) == 2
+    limiter.clear('#chan')
+    assert [limit.scope for limit in limiter.limits(now=110)] == [USER]
+    assert limiter.limits(now=150) == []
+    assert limiter._until == {}
+
+
+def test_max_entries():
+    limiter = RateLimiter(max_entries=3)
+    func = limited(rate=60)
+    for i in range(10):
+        limiter.record(func, Identifier('nick%d' % i), None, now=100 + i)
+    assert len(limiter._until) == 3
+    assert [limit.target for limit in limiter.limits(now=110)] == [
+        'nick7', 'nick8', 'nick9']
@@ -0,0 +1,59 @@
+# coding=utf-8
+"""Tests for the User and Channel state tracked by the bot."""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import pytest
+
+from sopel import module
+from sopel.tools import Identifier
+from sopel.tools.target import Channel, PrivilegesView, User
+
+
+def test_user_has_no_dict():
+    user = User(Identifier('Embolalia'), 'embo', 'example.com')
+    assert user.hostmask == 'Embolalia!embo@example.com'
+    with pytest.raises(AttributeError):
+        user.color = 'purple'
+
+
+def test_channel_users():
+    channel = Channel(Identifier('#Sopel'))
+    nick = Identifier('Embolalia')
+    # NAMES may give privileges before WHO gives the user
+    channel.privileges[nick] = module.OP
+    user = User(nick, 'embo', 'example.com')
+    channel.add_user(user)
+    assert channel.users[Identifier('embolalia')] is user
+    assert channel.privileges[nick] == module.OP
+    assert user.channels[Identifier('#sopel')] is channel
+
+    channel.rename_user(nick, Identifier('Embo'))
+    assert channel.privileges == {Identifier('Embo'): module.OP}
+    assert list(channel.users) == ['Embo']
+
+    channel.clear_user(Identifier('Embo'))
+    assert channel.privileges == {}
+    assert channel.users == {}
+    assert user.channels == {}
+
+
+def test_privileges_view():
+    channels = {}
+    privileges = PrivilegesView(channels)
+    channel = Channel(Identifier('#Sopel'))
+    channels[channel.name] = channel
+    channel.add_user(User(Identifier('Embolalia'), 'embo', 'example.com'))
+
+    name = Identifier('#sopel')
+    assert name in privileges
+    assert privileges[name] is channel.privileges
+    assert privileges[name][Identifier('embolalia')] == 0
+    # Changes made through it are made to the channel
+    privileges[name][Identifier('Embolalia')] = module.VOICE
+    assert channel.privileges[Identifier('Embolalia')] == module.VOICE
+    assert list(privileges) == [name]
+
+    del channels[channel.name]
+    assert len(privileges) == 0
+    with pytest.raises(KeyError):
+        privileges[name]
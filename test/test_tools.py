@@ -0,0 +1,68 @@
+# coding=utf-8
+"""Tests for sopel.tools"""
+from __future__ import unicode_literals, absolute_import, print_function, division
+
+import pytest
+
+from sopel.tools import Identifier
+
+
+@pytest.fixture
+def casemapping():
+    yield Identifier.set_casemapping
+    Identifier.set_casemapping('rfc1459')
+
+
+def test_identifier_rfc1459():
+    assert Identifier('Foo[]\\~') == 'foo{}|^'
+    assert Identifier('Foo[]\\~').lower() == 'foo[]\\~'
+    assert hash(Identifier('FOO{')) == hash(Identifier('foo['))
+    assert Identifier('Foo') != 'Bar'
+
+
+def test_identifier_is_interned():
+    name = 'SomeNick'
+    first = Identifier(name)
+    assert Identifier(name) is first
+    assert Identifier(first) is first
+    assert Identifier('somenick') is not first
+    assert Identifier('somenick') == first
+    assert str(Identifier('somenick')) == 'somenick'
+
+
+def test_identifier_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(Identifier, 'cache_size', 10)
+    for i in range(25):
+        Identifier('nick%d' % i)
+    assert len(Identifier._cache) <= 10
+
+
+def test_identifier_casemapping(casemapping):
+    casemapping('ascii')
+    assert Identifier('Foo[') != 'foo{'
+    assert Identifier('Foo[') == 'foo['
+
+    casemapping('strict-rfc1459')
+    assert Identifier('Foo[') == 'foo{'
+    assert Identifier('Foo^') != 'foo~'
+
+    casemapping('RFC1459')
+    assert Identifier.casemapping == 'rfc1459'
+    assert Identifier('Foo^') == 'foo~'
+
+    with pytest.raises(ValueError):
+        casemapping('unicode-magic')
+    assert Identifier.casemapping == 'rfc1459'
+
+
+def test_identifier_refold(casemapping):
+    nick = Identifier('Foo[')
+    other = Identifier('foo{')
+    plain = Identifier('Foo')
+    assert casemapping('ascii')
+    assert not casemapping('ascii')
+    # They still compare as they did when they were created
+    assert nick == other
+    assert nick.refold() != other.refold()
+    assert nick.refold() == Identifier('foo[')
+    assert plain.refold() is plain
@@ -6,8 +6,9 @@ import re
 import pytest
 import datetime
 
+import sopel.irc
 from sopel.test_tools import MockConfig
-from sopel.trigger import PreTrigger, Trigger
+from sopel.trigger import PreTrigger, Trigger, parse_line, unescape_tag_value
 from sopel.tools import Identifier
 
 
@@ -243,3 +244,73 @@ def test_ircv3_server_time_trigger(nick):
     line = '@time=2016-01-09T04:20 :Foo!foo@example.com PRIVMSG #Sopel :Hello, world'
     pretrigger = PreTrigger(nick, line)
     assert pretrigger.time is not None
+
+
+def test_parse_line():
+    line = sopel.irc.parse_line(
+        '@a=1;b :Foo!foo@example.com PRIVMSG #Sopel :Hello, world\r\n')
+    assert line.line == '@a=1;b :Foo!foo@example.com PRIVMSG #Sopel :Hello, world'
+    assert line.raw_tags == 'a=1;b'
+    assert line.tags == {'a': '1', 'b': None}
+    assert line.hostmask == 'Foo!foo@example.com'
+    assert line.command == 'PRIVMSG'
+    assert line.params == ['#Sopel', 'Hello, world']
+    assert line.time is None
+
+
+def test_parse_line_spaces():
+    line = parse_line(':irc.example.net  MODE   #Sopel +o  Foo ')
+    assert line.command == 'MODE'
+    assert line.params == ['#Sopel', '+o', 'Foo']
+
+    line = parse_line('PING :')
+    assert line.command == 'PING'
+    assert line.params == ['']
+
+    line = parse_line('@a=1')
+    assert line.tags == {'a': '1'}
+    assert line.command == ''
+    assert line.params == []
+
+
+def test_unescape_tag_value():
+    assert unescape_tag_value('plain') == 'plain'
+    assert unescape_tag_value(r'a\sb\:c\\d\re\nf') == 'a b;c\\d\re\nf'
+    assert unescape_tag_value(r'\b\ad') == 'bad'
+    assert unescape_tag_value('trailing\\') == 'trailing'
+
+
+def test_escaped_tags_pretrigger(nick):
+    line = r'@msg=hi\sthere\:\\;key= :Foo!foo@example.com PRIVMSG #Sopel :x'
+    pretrigger = PreTrigger(nick, line)
+    assert pretrigger.tags == {'msg': 'hi there;\\', 'key': ''}
+
+
+def test_server_time_pretrigger(nick):
+    line = '@time=2016-01-09T03:15:42.123Z :Foo!foo@example.com PRIVMSG #Sopel :x'
+    pretrigger = PreTrigger(nick, line)
+    assert pretrigger.time == datetime.datetime(2016, 1, 9, 3, 15, 42, 123000)
+
+    line = '@time=2016-13-09T03:15:42.123Z :Foo!foo@example.com PRIVMSG #Sopel :x'
+    before = datetime.datetime.utcnow()
+    pretrigger = PreTrigger(nick, line)
+    assert before - datetime.timedelta(seconds=1) <= pretrigger.time
+    assert pretrigger.time <= datetime.datetime.utcnow()
+
+
+def test_triggers_share_line_data(nick):
+    line = ':Foo!foo@example.com PRIVMSG #Sopel :Hello, world'
+    pretrigger = PreTrigger(nick, line)
+    config = MockConfig()
+    config.core.owner = 'Foo'
+
+    first = Trigger(config, pretrigger, re.match('Hello', 'Hello'))
+    assert first.owner is True
+    config.core.owner = 'Bar'
+    second = Trigger(config, pretrigger, re.match('.*', 'Hello, world'))
+    assert second.group() == 'Hello, world'
+    assert second.owner is True  # Worked out once for the line
+
+    other = PreTrigger(nick, line)
+    assert Trigger(config, other, None).owner is False
+    assert Trigger(config, pretrigger, None, account='foo').account == 'foo'